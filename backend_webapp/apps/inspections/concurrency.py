@@ -0,0 +1,165 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from rest_framework.views import APIView
+from backend_webapp.middleware import compress_response
+
+# Ejecución asíncrona de las vistas de datos.
+#
+# Las vistas asíncronas no bloquean el bucle de eventos: las lecturas de S3 (boto3 es síncrono)
+# van a un pool de hilos de E/S y el cálculo con pandas a un pool de CPU acotado, así que muchas
+# peticiones esperando a S3 no dejan sin hilos a las que calculan, ni al revés. Las peticiones
+# idénticas que llegan mientras otra igual está en curso esperan su resultado en lugar de
+# repetir el cálculo; si la respuesta sale bien, comparten también su renderizado y su compresión.
+
+io_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ASYNC_IO_WORKERS', 32),
+                                 thread_name_prefix='inspections-io')
+cpu_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ASYNC_CPU_WORKERS', 4),
+                                  thread_name_prefix='inspections-cpu')
+
+
+async def run_io(function, *args):
+    """Ejecuta una función bloqueante de E/S (S3) en el pool de E/S."""
+    return await asyncio.get_running_loop().run_in_executor(io_executor, function, *args)
+
+
+async def run_cpu(function, *args):
+    """Ejecuta una función con cálculo intensivo (pandas) en el pool de CPU acotado."""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, function, *args)
+
+
+class RequestCoalescer:
+    """
+    Agrupa las peticiones idénticas en curso: la primera lanza el cálculo y las demás esperan
+    su resultado (o su excepción). El cálculo corre como una tarea propia, así que si el cliente
+    que lo inició se desconecta, los demás lo siguen recibiendo.
+
+    Solo agrupa lo que está en curso; no es una caché. Los resultados se comparten entre
+    peticiones y no deben modificarse.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._stats = {'computations': 0, 'coalesced': 0}
+
+    async def run(self, key, function):
+        """
+        Devuelve el resultado de `await function()`, compartido con las peticiones en curso con la misma clave.
+
+        Args:
+            key (hashable): Identifica el cálculo (vista y parámetros).
+            function (callable): Función asíncrona sin argumentos que hace el cálculo.
+
+        Returns:
+            El resultado del cálculo.
+        """
+        loop = asyncio.get_running_loop()
+        # Las tareas pertenecen a un bucle de eventos; cada bucle agrupa sus propias peticiones
+        key = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                task = loop.create_task(function())
+                self._tasks[key] = task
+                task.add_done_callback(lambda _: self._discard(key, task))
+                self._stats['computations'] += 1
+            else:
+                self._stats['coalesced'] += 1
+        return await asyncio.shield(task)
+
+    def _discard(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        # La excepción ya se entregó a quien esperaba; se marca como leída por si nadie quedó esperando
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Cálculos lanzados, peticiones agrupadas con otra en curso y cálculos en curso.
+        """
+        with self._lock:
+            return {**self._stats, 'in_flight': len(self._tasks)}
+
+
+coalescer = RequestCoalescer()
+render_coalescer = RequestCoalescer()
+
+# Cabeceras que el renderizado y la compresión fijan en la respuesta compartida
+SHARED_HEADERS = ('Content-Type', 'Content-Encoding', 'Content-Length', 'Vary', 'ETag')
+COMPRESS_RESPONSES = 'backend_webapp.middleware.CompressionMiddleware' in settings.MIDDLEWARE
+
+
+def request_key(request, *extra):
+    """
+    Clave de agrupación de una petición: ruta y parámetros, sin el formato de salida (cada
+    petición renderiza su respuesta) ni el orden de los parámetros.
+    """
+    params = tuple(sorted((name, tuple(values)) for name, values in request.query_params.lists() if name != 'format'))
+    return (request.path, params) + extra
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView con manejadores asíncronos (async def get/post).
+
+    La negociación, las excepciones y la finalización son las de DRF; la respuesta se renderiza
+    en el pool de CPU. Estas vistas sirven datos públicos de solo lectura y no usan autenticación,
+    así que el preprocesado de DRF no consulta la base de datos desde el bucle de eventos.
+    """
+    authentication_classes = ()
+    render_key = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+            handler = getattr(self, request.method.lower(), None) \
+                if request.method.lower() in self.http_method_names else None
+            if handler is None:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        if hasattr(self.response, 'render') and not self.response.is_rendered:
+            await self.render_response(request, self.response)
+        return self.response
+
+    async def coalesce(self, key, function):
+        """
+        Agrupa un cálculo con las peticiones idénticas en curso (ver RequestCoalescer). La
+        respuesta construida con su resultado también se renderiza y comprime una sola vez por
+        formato y Accept-Encoding, así que debe depender solo de `key` y del resultado.
+        """
+        self.render_key = key
+        return await coalescer.run(key, function)
+
+    async def render_response(self, request, response):
+        if self.render_key is None or response.status_code != 200:
+            await run_cpu(response.render)
+            return
+
+        def render():
+            response.render()
+            return compress_response(request, response) if COMPRESS_RESPONSES else response
+
+        key = (self.render_key, response.accepted_media_type, request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        shared = await render_coalescer.run(key, lambda: run_cpu(render))
+        if shared is not response:
+            response.content = shared.content
+            for header in SHARED_HEADERS:
+                if header in shared:
+                    response[header] = shared[header]
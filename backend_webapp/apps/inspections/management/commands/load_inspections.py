@@ -0,0 +1,74 @@
+import os
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apps.inspections.models import Inspection
+import almacenamiento
+from apps.inspections.utils import get_s3_client, load_current_pointer
+
+# Columnas del conjunto limpio que difieren del nombre del campo en el modelo
+COLUMN_TO_FIELD = {'license_': 'license'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia el conjunto actual (datos_actuales) a la tabla de inspecciones con upserts por lotes. "
+        "Se procesa una partición año-mes a la vez para acotar la memoria."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bucket', default=os.getenv('S3_BUCKET_NAME'), help="Bucket de S3.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Filas por sentencia de upsert.")
+        parser.add_argument('--partition', action='append', dest='partitions', metavar='YYYY-MM',
+                            help="Cargar solo esta partición (repetible).")
+        parser.add_argument('--rewritten', action='store_true',
+                            help="Cargar solo las particiones reescritas por la última compactación.")
+
+    def handle(self, *args, **options):
+        if not options['bucket']:
+            raise CommandError("Falta el bucket: usa --bucket o S3_BUCKET_NAME.")
+
+        s3 = get_s3_client()
+        pointer = load_current_pointer(options['bucket'], s3)
+        partitions = pointer['particiones']
+        selected = options['partitions'] or (pointer.get('particiones_reescritas') if options['rewritten'] else None)
+        if selected is not None:
+            partitions = {p: key for p, key in partitions.items() if p in set(selected)}
+
+        fields = [field.name for field in Inspection._meta.concrete_fields if not field.primary_key]
+        update_fields = [name for name in fields if name != 'inspection_id']
+        total = 0
+        for partition, key in partitions.items():
+            data = almacenamiento.leer_objeto(s3, options['bucket'], key).rename(columns=COLUMN_TO_FIELD)
+            rows = self.to_instances(data, fields)
+            with transaction.atomic():
+                Inspection.objects.bulk_create(
+                    rows,
+                    batch_size=options['batch_size'],
+                    update_conflicts=True,
+                    unique_fields=['inspection_id'],
+                    update_fields=update_fields,
+                )
+            total += len(rows)
+            self.stdout.write(f"{partition}: {len(rows)} inspecciones")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Versión {pointer['version']}: {total} inspecciones cargadas de {len(partitions)} particiones."
+        ))
+
+    @staticmethod
+    def to_instances(data, fields):
+        """
+        Convierte un DataFrame del conjunto limpio en instancias de Inspection sin guardar.
+
+        Args:
+            data (pd.DataFrame): Filas de una partición, con nombres de columna del modelo.
+            fields (list): Campos del modelo a poblar.
+
+        Returns:
+            list[Inspection]: Una instancia por fila.
+        """
+        data = data.reindex(columns=fields)
+        data['inspection_date'] = pd.to_datetime(data['inspection_date']).dt.date
+        data = data.astype(object).where(data.notna(), None)
+        return [Inspection(**dict(zip(fields, row))) for row in data.itertuples(index=False, name=None)]
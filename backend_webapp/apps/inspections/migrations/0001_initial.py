@@ -0,0 +1,39 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Inspection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inspection_id', models.IntegerField(unique=True)),
+                ('dba_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('aka_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('license', models.CharField(blank=True, max_length=50, null=True)),
+                ('facility_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('risk', models.CharField(blank=True, max_length=50, null=True)),
+                ('address', models.CharField(blank=True, max_length=255, null=True)),
+                ('city', models.CharField(blank=True, max_length=100, null=True)),
+                ('state', models.CharField(blank=True, max_length=50, null=True)),
+                ('zip', models.CharField(blank=True, max_length=10, null=True)),
+                ('inspection_date', models.DateField(blank=True, null=True)),
+                ('inspection_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('results', models.CharField(blank=True, max_length=50, null=True)),
+                ('violations', models.TextField(blank=True, null=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['inspection_date', 'inspection_id'], name='inspection_date_id_idx'), models.Index(fields=['results', 'inspection_date'], name='inspection_results_date_idx'), models.Index(fields=['risk', 'inspection_date'], name='inspection_risk_date_idx'), models.Index(fields=['facility_type', 'inspection_date'], name='inspection_facility_date_idx'), models.Index(fields=['zip', 'inspection_date'], name='inspection_zip_date_idx')],
+            },
+        ),
+    ]
@@ -1,22 +1,33 @@
 from django.db import models
 
 class Inspection(models.Model):
-    inspection_id = models.IntegerField()
-    dba_name = models.CharField(max_length=255)
-    aka_name = models.CharField(max_length=255)
-    license = models.CharField(max_length=50)
-    facility_type = models.CharField(max_length=100)
-    risk = models.CharField(max_length=50)
-    address = models.CharField(max_length=255)
-    city = models.CharField(max_length=100)
-    state = models.CharField(max_length=50)
-    zip = models.CharField(max_length=10)
-    inspection_date = models.DateField()
-    inspection_type = models.CharField(max_length=50)
-    results = models.CharField(max_length=20)
-    violations = models.TextField()
-    latitude = models.FloatField()
-    longitude = models.FloatField()
+    inspection_id = models.IntegerField(unique=True)
+    dba_name = models.CharField(max_length=255, null=True, blank=True)
+    aka_name = models.CharField(max_length=255, null=True, blank=True)
+    license = models.CharField(max_length=50, null=True, blank=True)
+    facility_type = models.CharField(max_length=100, null=True, blank=True)
+    risk = models.CharField(max_length=50, null=True, blank=True)
+    address = models.CharField(max_length=255, null=True, blank=True)
+    city = models.CharField(max_length=100, null=True, blank=True)
+    state = models.CharField(max_length=50, null=True, blank=True)
+    zip = models.CharField(max_length=10, null=True, blank=True)
+    inspection_date = models.DateField(null=True, blank=True)
+    inspection_type = models.CharField(max_length=100, null=True, blank=True)
+    results = models.CharField(max_length=50, null=True, blank=True)
+    violations = models.TextField(null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        # La paginación por cursor recorre (inspection_date, inspection_id); cada filtro de la API
+        # tiene un índice compuesto que termina en la fecha para servir rango y orden a la vez
+        indexes = [
+            models.Index(fields=['inspection_date', 'inspection_id'], name='inspection_date_id_idx'),
+            models.Index(fields=['results', 'inspection_date'], name='inspection_results_date_idx'),
+            models.Index(fields=['risk', 'inspection_date'], name='inspection_risk_date_idx'),
+            models.Index(fields=['facility_type', 'inspection_date'], name='inspection_facility_date_idx'),
+            models.Index(fields=['zip', 'inspection_date'], name='inspection_zip_date_idx'),
+        ]
 
     def __str__(self):
-        return self.dba_name
+        return self.dba_name or str(self.inspection_id)
@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class InspectionCursorPagination(CursorPagination):
+    # El cursor evita el OFFSET: cada página es una búsqueda por índice desde la anterior
+    ordering = ('-inspection_date', '-inspection_id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
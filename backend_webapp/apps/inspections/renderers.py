@@ -0,0 +1,173 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el codificador JSON estándar
+    orjson = None
+
+# Renderers para los endpoints con tablas grandes (ubicaciones, celdas, listas de inspecciones).
+#
+# Las vistas pueden devolver DataFrames dentro de la respuesta; cada renderer los codifica
+# directamente, sin pasar por una lista de diccionarios de Python:
+#   application/json                            -> registros (formato histórico), ?format=json
+#   application/vnd.inspections.columns+json    -> un array por columna, ?format=columns
+#   application/vnd.apache.arrow.stream         -> Arrow IPC, ?format=arrow
+
+
+def _dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, cls=JSONEncoder, allow_nan=False).encode('utf-8')
+
+
+def _float32_decimals(values):
+    """
+    Pasa un array float32 a float64 con el decimal más corto que vuelve al mismo float32, como
+    lo escribe el origen (41.8781 y no 41.87810134887695, que es su valor exacto en float64).
+    """
+    result = values.astype('float64')
+    pending = np.flatnonzero(np.isfinite(result))
+    for decimals in range(10):
+        if not len(pending):
+            break
+        rounded = np.round(result[pending], decimals)
+        exact = rounded.astype('float32') == values[pending]
+        result[pending[exact]] = rounded[exact]
+        pending = pending[~exact]
+    return result
+
+
+def _round_float32(df):
+    columns = {name: _float32_decimals(series.to_numpy(dtype='float32', na_value=np.nan))
+               for name, series in df.items() if series.dtype == 'float32'}
+    return df.assign(**columns) if columns else df
+
+
+def _records(df):
+    # El codificador de pandas escribe los registros en C; NaN y NaT salen como null
+    return _round_float32(df).to_json(orient='records', date_format='iso', date_unit='s').encode('utf-8')
+
+
+def _columns(value):
+    """
+    Convierte una tabla (DataFrame o lista de diccionarios) en un diccionario de arrays.
+    Las fechas se codifican como texto YYYY-MM-DD y los nulos como null.
+    """
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return {key: [row.get(key) for row in value] for key in value[0]}
+    if not isinstance(value, pd.DataFrame):
+        return value
+    columns = {}
+    for name, series in _round_float32(value).items():
+        if pd.api.types.is_datetime64_any_dtype(series):
+            dates = np.datetime_as_string(series.to_numpy(dtype='datetime64[D]'), unit='D')
+            columns[name] = np.where(series.isna().to_numpy(), None, dates).tolist()
+        elif pd.api.types.is_float_dtype(series) and orjson is not None:
+            columns[name] = series.to_numpy(dtype='float64')
+        else:
+            columns[name] = series.astype(object).where(series.notna(), None).tolist()
+    return columns
+
+
+def _json_with_frames(data, encode_frame):
+    """
+    Codifica un diccionario cuyo primer nivel puede contener DataFrames; cada DataFrame se
+    codifica con `encode_frame` y se inserta en el JSON ya serializado.
+    """
+    if not isinstance(data, dict) or not any(isinstance(v, pd.DataFrame) for v in data.values()):
+        return _dumps(data)
+    parts = [_dumps(str(key)) + b':' + (encode_frame(value) if isinstance(value, pd.DataFrame) else _dumps(value))
+             for key, value in data.items()]
+    return b'{' + b','.join(parts) + b'}'
+
+
+class FastJSONRenderer(BaseRenderer):
+    """
+    JSON en el formato de siempre (tablas como lista de registros), codificado con orjson.
+    """
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return _json_with_frames(data, _records)
+
+
+class ColumnarJSONRenderer(BaseRenderer):
+    """
+    JSON orientado a columnas: cada tabla se envía como {"columna": [valores]}.
+    """
+    media_type = 'application/vnd.inspections.columns+json'
+    format = 'columns'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = {key: (_columns(value) if isinstance(value, (pd.DataFrame, list)) else value)
+                    for key, value in data.items()}
+        return _dumps(data)
+
+
+class ArrowRenderer(BaseRenderer):
+    """
+    Arrow IPC (stream). La primera tabla de la respuesta se envía como record batch, con
+    latitud y longitud en float32 y las fechas como date32 (días desde 1970-01-01); el resto
+    de la respuesta va como JSON en los metadatos del esquema, bajo la clave "payload".
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        table_key, table = None, pd.DataFrame()
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if isinstance(value, pd.DataFrame) or (isinstance(value, list) and value and isinstance(value[0], dict)):
+                    table_key, table = key, value if isinstance(value, pd.DataFrame) else pd.DataFrame(value)
+                    break
+                if key == 'cells' and isinstance(value, dict):
+                    table_key, table = key, pd.DataFrame(value)
+                    break
+
+        arrow_table = self.to_arrow(table)
+        payload = {key: value for key, value in data.items() if key != table_key} if isinstance(data, dict) else data
+        arrow_table = arrow_table.replace_schema_metadata({
+            b'payload': _dumps(payload),
+            b'table': (table_key or '').encode('utf-8'),
+        })
+
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+        return sink.getvalue()
+
+    @staticmethod
+    def to_arrow(table):
+        """
+        Convierte la tabla a Arrow reduciendo tipos: coordenadas a float32 y fechas a date32.
+        """
+        arrays = []
+        for name, series in table.items():
+            if name in ('latitude', 'longitude'):
+                values = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float32', na_value=np.nan)
+                arrays.append(pa.array(values, from_pandas=True))
+            elif pd.api.types.is_datetime64_any_dtype(series):
+                arrays.append(pa.array(series.to_numpy(dtype='datetime64[D]'), type=pa.date32(), from_pandas=True))
+            else:
+                arrays.append(pa.array(series, from_pandas=True))
+        return pa.Table.from_arrays(arrays, names=[str(name) for name in table.columns])
+
+
+TABLE_RENDERERS = [FastJSONRenderer, ColumnarJSONRenderer, ArrowRenderer]
@@ -0,0 +1,140 @@
+import io
+import json
+import joblib
+import pandas as pd
+from botocore.exceptions import ClientError
+from django.utils import timezone
+
+# Módulo de características compartido con el pipeline (ver SCRIPTS_DIR en settings)
+import caracteristicas
+
+from .utils import CURRENT_POINTER_KEY, dataset_cache, get_object_etag, get_s3_client, load_current_dataset
+
+# Puntuación en línea con el modelo vigente.
+#
+# El modelo y el codificador se cargan una vez por proceso y se guardan en la caché de conjuntos,
+# revalidados contra el ETag de modelos/ACTUAL.json: un modelo nuevo se carga en la primera
+# petición después de publicarse, sin reiniciar el servidor.
+
+MODEL_POINTER_KEY = 'modelos/ACTUAL.json'
+ESTABLISHMENT_COLUMNS = ['license_', 'dba_name', 'facility_type', 'risk', 'latitude', 'longitude', 'inspection_date']
+FEATURE_FIELDS = ['facility_type', 'risk', 'latitude', 'longitude']
+
+
+class ModelUnavailable(Exception):
+    """No hay un modelo publicado en el bucket."""
+
+
+def get_model(bucket_name):
+    """
+    Devuelve el modelo vigente con su codificador, cargado una vez por proceso.
+
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+
+    Returns:
+        dict: {"version", "modelo", "codificador"}.
+    """
+    def etag():
+        try:
+            return get_object_etag(bucket_name, MODEL_POINTER_KEY)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                raise ModelUnavailable("Aún no hay un modelo entrenado.")
+            raise
+
+    def loader():
+        s3 = get_s3_client()
+        try:
+            pointer = json.loads(s3.get_object(Bucket=bucket_name, Key=MODEL_POINTER_KEY)['Body'].read())
+            artifact = joblib.load(io.BytesIO(s3.get_object(Bucket=bucket_name, Key=pointer['clave'])['Body'].read()))
+        except Exception as e:
+            raise Exception(f"Error al cargar el modelo desde S3: {str(e)}")
+        return {
+            'version': pointer['version'],
+            'modelo': artifact['modelo'],
+            'codificador': caracteristicas.CodificadorCaracteristicas.desde_dict(artifact['codificador']),
+        }
+
+    return dataset_cache.get(('model', bucket_name), etag, loader)
+
+
+def get_establishments(bucket_name):
+    """
+    Devuelve la última inspección conocida de cada licencia, indexada por licencia.
+
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+
+    Returns:
+        pd.DataFrame: Una fila por licencia con nombre, tipo, riesgo y coordenadas.
+    """
+    def loader():
+        data = load_current_dataset(bucket_name, columns=ESTABLISHMENT_COLUMNS).dropna(subset=['license_'])
+        data = data.sort_values('inspection_date', kind='stable').drop_duplicates('license_', keep='last')
+        return data.set_index(data['license_'].astype(str))
+
+    return dataset_cache.get(
+        ('establishments', bucket_name),
+        lambda: get_object_etag(bucket_name, CURRENT_POINTER_KEY),
+        loader,
+    )
+
+
+def score_establishments(bucket_name, items, date=None):
+    """
+    Calcula la probabilidad de reprobar una inspección en `date` para cada establecimiento.
+
+    Cada elemento puede traer `license` (se completan los datos con su última inspección) y/o
+    los campos facility_type, risk, latitude y longitude, que tienen prioridad.
+
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+        items (list[dict]): Establecimientos a puntuar.
+        date (date, optional): Fecha de la inspección hipotética; por defecto hoy.
+
+    Returns:
+        tuple[str, list[dict]]: Versión del modelo y un resultado por elemento, en el mismo orden.
+    """
+    model = get_model(bucket_name)
+    date = pd.Timestamp(date or timezone.localdate())
+    establishments = None
+
+    rows, results = [], []
+    for item in items:
+        license_number = str(item['license']) if item.get('license') not in (None, '') else None
+        row = {'license': license_number, 'dba_name': item.get('dba_name')}
+        if license_number is not None:
+            if establishments is None:
+                establishments = get_establishments(bucket_name)
+            if license_number in establishments.index:
+                known = establishments.loc[license_number]
+                row.update({field: known[field] for field in FEATURE_FIELDS})
+                row['dba_name'] = row['dba_name'] or known['dba_name']
+            elif not all(item.get(field) is not None for field in FEATURE_FIELDS):
+                results.append({'license': license_number, 'error': "Licencia sin inspecciones conocidas."})
+                continue
+        row.update({field: item[field] for field in FEATURE_FIELDS if item.get(field) is not None})
+
+        missing = [field for field in FEATURE_FIELDS if row.get(field) is None or pd.isna(row.get(field))]
+        if missing:
+            results.append({'license': license_number, 'error': f"Faltan datos del establecimiento: {', '.join(missing)}"})
+            continue
+        try:
+            row['latitude'], row['longitude'] = float(row['latitude']), float(row['longitude'])
+        except (TypeError, ValueError):
+            results.append({'license': license_number, 'error': "latitude y longitude deben ser numéricos."})
+            continue
+        results.append(row)
+        rows.append(row)
+
+    if rows:
+        frame = pd.DataFrame(rows)
+        frame['inspection_date'] = date
+        frame['results'] = 'Pass'  # Marcador: el resultado no forma parte de las características
+        matrix, _ = model['codificador'].transformar(caracteristicas.preparar(frame))
+        probabilities = model['modelo'].predict_proba(matrix)[:, 1]
+        for row, probability in zip(rows, probabilities):
+            row['probability_fail'] = round(float(probability), 6)
+
+    return model['version'], results
@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+
+# Agregación espacial de inspecciones en el servidor.
+#
+# Las coordenadas se proyectan una sola vez por versión del conjunto a Web Mercator normalizado
+# ([0, 1) en x e y, como las teselas de los mapas web). Con eso, agrupar en celdas para cualquier
+# zoom es un floor y un bincount sobre arrays de NumPy, sin recorrer filas en Python.
+
+# Celdas por lado de cada tesela de 256 px: a zoom z la cuadrícula tiene 2**z * CELLS_PER_TILE celdas por lado
+CELLS_PER_TILE = 32
+MAX_ZOOM = 18
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def project(latitude, longitude):
+    """
+    Proyecta coordenadas geográficas a Web Mercator normalizado.
+
+    Args:
+        latitude, longitude (np.ndarray): Coordenadas en grados.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: x, y en [0, 1); y crece hacia el sur.
+    """
+    lat = np.radians(np.clip(latitude, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = (np.asarray(longitude) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return x, y
+
+
+def unproject(x, y):
+    """
+    Inversa de `project`.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: latitud y longitud en grados.
+    """
+    longitude = np.asarray(x) * 360.0 - 180.0
+    latitude = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(y)))))
+    return latitude, longitude
+
+
+def prepare_points(data):
+    """
+    Prepara los arrays que usan las agregaciones: coordenadas proyectadas, resultado y fecha.
+    Las filas sin coordenadas quedan con x, y nulos y solo cuentan en la agregación por ZIP.
+
+    El ZIP es el del polígono en el que caen las coordenadas (location_zip) y, si no lo hay, el
+    declarado en la inspección. Las particiones anteriores a las zonas no tienen location_zip.
+
+    Args:
+        data (pd.DataFrame): Columnas latitude, longitude, results, zip, location_zip (opcional)
+            e inspection_date.
+
+    Returns:
+        pd.DataFrame: x, y, passed, failed, zip (5 dígitos) e inspection_date.
+    """
+    latitude = data['latitude'].to_numpy(dtype='float64')
+    longitude = data['longitude'].to_numpy(dtype='float64')
+    x, y = project(latitude, longitude)
+    results = data['results'].astype('string')
+    zips = data['zip'].astype('string').str.extract(r'(\d{5})', expand=False)
+    if 'location_zip' in data.columns:
+        zips = data['location_zip'].astype('string').fillna(zips)
+    return pd.DataFrame({
+        'x': x,
+        'y': y,
+        'passed': (results == 'Pass').fillna(False).to_numpy(dtype=bool),
+        'failed': (results == 'Fail').fillna(False).to_numpy(dtype=bool),
+        'zip': zips.to_numpy(),
+        'inspection_date': pd.to_datetime(data['inspection_date']).to_numpy(),
+    })
+
+
+def filter_dates(points, start=None, end=None):
+    """
+    Filtra los puntos por rango de fechas de inspección (inclusivo).
+    """
+    mask = np.ones(len(points), dtype=bool)
+    dates = points['inspection_date'].to_numpy()
+    if start is not None:
+        mask &= dates >= np.datetime64(pd.Timestamp(start))
+    if end is not None:
+        mask &= dates <= np.datetime64(pd.Timestamp(end))
+    return points[mask] if not mask.all() else points
+
+
+def _rates(counts, passed, failed):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (np.round(passed / counts, 4), np.round(failed / counts, 4))
+
+
+def grid_bins(points, bbox, zoom):
+    """
+    Agrupa los puntos dentro de un bounding box en celdas de una cuadrícula Web Mercator.
+
+    Args:
+        points (pd.DataFrame): Salida de `prepare_points`.
+        bbox (tuple): (min_lon, min_lat, max_lon, max_lat).
+        zoom (int): Nivel de zoom del mapa (0-MAX_ZOOM).
+
+    Returns:
+        dict: Arrays paralelos (formato columnar) con el centro de cada celda no vacía,
+        su número de inspecciones y sus tasas de aprobación y reprobación.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    x0, y1 = project(np.array([min_lat]), np.array([min_lon]))
+    x1, y0 = project(np.array([max_lat]), np.array([max_lon]))
+    x = points['x'].to_numpy()
+    y = points['y'].to_numpy()
+    inside = (x >= x0[0]) & (x <= x1[0]) & (y >= y0[0]) & (y <= y1[0])
+
+    cells_per_side = (2 ** zoom) * CELLS_PER_TILE
+    col = np.minimum((x[inside] * cells_per_side).astype(np.int64), cells_per_side - 1)
+    row = np.minimum((y[inside] * cells_per_side).astype(np.int64), cells_per_side - 1)
+    cell_ids, inverse = np.unique(row * cells_per_side + col, return_inverse=True)
+
+    counts = np.bincount(inverse, minlength=len(cell_ids))
+    passed = np.bincount(inverse, weights=points['passed'].to_numpy()[inside], minlength=len(cell_ids))
+    failed = np.bincount(inverse, weights=points['failed'].to_numpy()[inside], minlength=len(cell_ids))
+    pass_rate, fail_rate = _rates(counts, passed, failed)
+    lat, lon = unproject((cell_ids % cells_per_side + 0.5) / cells_per_side,
+                         (cell_ids // cells_per_side + 0.5) / cells_per_side)
+
+    return {
+        'zoom': zoom,
+        'cells_per_side': cells_per_side,
+        'total': int(inside.sum()),
+        'cells': {
+            'latitude': np.round(lat, 6).tolist(),
+            'longitude': np.round(lon, 6).tolist(),
+            'count': counts.tolist(),
+            'pass_rate': pass_rate.tolist(),
+            'fail_rate': fail_rate.tolist(),
+        },
+    }
+
+
+def zip_counts(points):
+    """
+    Cuenta las inspecciones por código postal. Las claves coinciden con la propiedad ZIP de
+    la topología de códigos postales que dibuja el mapa (webapp/public/utils/chicago.json):
+    cada inspección cuenta en el polígono de sus coordenadas, no en el zip declarado, salvo
+    que no caiga en ninguno (ver `prepare_points`).
+
+    Args:
+        points (pd.DataFrame): Salida de `prepare_points`.
+
+    Returns:
+        dict: {ZIP: {"count", "pass_rate", "fail_rate"}}.
+    """
+    points = points.dropna(subset=['zip'])
+    zips, inverse = np.unique(points['zip'].to_numpy(dtype=str), return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(zips))
+    passed = np.bincount(inverse, weights=points['passed'].to_numpy(), minlength=len(zips))
+    failed = np.bincount(inverse, weights=points['failed'].to_numpy(), minlength=len(zips))
+    pass_rate, fail_rate = _rates(counts, passed, failed)
+    return {
+        str(z): {'count': int(c), 'pass_rate': float(p), 'fail_rate': float(f)}
+        for z, c, p, f in zip(zips, counts, pass_rate, fail_rate)
+    }
+
+
+def frames_payload(frames, cells_per_side, period='week', start=None, end=None):
+    """
+    Arma los fotogramas del mapa para un rango de fechas, por día o agrupados por semana
+    (que empieza el lunes).
+
+    Args:
+        frames (pd.DataFrame): Fotogramas diarios ordenados por fecha (ver load_map_frames).
+        cells_per_side (int): Celdas por lado de la cuadrícula de los fotogramas.
+        period (str): 'day' o 'week'.
+        start, end (date, optional): Rango de fechas (inclusivo).
+
+    Returns:
+        list[dict]: Un fotograma por periodo con arrays paralelos de latitud, longitud,
+        número de inspecciones y tasa de reprobación de cada celda.
+    """
+    dates = frames['fecha'].to_numpy()
+    lo = np.searchsorted(dates, np.datetime64(pd.Timestamp(start))) if start is not None else 0
+    hi = np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), side='right') if end is not None else len(frames)
+    frames = frames.iloc[lo:hi]
+    if period == 'week':
+        frames = (frames.assign(fecha=frames['fecha'] - pd.to_timedelta(frames['fecha'].dt.weekday, unit='D'))
+                  .groupby(['fecha', 'celda_x', 'celda_y'], as_index=False, sort=True)
+                  [['total', 'aprobadas', 'reprobadas']].sum())
+    if frames.empty:
+        return []
+
+    counts = frames['total'].to_numpy()
+    _, fail_rate = _rates(counts, frames['aprobadas'].to_numpy(), frames['reprobadas'].to_numpy())
+    lat, lon = unproject((frames['celda_x'].to_numpy() + 0.5) / cells_per_side,
+                         (frames['celda_y'].to_numpy() + 0.5) / cells_per_side)
+    lat, lon = np.round(lat, 6), np.round(lon, 6)
+
+    period_dates, bounds = np.unique(frames['fecha'].to_numpy(), return_index=True)
+    bounds = list(bounds) + [len(frames)]
+    return [
+        {
+            'date': str(pd.Timestamp(date).date()),
+            'latitude': lat[a:b].tolist(),
+            'longitude': lon[a:b].tolist(),
+            'count': counts[a:b].tolist(),
+            'fail_rate': fail_rate[a:b].tolist(),
+        }
+        for date, a, b in zip(period_dates, bounds[:-1], bounds[1:])
+    ]
@@ -1,6 +1,13 @@
 from django.urls import path
-from .views import KPIs
+from .views import KPIs, CacheStats, InspectionList, SpatialGrid, SpatialZips, MapFrames, Scores, EstablishmentHistory
 
 urlpatterns = [
     path('kpis/', KPIs.as_view(), name='kpis'),
+    path('inspections/', InspectionList.as_view(), name='inspection-list'),
+    path('spatial/grid/', SpatialGrid.as_view(), name='spatial-grid'),
+    path('spatial/zips/', SpatialZips.as_view(), name='spatial-zips'),
+    path('map/frames/', MapFrames.as_view(), name='map-frames'),
+    path('scores/', Scores.as_view(), name='scores'),
+    path('establishments/<str:license>/history/', EstablishmentHistory.as_view(), name='establishment-history'),
+    path('cache-stats/', CacheStats.as_view(), name='cache-stats'),
 ]
@@ -1,34 +1,376 @@
+import time
+import threading
+from collections import OrderedDict
 import boto3
 import pandas as pd
 import os
-import pickle
-def load_file_from_s3(bucket_name, file_key):
+from django.conf import settings
+from .spatial import prepare_points
+
+# Capa de almacenamiento compartida con el pipeline (ver SCRIPTS_DIR en settings)
+import almacenamiento
+
+# Puntero a la versión vigente del conjunto compactado que publica el pipeline de limpieza
+CURRENT_POINTER_KEY = 'datos_actuales/ACTUAL.json'
+
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Devuelve el cliente de S3 del proceso, creándolo la primera vez con las
+    credenciales del entorno. Los clientes de boto3 son seguros entre hilos.
+
+    Returns:
+        botocore.client.S3: Cliente de S3.
     """
-    Carga un archivo CSV desde S3 y lo convierte en un DataFrame de pandas.
-    
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = boto3.client(
+                's3',
+                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+            )
+        return _s3_client
+
+
+def load_current_pointer(bucket_name, s3=None):
+    """
+    Lee el puntero a la versión vigente del conjunto compactado.
+
     Args:
         bucket_name (str): El nombre del bucket de S3.
-        file_key (str): La clave del archivo dentro del bucket.
+        s3 (optional): Cliente de S3 a reutilizar.
 
     Returns:
-        pd.DataFrame: El contenido del archivo como un DataFrame.
+        dict: Versión, particiones ({"YYYY-MM": clave}) y número de filas.
     """
-    # Crear el cliente de S3
-    s3 = boto3.client(
-        's3',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    )
-    
-    # Descargar el archivo desde S3
+    s3 = s3 or get_s3_client()
     try:
-        response = s3.get_object(Bucket=bucket_name, Key=file_key)
-        dat = response['Body'].read()
-        data = pickle.loads(dat)
+        pointer = almacenamiento.leer_json(s3, bucket_name, CURRENT_POINTER_KEY)
+    except Exception as e:
+        raise Exception(f"Error al cargar el puntero del conjunto actual: {str(e)}")
+    if pointer is None:
+        raise Exception(f"Error al cargar el puntero del conjunto actual: no existe {CURRENT_POINTER_KEY}")
+    return pointer
+
+
+def load_current_dataset(bucket_name, columns=None, filters=None, start=None, end=None):
+    """
+    Carga la versión vigente del conjunto compactado (una fila por inspection_id) con el
+    lector de particiones del pipeline. Las particiones fuera del rango [start, end] no se descargan.
+
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+        columns (list, optional): Columnas a leer; por defecto todas.
+        filters (list, optional): Filtros en formato pyarrow que se aplican al leer.
+        start, end (str | datetime, optional): Rango de fechas de inspección.
 
-        # Leer el contenido del archivo directamente como un DataFrame
-        return data
+    Returns:
+        pd.DataFrame: El conjunto actual.
+    """
+    s3 = get_s3_client()
+    pointer = load_current_pointer(bucket_name, s3)
+    try:
+        return almacenamiento.leer_particiones(s3, bucket_name, pointer['particiones'], columns, filters, start, end)
     except Exception as e:
-        raise Exception(f"Error al cargar el archivo desde S3: {str(e)}")
+        raise Exception(f"Error al cargar el conjunto actual desde S3: {str(e)}")
+
+
+class DatasetCache:
+    """
+    Caché de DataFrames compartida por todo el proceso.
+
+    Una entrada se sirve sin consultar S3 durante `ttl` segundos. Pasado ese tiempo se
+    revalida con un HEAD barato: si el ETag no cambió se sigue usando, y si cambió se vuelve
+    a cargar. Solo un hilo carga cada clave a la vez (single-flight) y las entradas menos
+    usadas se descartan cuando el total supera `max_bytes`.
+    """
+
+    def __init__(self, ttl=60, max_bytes=512 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._stats = {'hits': 0, 'misses': 0, 'revalidations': 0, 'evictions': 0, 'errors': 0}
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry['checked_at'] < self.ttl:
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+        return None
+
+    def get(self, key, etag_fn, loader):
+        """
+        Devuelve el valor de `key`, cargándolo con `loader()` si no está o si su ETag cambió.
+
+        Args:
+            key (hashable): Clave de la entrada.
+            etag_fn (callable): Devuelve el ETag vigente del origen (un HEAD a S3).
+            loader (callable): Carga el DataFrame desde el origen.
+
+        Returns:
+            pd.DataFrame: El valor cacheado. No debe modificarse.
+        """
+        with self._lock:
+            entry = self._fresh(key)
+            if entry is not None:
+                return entry['data']
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Otra petición pudo haber cargado o revalidado la entrada mientras se esperaba
+            with self._lock:
+                entry = self._fresh(key)
+                if entry is not None:
+                    return entry['data']
+                entry = self._entries.get(key)
+
+            try:
+                etag = etag_fn()
+                if entry is not None and entry['etag'] == etag:
+                    with self._lock:
+                        entry['checked_at'] = time.monotonic()
+                        self._stats['revalidations'] += 1
+                    return entry['data']
+
+                data = loader()
+            except Exception:
+                with self._lock:
+                    self._stats['errors'] += 1
+                raise
+
+            size = self._size(data)
+            with self._lock:
+                self._stats['misses'] += 1
+                self._entries.pop(key, None)
+                if size <= self.max_bytes:
+                    self._entries[key] = {'data': data, 'etag': etag, 'size': size,
+                                          'checked_at': time.monotonic()}
+                    self._evict()
+            return data
+
+    @classmethod
+    def _size(cls, value):
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(deep=True).sum())
+        if isinstance(value, dict):
+            return sum(cls._size(item) for item in value.values())
+        return 0
+
+    def _evict(self):
+        while sum(entry['size'] for entry in self._entries.values()) > self.max_bytes:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Contadores de aciertos, fallos, revalidaciones, desalojos y errores,
+            más el número de entradas y los bytes ocupados.
+        """
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['revalidations'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_ratio': round((lookups - self._stats['misses']) / lookups, 4) if lookups else None,
+                'entries': len(self._entries),
+                'bytes': sum(entry['size'] for entry in self._entries.values()),
+            }
+
+
+dataset_cache = DatasetCache(
+    ttl=getattr(settings, 'DATASET_CACHE_TTL', 60),
+    max_bytes=getattr(settings, 'DATASET_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+)
+
+
+def get_object_etag(bucket_name, key):
+    """
+    Obtiene el ETag de un objeto con una petición HEAD.
+
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+        key (str): La clave del objeto.
+
+    Returns:
+        str: El ETag del objeto.
+    """
+    return get_s3_client().head_object(Bucket=bucket_name, Key=key)['ETag']
+
+
+def get_current_dataset(bucket_name, columns=None):
+    """
+    Devuelve el conjunto actual desde la caché del proceso. Se revalida contra el ETag
+    del puntero ACTUAL.json, que cambia con cada versión publicada por la compactación.
 
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+        columns (list, optional): Columnas a leer; por defecto todas.
+
+    Returns:
+        pd.DataFrame: El conjunto actual (compartido: no debe modificarse).
+    """
+    key = ('current', bucket_name, tuple(columns) if columns is not None else None)
+    return dataset_cache.get(
+        key,
+        lambda: get_object_etag(bucket_name, CURRENT_POINTER_KEY),
+        lambda: load_current_dataset(bucket_name, columns=columns),
+    )
+
+
+def load_current_kpis(bucket_name):
+    """
+    Carga los KPIs materializados de la versión vigente, revalidados contra el ETag del puntero.
+
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+
+    Returns:
+        dict | None: Agregados por partición ({"YYYY-MM": {"total", "resultados", "riesgo"}}),
+        o None si la versión vigente se publicó antes de materializar los KPIs.
+    """
+    def loader():
+        s3 = get_s3_client()
+        pointer = load_current_pointer(bucket_name, s3)
+        if not pointer.get('kpis'):
+            return None
+        try:
+            return almacenamiento.leer_json(s3, bucket_name, pointer['kpis'])
+        except Exception as e:
+            raise Exception(f"Error al cargar los KPIs desde S3: {str(e)}")
+
+    return dataset_cache.get(
+        ('kpis', bucket_name),
+        lambda: get_object_etag(bucket_name, CURRENT_POINTER_KEY),
+        loader,
+    )
+
+
+def summarize_kpis(kpis):
+    """
+    Suma los agregados por partición en los KPIs que devuelve la API.
+
+    Args:
+        kpis (dict): KPIs materializados (ver load_current_kpis).
+
+    Returns:
+        dict: total, aprobadas, reprobadas, inspecciones por mes (1-12) y distribución de riesgo.
+    """
+    total = passed = failed = 0
+    by_month = {}
+    risk = {}
+    for partition, summary in kpis['particiones'].items():
+        total += summary['total']
+        passed += summary['resultados'].get('Pass', 0)
+        failed += summary['resultados'].get('Fail', 0)
+        month = int(partition.split('-')[1])
+        if month:
+            by_month[month] = by_month.get(month, 0) + summary['total']
+        for level, count in summary['riesgo'].items():
+            risk[level] = risk.get(level, 0) + count
+    return {
+        'total_inspections': total,
+        'passed_inspections': passed,
+        'failed_inspections': failed,
+        'inspections_by_month': dict(sorted(by_month.items())),
+        'risk_distribution': dict(sorted(risk.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+def get_spatial_points(bucket_name):
+    """
+    Devuelve los puntos proyectados del conjunto actual para las agregaciones espaciales,
+    preparados una vez por versión y cacheados en el proceso.
 
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+
+    Returns:
+        pd.DataFrame: Salida de spatial.prepare_points (compartida: no debe modificarse).
+    """
+    columns = ['latitude', 'longitude', 'results', 'zip', 'location_zip', 'inspection_date']
+    return dataset_cache.get(
+        ('spatial', bucket_name),
+        lambda: get_object_etag(bucket_name, CURRENT_POINTER_KEY),
+        lambda: prepare_points(load_current_dataset(bucket_name, columns=columns)),
+    )
+
+
+def load_map_frames(bucket_name):
+    """
+    Carga los fotogramas diarios del mapa de la versión vigente, cacheados en el proceso.
+
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+
+    Returns:
+        dict | None: {"version", "zoom", "cells_per_side", "frames"}, donde frames es un DataFrame
+        ordenado por fecha con fecha, celda_x, celda_y, total, aprobadas y reprobadas. None si la
+        versión vigente no tiene fotogramas.
+    """
+    def loader():
+        s3 = get_s3_client()
+        pointer = load_current_pointer(bucket_name, s3)
+        frames = pointer.get('fotogramas')
+        if not frames:
+            return None
+        try:
+            parts = [almacenamiento.leer_objeto(s3, bucket_name, key) for key in frames['particiones'].values()]
+        except Exception as e:
+            raise Exception(f"Error al cargar los fotogramas desde S3: {str(e)}")
+        data = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(
+            columns=['fecha', 'celda_x', 'celda_y', 'total', 'aprobadas', 'reprobadas'])
+        return {
+            'version': pointer['version'],
+            'zoom': frames['zoom'],
+            'cells_per_side': frames['celdas_por_lado'],
+            'frames': data.sort_values('fecha', kind='stable', ignore_index=True),
+        }
+
+    return dataset_cache.get(
+        ('frames', bucket_name),
+        lambda: get_object_etag(bucket_name, CURRENT_POINTER_KEY),
+        loader,
+    )
+
+
+def load_establishment_history(bucket_name):
+    """
+    Carga el historial por establecimiento de la versión vigente, indexado por licencia y
+    cacheado en el proceso: consultar una licencia es una búsqueda en el índice.
+
+    Args:
+        bucket_name (str): El nombre del bucket de S3.
+
+    Returns:
+        dict | None: {"version", "history"}, donde history es un DataFrame con una fila por
+        licencia (inspecciones, reprobadas, tasa_reprobacion, primera_fecha, ultima_fecha,
+        ultimo_id, ultimo_resultado). None si la versión vigente no tiene historial.
+    """
+    def loader():
+        s3 = get_s3_client()
+        pointer = load_current_pointer(bucket_name, s3)
+        if not pointer.get('historial'):
+            return None
+        try:
+            data = almacenamiento.leer_objeto(s3, bucket_name, pointer['historial'])
+        except Exception as e:
+            raise Exception(f"Error al cargar el historial desde S3: {str(e)}")
+        return {'version': pointer['version'], 'history': data.set_index(data['license_'].astype(str))}
+
+    return dataset_cache.get(
+        ('history', bucket_name),
+        lambda: get_object_etag(bucket_name, CURRENT_POINTER_KEY),
+        loader,
+    )
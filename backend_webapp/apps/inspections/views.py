@@ -1,51 +1,327 @@
 import os
+import hashlib
 import pandas as pd
-from rest_framework.views import APIView
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
-from .utils import load_file_from_s3  # Función para cargar archivos desde S3
+from rest_framework.exceptions import ValidationError
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
+from .models import Inspection
+from .serializers import InspectionSerializer
+from .pagination import InspectionCursorPagination
+from .renderers import TABLE_RENDERERS
+from .spatial import MAX_ZOOM, filter_dates, frames_payload, grid_bins, zip_counts
+from .scoring import ModelUnavailable, get_model, score_establishments
+from .concurrency import AsyncAPIView, coalescer, render_coalescer, request_key, run_cpu, run_io
+from .utils import get_current_dataset, get_spatial_points, load_map_frames, load_current_kpis, load_establishment_history, summarize_kpis, dataset_cache  # Conjunto actual y KPIs desde S3, con caché del proceso
 
-class KPIs(APIView):
-    def get(self, request, *args, **kwargs):
-        bucket_name = os.getenv("S3_BUCKET_NAME")
-        file_key = 'datos_limpios/datos_limpios/datos_limpios_2024-11-13_08e32f34859ab66384461bbea8b811ce.pkl '
-        
-        try:
-            # Cargar el archivo desde S3 como DataFrame
-            data_from_s3 = load_file_from_s3(bucket_name, file_key)
-            if not isinstance(data_from_s3, pd.DataFrame):
-                raise ValueError("El archivo cargado no es un DataFrame válido.")
-
-            # Validar que las columnas necesarias existan
-            required_columns = {'latitude', 'longitude', 'inspection_date', 'results', 'risk'}
-            if not required_columns.issubset(data_from_s3.columns):
-                raise ValueError(f"Faltan columnas necesarias en los datos: {required_columns - set(data_from_s3.columns)}")
-
-            # Asegurar que 'inspection_date' sea de tipo datetime
-            if not pd.api.types.is_datetime64_any_dtype(data_from_s3['inspection_date']):
-                data_from_s3['inspection_date'] = pd.to_datetime(data_from_s3['inspection_date'])
-
-            # Calcular los KPIs
-            total_inspections = len(data_from_s3)
-            passed_inspections = len(data_from_s3[data_from_s3['results'] == 'Pass'])
-            failed_inspections = len(data_from_s3[data_from_s3['results'] == 'Fail'])
-            inspections_by_month = data_from_s3.groupby(data_from_s3['inspection_date'].dt.month).size()
-            risk_distribution = data_from_s3['risk'].value_counts()
-
-            # Preparar las ubicaciones
-            inspection_locations = data_from_s3[['latitude', 'longitude', 'inspection_date']].to_dict(orient='records')
-
-            # Convertir los resultados a JSON-friendly
-            kpis = {
-                'total_inspections': total_inspections,
-                'passed_inspections': passed_inspections,
-                'failed_inspections': failed_inspections,
-                'inspections_by_month': inspections_by_month.to_dict(),
-                'risk_distribution': risk_distribution.to_dict(),
-                'inspection_locations': inspection_locations
-            }
+class KPIs(AsyncAPIView):
+    """
+    KPIs del conjunto actual: totales, aprobadas, reprobadas, inspecciones por mes y
+    distribución de riesgo.
+
+    La respuesta ya no incluye inspection_locations: las ubicaciones del mapa se piden por
+    ventanas de fechas a /map/frames/.
+    """
+    renderer_classes = TABLE_RENDERERS
 
+    async def get(self, request, *args, **kwargs):
+        try:
+            kpis = await self.coalesce(request_key(request), lambda: self.compute(os.getenv("S3_BUCKET_NAME")))
         except Exception as e:
             return Response({"error": f"Error al calcular KPIs: {str(e)}"}, status=500)
 
         # Respuesta final con KPIs completos
         return Response(kpis)
+
+    async def compute(self, bucket_name):
+        # KPIs materializados por el pipeline; solo se cargan filas si la versión no los tiene
+        materialized = await run_io(load_current_kpis, bucket_name)
+        if materialized is not None:
+            return summarize_kpis(materialized)
+        columns = ['inspection_date', 'results', 'risk']
+        data_from_s3 = await run_io(get_current_dataset, bucket_name, columns)
+        return await run_cpu(build_kpis, data_from_s3, columns)
+
+
+def build_kpis(data_from_s3, columns):
+    """
+    Calcula los KPIs a partir de las filas, para versiones publicadas sin KPIs materializados.
+
+    Args:
+        data_from_s3 (pd.DataFrame): Columnas del conjunto actual (compartido: no se modifica).
+        columns (list): Columnas que se esperan en `data_from_s3`.
+
+    Returns:
+        dict: KPIs con el mismo formato que `summarize_kpis`.
+    """
+    if not isinstance(data_from_s3, pd.DataFrame):
+        raise ValueError("El archivo cargado no es un DataFrame válido.")
+
+    # Validar que las columnas necesarias existan
+    required_columns = set(columns)
+    if not required_columns.issubset(data_from_s3.columns):
+        raise ValueError(f"Faltan columnas necesarias en los datos: {required_columns - set(data_from_s3.columns)}")
+
+    # Asegurar que 'inspection_date' sea de tipo datetime, sin modificar el DataFrame cacheado
+    if not pd.api.types.is_datetime64_any_dtype(data_from_s3['inspection_date']):
+        data_from_s3 = data_from_s3.assign(inspection_date=pd.to_datetime(data_from_s3['inspection_date']))
+
+    return {
+        'total_inspections': len(data_from_s3),
+        'passed_inspections': len(data_from_s3[data_from_s3['results'] == 'Pass']),
+        'failed_inspections': len(data_from_s3[data_from_s3['results'] == 'Fail']),
+        'inspections_by_month': data_from_s3.groupby(data_from_s3['inspection_date'].dt.month).size().to_dict(),
+        # Las categorías sin filas no se cuentan, como con columnas de texto
+        'risk_distribution': data_from_s3['risk'].value_counts().loc[lambda counts: counts > 0].to_dict(),
+    }
+
+
+class CacheStats(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        # Métricas de la caché de conjuntos y de la agrupación de peticiones de este proceso
+        return Response({**dataset_cache.stats(), 'coalescing': coalescer.stats(),
+                         'render_coalescing': render_coalescer.stats()})
+
+
+class InspectionList(ListAPIView):
+    """
+    Lista paginada de inspecciones. Filtros opcionales por query string:
+    start, end (YYYY-MM-DD, inclusivos), results, risk, facility_type y zip.
+    """
+    serializer_class = InspectionSerializer
+    pagination_class = InspectionCursorPagination
+    renderer_classes = TABLE_RENDERERS
+    filter_fields = ('results', 'risk', 'facility_type', 'zip')
+
+    def get_queryset(self):
+        queryset = Inspection.objects.all()
+        params = self.request.query_params
+
+        start, end = parse_date_range(params)
+        if start is not None:
+            queryset = queryset.filter(inspection_date__gte=start)
+        if end is not None:
+            queryset = queryset.filter(inspection_date__lte=end)
+
+        for field in self.filter_fields:
+            value = params.get(field)
+            if value:
+                queryset = queryset.filter(**{field: value})
+        return queryset
+
+
+def parse_date_range(params):
+    """
+    Lee start y end (YYYY-MM-DD) de la query string.
+
+    Returns:
+        tuple: (start, end), cada uno None si no se indicó.
+
+    Raises:
+        ValidationError: Si alguna fecha no es válida.
+    """
+    dates = []
+    for param in ('start', 'end'):
+        value = params.get(param)
+        if not value:
+            dates.append(None)
+            continue
+        try:
+            date = parse_date(value)
+        except ValueError:
+            date = None
+        if date is None:
+            raise ValidationError({param: "Fecha inválida, se espera YYYY-MM-DD."})
+        dates.append(date)
+    return tuple(dates)
+
+
+class SpatialGrid(AsyncAPIView):
+    """
+    Inspecciones agrupadas en celdas de una cuadrícula Web Mercator.
+    Parámetros: bbox=min_lon,min_lat,max_lon,max_lat, zoom (0-18) y opcionalmente start y end.
+    """
+    renderer_classes = TABLE_RENDERERS
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            bbox = [float(value) for value in request.query_params.get('bbox', '').split(',')]
+            zoom = int(request.query_params.get('zoom', ''))
+        except ValueError:
+            raise ValidationError({"bbox": "Se espera bbox=min_lon,min_lat,max_lon,max_lat y un zoom entero."})
+        if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+            raise ValidationError({"bbox": "Se espera bbox=min_lon,min_lat,max_lon,max_lat."})
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValidationError({"zoom": f"El zoom debe estar entre 0 y {MAX_ZOOM}."})
+        start, end = parse_date_range(request.query_params)
+
+        async def compute():
+            points = await run_io(get_spatial_points, os.getenv("S3_BUCKET_NAME"))
+            return await run_cpu(lambda: grid_bins(filter_dates(points, start, end), bbox, zoom))
+
+        try:
+            return Response(await self.coalesce(request_key(request), compute))
+        except Exception as e:
+            return Response({"error": f"Error al agregar las ubicaciones: {str(e)}"}, status=500)
+
+
+class SpatialZips(AsyncAPIView):
+    """
+    Inspecciones por código postal, con tasas de aprobación y reprobación.
+    Parámetros opcionales: start y end.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        start, end = parse_date_range(request.query_params)
+
+        async def compute():
+            points = await run_io(get_spatial_points, os.getenv("S3_BUCKET_NAME"))
+            return await run_cpu(lambda: zip_counts(filter_dates(points, start, end)))
+
+        try:
+            return Response(await self.coalesce(request_key(request), compute))
+        except Exception as e:
+            return Response({"error": f"Error al agregar las ubicaciones: {str(e)}"}, status=500)
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Indica si un ETag está en la cabecera If-None-Match: una lista separada por comas o '*'.
+    Se compara de forma débil, como pide If-None-Match, así que W/"x" coincide con "x".
+    """
+    tags = parse_etags(if_none_match)
+    if tags == ['*']:
+        return True
+    return etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in tags}
+
+
+class MapFrames(AsyncAPIView):
+    """
+    Fotogramas precalculados para animar el mapa, uno por día o por semana.
+    Parámetros opcionales: period (day|week, por defecto week), start y end.
+
+    Las respuestas llevan un ETag derivado de la versión del conjunto y de los parámetros, así
+    que el cliente puede pedir ventanas de fechas sucesivas y revalidarlas con If-None-Match.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        period = request.query_params.get('period', 'week')
+        if period not in ('day', 'week'):
+            raise ValidationError({"period": "Se espera 'day' o 'week'."})
+        start, end = parse_date_range(request.query_params)
+
+        try:
+            frames = await run_io(load_map_frames, os.getenv("S3_BUCKET_NAME"))
+            if frames is None:
+                return Response({"error": "La versión actual del conjunto no tiene fotogramas."}, status=404)
+
+            etag = '"%s"' % hashlib.sha256(f"{frames['version']}:{period}:{start}:{end}".encode()).hexdigest()[:32]
+            if etag_matches(etag, request.headers.get('If-None-Match', '')):
+                response = Response(status=304)
+            else:
+                payload = await self.coalesce(
+                    request_key(request, frames['version']),
+                    lambda: run_cpu(frames_payload, frames['frames'], frames['cells_per_side'], period, start, end))
+                response = Response({
+                    'version': frames['version'],
+                    'period': period,
+                    'zoom': frames['zoom'],
+                    'cells_per_side': frames['cells_per_side'],
+                    'frames': payload,
+                })
+        except Exception as e:
+            return Response({"error": f"Error al cargar los fotogramas: {str(e)}"}, status=500)
+
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=settings.MAP_FRAMES_MAX_AGE)
+        return response
+
+
+class Scores(AsyncAPIView):
+    """
+    Probabilidad de reprobar la próxima inspección, con el modelo vigente.
+
+    GET  /scores/?license=123,456[&date=YYYY-MM-DD]
+    POST /scores/ {"establishments": [{"license": ...} | {"facility_type", "risk", "latitude", "longitude"}],
+                   "date": "YYYY-MM-DD"}
+    """
+
+    async def get(self, request, *args, **kwargs):
+        licenses = [value for value in request.query_params.get('license', '').split(',') if value.strip()]
+        return await self.score([{'license': value.strip()} for value in licenses], request.query_params.get('date'),
+                                request_key(request))
+
+    async def post(self, request, *args, **kwargs):
+        items = request.data.get('establishments') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValidationError({"establishments": "Se espera una lista de establecimientos."})
+        return await self.score(items, request.data.get('date'))
+
+    async def score(self, items, date, key=None):
+        if not items:
+            raise ValidationError({"establishments": "Indica al menos un establecimiento."})
+        if len(items) > settings.SCORING_MAX_ITEMS:
+            raise ValidationError({"establishments": f"Máximo {settings.SCORING_MAX_ITEMS} establecimientos por petición."})
+        if date:
+            try:
+                date = parse_date(str(date))
+            except ValueError:
+                date = None
+            if date is None:
+                raise ValidationError({"date": "Fecha inválida, se espera YYYY-MM-DD."})
+        else:
+            date = timezone.localdate()
+
+        bucket_name = os.getenv("S3_BUCKET_NAME")
+
+        async def compute():
+            # El modelo se carga (o revalida) en el pool de E/S; la puntuación es cálculo
+            await run_io(get_model, bucket_name)
+            return await run_cpu(score_establishments, bucket_name, items, date)
+
+        try:
+            # Solo los GET se agrupan: los cuerpos de los POST no forman parte de la clave
+            version, scores = await (self.coalesce(key + (str(date),), compute) if key is not None else compute())
+        except ModelUnavailable as e:
+            return Response({"error": str(e)}, status=503)
+        except Exception as e:
+            return Response({"error": f"Error al puntuar: {str(e)}"}, status=500)
+        return Response({'model_version': version, 'date': date, 'scores': scores})
+
+
+class EstablishmentHistory(AsyncAPIView):
+    """
+    Estado acumulado de un establecimiento: inspecciones, reprobadas, tasa de reprobación móvil
+    y última inspección. Se sirve desde el historial materializado por la compactación.
+
+    GET /establishments/<license>/history/
+    """
+
+    async def get(self, request, license, *args, **kwargs):
+        try:
+            history = await run_io(load_establishment_history, os.getenv("S3_BUCKET_NAME"))
+        except Exception as e:
+            return Response({"error": f"Error al cargar el historial: {str(e)}"}, status=500)
+        if history is None:
+            return Response({"error": "La versión actual del conjunto no tiene historial."}, status=404)
+        if license not in history['history'].index:
+            return Response({"error": "Licencia sin inspecciones conocidas."}, status=404)
+
+        state = history['history'].loc[license]
+        last_date = state['ultima_fecha']
+        return Response({
+            'version': history['version'],
+            'license': license,
+            'inspections': int(state['inspecciones']),
+            'failures': int(state['reprobadas']),
+            'fail_rate': round(float(state['tasa_reprobacion']), 6),
+            'first_inspection_date': state['primera_fecha'].date(),
+            'last_inspection_date': last_date.date(),
+            'last_inspection_id': int(state['ultimo_id']),
+            'last_result': state['ultimo_resultado'],
+            'days_since_last_inspection': (timezone.localdate() - last_date.date()).days,
+        })
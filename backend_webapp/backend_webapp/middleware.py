@@ -0,0 +1,63 @@
+from asgiref.sync import sync_to_async
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se comprime solo con gzip
+    brotli = None
+
+# Calidad 5: buena relación tamaño/CPU para respuestas dinámicas (11 es para estáticos)
+BROTLI_QUALITY = 5
+MIN_LENGTH = 200
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Comprime las respuestas con brotli si el cliente lo acepta y con gzip en otro caso.
+    """
+
+    async def __acall__(self, request):
+        # Bajo ASGI, MiddlewareMixin ejecuta process_response en el único hilo "thread sensitive",
+        # así que las compresiones de todas las peticiones irían en serie; no tocan la base de datos
+        response = await self.get_response(request)
+        return await sync_to_async(self.process_response, thread_sensitive=False)(request, response)
+
+    def process_response(self, request, response):
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < MIN_LENGTH
+            or not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        # El ETag fuerte deja de valer para el cuerpo comprimido, igual que en GZipMiddleware
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+_compressor = CompressionMiddleware(lambda request: None)
+
+
+def compress_response(request, response):
+    """
+    Comprime una respuesta ya renderizada como lo haría CompressionMiddleware; sirve para
+    comprimir una vez una respuesta que se comparte entre peticiones. El middleware no vuelve a
+    comprimir las respuestas que ya tienen Content-Encoding.
+    """
+    return _compressor.process_response(request, response)
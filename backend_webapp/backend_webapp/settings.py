@@ -12,12 +12,19 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME')
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Módulos compartidos con el pipeline (almacenamiento y caracteristicas). La imagen los copia junto a
+# la aplicación; al ejecutar desde el repositorio se importan de scripts/
+SCRIPTS_DIR = BASE_DIR.parent / 'scripts'
+if SCRIPTS_DIR.is_dir() and str(SCRIPTS_DIR) not in sys.path:
+    sys.path.append(str(SCRIPTS_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -59,6 +66,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend_webapp.middleware.CompressionMiddleware',  # Brotli o gzip según Accept-Encoding; va primero para comprimir la respuesta final
     'corsheaders.middleware.CorsMiddleware',  # Agrega este middleware
     'django.middleware.common.CommonMiddleware',  # Importante para manejo de cabeceras comunes
     'django.middleware.security.SecurityMiddleware',
@@ -146,4 +154,29 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Configuración de S3
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+
+# Caché de conjuntos en memoria del proceso: segundos sin revalidar y tamaño máximo en bytes
+DATASET_CACHE_TTL = int(os.getenv('DATASET_CACHE_TTL', '60'))
+DATASET_CACHE_MAX_BYTES = int(os.getenv('DATASET_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# JSON codificado con orjson en todas las vistas de DRF; las vistas con tablas grandes
+# añaden formatos columnares (ver apps/inspections/renderers.py)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'apps.inspections.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Segundos que navegadores y proxies pueden reutilizar los fotogramas del mapa sin revalidar
+MAP_FRAMES_MAX_AGE = int(os.getenv('MAP_FRAMES_MAX_AGE', '300'))
+
+# Máximo de establecimientos por petición de puntuación en línea
+SCORING_MAX_ITEMS = int(os.getenv('SCORING_MAX_ITEMS', '1000'))
+
+# Vistas asíncronas (ver apps/inspections/concurrency.py): hilos para las lecturas de S3 y
+# hilos acotados para el cálculo con pandas, por proceso de uvicorn
+ASYNC_IO_WORKERS = int(os.getenv('ASYNC_IO_WORKERS', '32'))
+ASYNC_CPU_WORKERS = int(os.getenv('ASYNC_CPU_WORKERS', '4'))
+
 SECRET_KEY = os.getenv('SECRET_KEY')
@@ -0,0 +1,186 @@
+# Prueba de carga de las vistas asíncronas de la API bajo uvicorn.
+#
+# Uso:
+#   python benchmarks/bench_api.py --filas 100000 --concurrencias 1 4 16 64 --peticiones 256
+#
+# Levanta un S3 local (moto) con un conjunto sintético pasado por la limpieza y la compactación
+# (conjunto actual, KPIs, fotogramas e historial) y la API con uvicorn en un proceso aparte. Para
+# cada nivel de concurrencia lanza las peticiones de cada escenario y mide el rendimiento
+# (peticiones/s) y la latencia (p50/p95). A la vez, una sonda pide un endpoint ligero cada 50 ms:
+# si el bucle de eventos no se bloquea, su latencia no crece con la carga. Escenarios:
+#   kpis_identicas     -> GET /api/kpis/ idénticos: comparten cálculo, renderizado y compresión
+#   rejilla_distintas  -> GET /api/spatial/grid/ con rangos de fechas distintos: sin agrupación
+#   zips_distintas     -> GET /api/spatial/zips/ con rangos de fechas distintos
+# El resultado se escribe en JSON por la salida estándar y, con --salida, se añade a un JSONL.
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime, date, timedelta
+import httpx
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "scripts"))
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+from bench_limpieza import BUCKET, iniciar_s3_local
+from bench_pipeline import commit_actual, puerto_libre
+from generador import GeneradorInspecciones
+
+RANGO_FECHAS = (date(2010, 1, 1), date(2022, 12, 31))
+BBOX_CHICAGO = "-87.94,41.64,-87.52,42.03"
+
+
+# Función para cargar el conjunto sintético en el S3 local con el pipeline real
+def poblar(filas, tam_pagina=50000):
+    import almacenamiento
+    import limpieza
+    limpieza.s3.create_bucket(Bucket=BUCKET)
+    generador, lote = GeneradorInspecciones(filas), []
+    for numero, inicio in enumerate(range(0, filas, tam_pagina)):
+        pagina = generador.rango(inicio, min(tam_pagina, filas - inicio))
+        clave = f"ingesta/inicial/inspecciones-historicas-bench-parte-{numero:05d}.parquet"
+        lote.append((almacenamiento.escribir_objeto(limpieza.s3, BUCKET, clave, pagina), pagina))
+    limpieza.limpiar_ingesta(BUCKET, lote)
+
+
+# Función para levantar la API con uvicorn y esperar a que acepte conexiones
+def iniciar_api(puerto, procesos):
+    entorno = dict(os.environ, PYTHONPATH=os.path.join(RAIZ, "scripts"), SECRET_KEY="bench",
+                   DJANGO_SETTINGS_MODULE="backend_webapp.settings")
+    api = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend_webapp.asgi:application", "--port", str(puerto),
+                            "--workers", str(procesos), "--log-level", "warning"],
+                           cwd=os.path.join(RAIZ, "backend_webapp"), env=entorno)
+    for _ in range(300):
+        try:
+            socket.create_connection(("127.0.0.1", puerto), timeout=1).close()
+            return api
+        except OSError:
+            time.sleep(0.1)
+    api.terminate()
+    raise RuntimeError("La API no arrancó.")
+
+
+# Función para generar las rutas de un escenario; las distintas varían el rango de fechas
+def rutas(escenario, cantidad):
+    if escenario == "kpis_identicas":
+        return ["/api/kpis/"] * cantidad
+    inicio, fin = RANGO_FECHAS
+    dias = (fin - inicio).days
+    rng = np.random.default_rng(0)
+    desde = [inicio + timedelta(days=int(d)) for d in rng.integers(0, dias - 365, cantidad)]
+    if escenario == "rejilla_distintas":
+        return [f"/api/spatial/grid/?bbox={BBOX_CHICAGO}&zoom=13&start={d}&end={d + timedelta(days=365)}" for d in desde]
+    return [f"/api/spatial/zips/?start={d}&end={d + timedelta(days=365)}" for d in desde]
+
+
+# Función para resumir latencias en milisegundos
+def percentiles(latencias):
+    if not latencias:
+        return {}
+    valores = np.array(latencias) * 1000
+    return {"p50_ms": round(float(np.percentile(valores, 50)), 1), "p95_ms": round(float(np.percentile(valores, 95)), 1),
+            "max_ms": round(float(valores.max()), 1)}
+
+
+# Función para lanzar las peticiones de un escenario con `concurrencia` clientes simultáneos
+async def carga(cliente, pendientes, concurrencia):
+    latencias, errores = [], 0
+    cola = iter(pendientes)
+
+    async def trabajador():
+        nonlocal errores
+        for ruta in cola:
+            inicio = time.perf_counter()
+            respuesta = await cliente.get(ruta)
+            latencias.append(time.perf_counter() - inicio)
+            errores += respuesta.status_code != 200
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    return latencias, errores, time.perf_counter() - inicio
+
+
+# Función para pedir un endpoint ligero periódicamente mientras dura la carga
+async def sonda(cliente, detener, latencias):
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        await cliente.get("/api/cache-stats/")
+        latencias.append(time.perf_counter() - inicio)
+        await asyncio.sleep(0.05)
+
+
+# Función para medir un escenario en un nivel de concurrencia
+async def medir(base, escenario, concurrencia, peticiones):
+    limites = httpx.Limits(max_connections=concurrencia + 1, max_keepalive_connections=concurrencia + 1)
+    async with httpx.AsyncClient(base_url=base, limits=limites, timeout=300) as cliente:
+        antes = (await cliente.get("/api/cache-stats/")).json()
+        detener, latencias_sonda = asyncio.Event(), []
+        tarea_sonda = asyncio.create_task(sonda(cliente, detener, latencias_sonda))
+        latencias, errores, segundos = await carga(cliente, rutas(escenario, peticiones), concurrencia)
+        detener.set()
+        await tarea_sonda
+        despues = (await cliente.get("/api/cache-stats/")).json()
+    return {
+        "concurrencia": concurrencia,
+        "peticiones": peticiones,
+        "errores": errores,
+        "segundos": round(segundos, 3),
+        "peticiones_por_segundo": round(peticiones / segundos, 1),
+        **percentiles(latencias),
+        "calculos": despues["coalescing"]["computations"] - antes["coalescing"]["computations"],
+        "agrupadas": despues["coalescing"]["coalesced"] - antes["coalescing"]["coalesced"],
+        "renderizados": despues["render_coalescing"]["computations"] - antes["render_coalescing"]["computations"],
+        "sonda": percentiles(latencias_sonda),
+    }
+
+
+async def ejecutar(base, escenarios, concurrencias, peticiones):
+    async with httpx.AsyncClient(base_url=base, timeout=300) as cliente:
+        # Calentamiento: las cachés del proceso cargan el conjunto una vez
+        for escenario in escenarios:
+            (await cliente.get(rutas(escenario, 1)[0])).raise_for_status()
+    return {escenario: [await medir(base, escenario, concurrencia, peticiones) for concurrencia in concurrencias]
+            for escenario in escenarios}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API asíncrona bajo uvicorn")
+    parser.add_argument("--filas", type=int, default=100000)
+    parser.add_argument("--concurrencias", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--peticiones", type=int, default=256, help="Peticiones por escenario y nivel.")
+    parser.add_argument("--escenarios", nargs="+", default=["kpis_identicas", "rejilla_distintas", "zips_distintas"])
+    parser.add_argument("--procesos", type=int, default=1, help="Procesos de uvicorn.")
+    parser.add_argument("--salida", help="Archivo JSONL al que se añade el resultado.")
+    args = parser.parse_args()
+
+    servidor_s3 = iniciar_s3_local()
+    poblar(args.filas)
+    puerto = puerto_libre()
+    api = iniciar_api(puerto, args.procesos)
+    try:
+        escenarios = asyncio.run(ejecutar(f"http://127.0.0.1:{puerto}", args.escenarios, args.concurrencias, args.peticiones))
+    finally:
+        api.terminate()
+        api.wait()
+        servidor_s3.stop()
+
+    resultado = {
+        "fecha": datetime.today().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "parametros": {"filas": args.filas, "procesos": args.procesos, "nucleos": os.cpu_count()},
+        "escenarios": escenarios,
+    }
+    print(json.dumps(resultado, indent=2))
+    if args.salida:
+        with open(args.salida, "a") as archivo:
+            archivo.write(json.dumps(resultado) + "\n")
+
+
+if __name__ == "__main__":
+    main()
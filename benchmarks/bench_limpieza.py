@@ -0,0 +1,119 @@
+# Benchmark del pipeline concurrente de limpieza contra un S3 local (moto).
+#
+# Uso:
+#   python benchmarks/bench_limpieza.py --archivos 40 --filas 20000 --latencia-ms 30
+#
+# Compara la ejecución secuencial (1 hilo por etapa) con la concurrente y escribe el
+# resultado en JSON por la salida estándar.
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "scripts"))
+
+BUCKET = "bench-inspecciones"
+
+
+# Función para levantar un S3 local y dirigir boto3 hacia él
+def iniciar_s3_local():
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    servidor = ThreadedMotoServer(port=0, verbose=False)
+    servidor.start()
+    host, puerto = servidor.get_host_and_port()
+    os.environ.update({
+        "AWS_ENDPOINT_URL": f"http://{host}:{puerto}",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "S3_BUCKET_NAME": BUCKET,
+    })
+    return servidor
+
+
+# Función para simular la latencia de ida y vuelta de S3 en cada petición
+def agregar_latencia(cliente, latencia_ms):
+    if latencia_ms <= 0:
+        return
+    cliente.meta.events.register("before-send.s3", lambda **kwargs: time.sleep(latencia_ms / 1000))
+
+
+# Función para generar una página de ingesta con el esquema de Socrata
+def pagina_sintetica(filas, semilla, primer_id):
+    rng = np.random.default_rng(semilla)
+    coordenadas_nulas = rng.random(filas) < 0.03
+    latitud = rng.normal(41.85, 0.08, filas).round(6)
+    longitud = rng.normal(-87.68, 0.06, filas).round(6)
+    fechas = pd.Timestamp("2010-01-01") + pd.to_timedelta(rng.integers(0, 5000, filas), unit="D")
+    return pd.DataFrame({
+        "inspection_id": (np.arange(filas) + primer_id).astype(str),
+        "dba_name": "ESTABLECIMIENTO",
+        "aka_name": None,
+        "license_": rng.integers(1, 40000, filas).astype(str),
+        "facility_type": rng.choice(["Restaurant", "Grocery Store", "School", "Bakery"], filas),
+        "risk": rng.choice(["Risk 1 (High)", "Risk 2 (Medium)", "Risk 3 (Low)"], filas),
+        "address": "11 N STATE ST",
+        "city": "CHICAGO",
+        "state": "IL",
+        "zip": rng.choice(["60601", "60614", "60647", "60622"], filas),
+        "inspection_date": fechas.strftime("%Y-%m-%dT00:00:00.000"),
+        "inspection_type": "Canvass",
+        "results": rng.choice(["Pass", "Fail", "Pass w/ Conditions"], filas),
+        "violations": "33. FOOD AND NON-FOOD CONTACT EQUIPMENT - Comments: CLEAN",
+        "latitude": np.where(coordenadas_nulas, None, latitud.astype(str)),
+        "longitude": np.where(coordenadas_nulas, None, longitud.astype(str)),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline concurrente de limpieza")
+    parser.add_argument("--archivos", type=int, default=20)
+    parser.add_argument("--filas", type=int, default=20000)
+    parser.add_argument("--latencia-ms", type=float, default=20.0)
+    parser.add_argument("--descargas", type=int, default=4)
+    parser.add_argument("--limpiezas", type=int, default=2)
+    parser.add_argument("--subidas", type=int, default=4)
+    args = parser.parse_args()
+
+    servidor = iniciar_s3_local()
+    import almacenamiento
+    import limpieza
+    limpieza.s3.create_bucket(Bucket=BUCKET)
+    for i in range(args.archivos):
+        clave = f"ingesta/inicial/inspecciones-historicas-bench-parte-{i:05d}.parquet"
+        almacenamiento.escribir_objeto(limpieza.s3, BUCKET, clave, pagina_sintetica(args.filas, i, i * args.filas))
+    agregar_latencia(limpieza.s3, args.latencia_ms)
+
+    configuraciones = {
+        "secuencial": (1, 1, 1),
+        "concurrente": (args.descargas, args.limpiezas, args.subidas),
+    }
+    resultados = {}
+    for nombre, (descargas, limpiezas, subidas) in configuraciones.items():
+        # Se borra la salida anterior para que ambas ejecuciones limpien todos los archivos
+        for obj in list(almacenamiento.listar_objetos(limpieza.s3, BUCKET, "datos_limpios/")):
+            limpieza.s3.delete_object(Bucket=BUCKET, Key=obj["Key"])
+        inicio = time.perf_counter()
+        filas = limpieza.procesar_archivos(BUCKET, ["ingesta/inicial"], descargas, limpiezas, subidas)
+        segundos = time.perf_counter() - inicio
+        resultados[nombre] = {
+            "hilos": {"descarga": descargas, "limpieza": limpiezas, "subida": subidas},
+            "segundos": round(segundos, 3),
+            "filas_limpias": filas,
+            "filas_por_segundo": round(filas / segundos, 1),
+        }
+
+    resultados["aceleracion"] = round(resultados["secuencial"]["segundos"] / resultados["concurrente"]["segundos"], 2)
+    resultados["parametros"] = vars(args)
+    print(json.dumps(resultados, indent=2))
+    servidor.stop()
+
+
+if __name__ == "__main__":
+    main()
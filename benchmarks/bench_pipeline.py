@@ -0,0 +1,221 @@
+# Benchmark de extremo a extremo del pipeline con datos sintéticos.
+#
+# Uso:
+#   python benchmarks/bench_pipeline.py --filas 100000 1000000 10000000 --salida benchmarks/resultados.jsonl
+#
+# Para cada tamaño levanta un S3 local (moto) y una API de Socrata local (socrata_local.py) en
+# procesos aparte, y ejecuta las etapas en un proceso nuevo para que la memoria de un tamaño no
+# contamine al siguiente:
+#   ingesta       -> páginas de Socrata a ingesta/inicial (como la ingesta inicial de ingesta.py)
+#   limpieza      -> limpieza.procesar_archivos
+#   compactacion  -> compactacion.compactar (conjunto actual, KPIs materializados y fotogramas)
+#   kpis          -> KPIs recalculados desde las filas del conjunto actual y lectura de los materializados
+#   caracteristicas -> ajuste del codificador y almacén de características
+# De cada etapa se mide el tiempo, la CPU y el pico de memoria residente (muestreado). El resultado
+# se escribe en JSON por la salida estándar y, con --salida, se añade como una línea a un archivo
+# JSONL junto con el commit y la máquina, para comparar ejecuciones.
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(RAIZ, "benchmarks")
+BUCKET = "bench-inspecciones"
+
+
+class Medidor:
+    """
+    Mide una etapa: tiempo de reloj, tiempo de CPU y pico de memoria residente.
+
+    El pico se obtiene muestreando /proc/self/statm, porque ru_maxrss solo da el máximo del
+    proceso completo y no el de cada etapa.
+
+    Attributes:
+        intervalo (float): Segundos entre muestras de memoria.
+        resultado (dict): Métricas de la etapa al salir del bloque.
+    """
+
+    def __init__(self, intervalo=0.02):
+        self.intervalo = intervalo
+        self.resultado = {}
+        self._pico = 0
+        self._activo = threading.Event()
+
+    @staticmethod
+    def rss_mb():
+        try:
+            with open("/proc/self/statm") as archivo:
+                return int(archivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _muestrear(self):
+        while not self._activo.wait(self.intervalo):
+            self._pico = max(self._pico, self.rss_mb())
+
+    def __enter__(self):
+        self._rss_inicio = self._pico = self.rss_mb()
+        self._cpu_inicio = time.process_time()
+        self._inicio = time.perf_counter()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *excepcion):
+        segundos = time.perf_counter() - self._inicio
+        self._activo.set()
+        self._hilo.join()
+        self._pico = max(self._pico, self.rss_mb())
+        self.resultado = {
+            "segundos": round(segundos, 3),
+            "cpu_segundos": round(time.process_time() - self._cpu_inicio, 3),
+            "rss_inicio_mb": round(self._rss_inicio, 1),
+            "rss_pico_mb": round(self._pico, 1),
+        }
+        return False
+
+
+# Función para medir el tamaño de lo guardado bajo un prefijo del bucket
+def megabytes(s3, prefijo):
+    import almacenamiento
+    return round(sum(obj["Size"] for obj in almacenamiento.listar_objetos(s3, BUCKET, prefijo, extensiones=""))
+                 / 2**20, 1)
+
+
+# Función para ejecutar las etapas en este proceso; el entorno ya apunta a los servicios locales
+def ejecutar_etapas(filas, tam_pagina):
+    sys.path.insert(0, os.path.join(RAIZ, "scripts"))
+    import ingesta
+    import limpieza
+    import compactacion
+    import indicadores
+    import run_model_training
+
+    s3 = limpieza.s3
+    s3.create_bucket(Bucket=BUCKET)
+    etapas = {}
+
+    with Medidor() as medidor:
+        # Mismo recorrido que la ingesta inicial de ingesta.ingest_data, sin lanzar la limpieza al final
+        cliente, ingeridas = ingesta.get_client(), 0
+        for numero, pagina in enumerate(ingesta.ingesta_inicial(cliente, page_size=tam_pagina)):
+            pagina.columns = pagina.columns.str.strip().str.lower()
+            ingesta.guardar_ingesta(BUCKET, f"ingesta/inicial/inspecciones-historicas-bench-parte-{numero:05d}.parquet", pagina)
+            ingeridas += len(pagina)
+    etapas["ingesta"] = dict(medidor.resultado, filas=ingeridas, almacenado_mb=megabytes(s3, "ingesta/"))
+
+    with Medidor() as medidor:
+        limpias = limpieza.procesar_archivos(BUCKET, ["ingesta/inicial"])
+    etapas["limpieza"] = dict(medidor.resultado, filas=limpias, almacenado_mb=megabytes(s3, "datos_limpios/"))
+
+    with Medidor() as medidor:
+        puntero = compactacion.compactar(s3, BUCKET)
+    etapas["compactacion"] = dict(medidor.resultado, filas=puntero["filas"], almacenado_mb=megabytes(s3, "datos_actuales/"))
+
+    with Medidor() as medidor:
+        datos = compactacion.leer_actual(s3, BUCKET, columnas=["inspection_date", "results", "risk"])
+        indicadores.resumir_particion(datos)
+        del datos
+    inicio = time.perf_counter()
+    indicadores.cargar_kpis(s3, BUCKET, puntero)
+    etapas["kpis"] = dict(medidor.resultado, filas=puntero["filas"],
+                          materializados_segundos=round(time.perf_counter() - inicio, 4))
+
+    with Medidor() as medidor:
+        codificador = run_model_training.actualizar_caracteristicas()
+    etapas["caracteristicas"] = dict(medidor.resultado, columnas=len(codificador.nombres()),
+                                     almacenado_mb=megabytes(s3, "caracteristicas/"))
+
+    for etapa in etapas.values():
+        if etapa.get("filas"):
+            etapa["filas_por_segundo"] = round(etapa["filas"] / etapa["segundos"], 1)
+    return {"filas": filas, "etapas": etapas,
+            "total_segundos": round(sum(e["segundos"] for e in etapas.values()), 3),
+            "rss_pico_mb": max(e["rss_pico_mb"] for e in etapas.values())}
+
+
+# Función para reservar un puerto libre para el S3 local
+def puerto_libre():
+    with socket.socket() as conexion:
+        conexion.bind(("127.0.0.1", 0))
+        return conexion.getsockname()[1]
+
+
+# Función para ejecutar un tamaño con sus servicios locales en procesos aparte
+def ejecutar_tamano(filas, args):
+    puerto_s3 = puerto_libre()
+    s3_local = subprocess.Popen([sys.executable, "-m", "moto.server", "-p", str(puerto_s3)],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    socrata = subprocess.Popen([sys.executable, os.path.join(BENCHMARKS, "socrata_local.py"), "--filas", str(filas),
+                                "--latencia-ms", str(args.latencia_ms)], stdout=subprocess.PIPE, text=True)
+    try:
+        puerto_socrata = int(socrata.stdout.readline())
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", puerto_s3), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        entorno = dict(os.environ, AWS_ENDPOINT_URL=f"http://127.0.0.1:{puerto_s3}", AWS_ACCESS_KEY_ID="bench",
+                       AWS_SECRET_ACCESS_KEY="bench", AWS_DEFAULT_REGION="us-east-1", S3_BUCKET_NAME=BUCKET,
+                       SOCRATA_DOMAIN=f"http://127.0.0.1:{puerto_socrata}")
+        with tempfile.TemporaryDirectory() as directorio:
+            # El directorio temporal recoge los logs y archivos locales de los scripts
+            salida = subprocess.run([sys.executable, os.path.abspath(__file__), "--ejecutar", str(filas),
+                                     "--tam-pagina", str(args.tam_pagina)],
+                                    env=entorno, cwd=directorio, capture_output=True, text=True)
+        if salida.returncode != 0:
+            raise RuntimeError(f"El benchmark de {filas} filas falló:\n{salida.stderr[-4000:]}")
+        return json.loads(salida.stdout.strip().splitlines()[-1])
+    finally:
+        socrata.terminate()
+        s3_local.terminate()
+
+
+# Función para identificar el commit medido
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo del pipeline")
+    parser.add_argument("--filas", type=int, nargs="+", default=[100000, 1000000, 10000000])
+    parser.add_argument("--tam-pagina", type=int, default=50000)
+    parser.add_argument("--latencia-ms", type=float, default=0, help="Latencia simulada de cada petición a Socrata.")
+    parser.add_argument("--salida", help="Archivo JSONL al que se añade el resultado.")
+    parser.add_argument("--ejecutar", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.ejecutar:
+        print(json.dumps(ejecutar_etapas(args.ejecutar, args.tam_pagina)))
+        return
+
+    resultado = {
+        "fecha": datetime.today().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "maquina": {"python": platform.python_version(), "sistema": platform.platform(), "nucleos": os.cpu_count()},
+        "parametros": {"tam_pagina": args.tam_pagina, "latencia_ms": args.latencia_ms},
+        "tamanos": [ejecutar_tamano(filas, args) for filas in args.filas],
+    }
+    print(json.dumps(resultado, indent=2))
+    if args.salida:
+        with open(args.salida, "a") as archivo:
+            archivo.write(json.dumps(resultado) + "\n")
+
+
+if __name__ == "__main__":
+    main()
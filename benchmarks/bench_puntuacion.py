@@ -0,0 +1,111 @@
+# Benchmark de la puntuación de riesgo: por lotes y en línea.
+#
+# Uso:
+#   python benchmarks/bench_puntuacion.py --filas 500000 --peticiones 2000
+#
+# Por lotes mide filas/s de modelo.puntuar_datos con distintos tamaños de bloque. En línea compara
+# la latencia (p50/p99) de una petición que descarga y carga el artefacto desde un S3 local (moto),
+# como haría un script, con la del modelo cargado una vez y mantenido en memoria, para peticiones
+# de 1 y de varios establecimientos. Escribe el resultado en JSON por la salida estándar.
+import os
+import sys
+import json
+import time
+import argparse
+import boto3
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "scripts"))
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+import caracteristicas
+import modelo
+from bench_limpieza import BUCKET, agregar_latencia, iniciar_s3_local, pagina_sintetica
+
+
+# Función para generar datos con los tipos del conjunto limpio
+def datos_sinteticos(filas, semilla=0):
+    df = pagina_sintetica(filas, semilla, 0)
+    df["inspection_id"] = df["inspection_id"].astype("int64")
+    df["license_"] = df["license_"].astype("int64")
+    df["inspection_date"] = pd.to_datetime(df["inspection_date"])
+    df["latitude"] = pd.to_numeric(df["latitude"])
+    df["longitude"] = pd.to_numeric(df["longitude"])
+    return df
+
+
+# Función para puntuar los establecimientos de una petición, como la vista de la API
+def puntuar_peticion(artefacto, filas):
+    preparados = caracteristicas.preparar(filas)
+    matriz, _ = artefacto["codificador"].transformar(preparados)
+    return artefacto["modelo"].predict_proba(matriz)[:, 1]
+
+
+# Función para medir la latencia de `peticiones` peticiones de `por_peticion` establecimientos
+def medir_peticiones(datos, peticiones, por_peticion, obtener_artefacto, semilla=3):
+    rng = np.random.default_rng(semilla)
+    latencias = []
+    for _ in range(peticiones):
+        filas = datos.iloc[rng.integers(0, len(datos), por_peticion)]
+        inicio = time.perf_counter()
+        puntuar_peticion(obtener_artefacto(), filas)
+        latencias.append(time.perf_counter() - inicio)
+    return percentiles(latencias)
+
+
+# Función para resumir latencias en milisegundos
+def percentiles(latencias):
+    latencias = np.asarray(latencias) * 1000
+    return {"p50_ms": round(float(np.percentile(latencias, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencias, 99)), 3),
+            "media_ms": round(float(latencias.mean()), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la puntuación de riesgo")
+    parser.add_argument("--filas", type=int, default=500000)
+    parser.add_argument("--filas-entrenamiento", type=int, default=100000)
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--peticiones-frias", type=int, default=100)
+    parser.add_argument("--bloques", type=int, nargs="+", default=[5000, 50000, 200000])
+    parser.add_argument("--por-peticion", type=int, nargs="+", default=[1, 100])
+    parser.add_argument("--latencia-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    servidor = iniciar_s3_local()
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket=BUCKET)
+    datos_entrenamiento = datos_sinteticos(args.filas_entrenamiento, semilla=1)
+    matriz, etiqueta, codificador, _ = caracteristicas.construir_caracteristicas(datos_entrenamiento)
+    modelo.guardar_modelo(s3, BUCKET, modelo.crear_modelo().fit(matriz, etiqueta), codificador)
+    agregar_latencia(s3, args.latencia_ms)
+    artefacto = modelo.cargar_modelo(s3, BUCKET)
+
+    datos = datos_sinteticos(args.filas, semilla=2)
+    resultados = {"parametros": vars(args), "lotes": {}, "en_linea": {}}
+
+    for tam_bloque in args.bloques:
+        inicio = time.perf_counter()
+        puntuaciones = modelo.puntuar_datos(datos, artefacto, tam_bloque)
+        segundos = time.perf_counter() - inicio
+        resultados["lotes"][str(tam_bloque)] = {
+            "segundos": round(segundos, 3),
+            "filas": len(puntuaciones),
+            "filas_por_segundo": round(len(puntuaciones) / segundos, 1),
+        }
+
+    for por_peticion in args.por_peticion:
+        resultados["en_linea"][str(por_peticion)] = {
+            "carga_por_peticion": medir_peticiones(datos, args.peticiones_frias, por_peticion,
+                                                   lambda: modelo.cargar_modelo(s3, BUCKET)),
+            "modelo_en_memoria": medir_peticiones(datos, args.peticiones, por_peticion, lambda: artefacto),
+        }
+
+    print(json.dumps(resultados, indent=2))
+    servidor.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Benchmark de los formatos de respuesta de la API (una respuesta con una tabla de ubicaciones).
+#
+# Uso:
+#   python benchmarks/bench_serializacion.py --filas 300000 --repeticiones 5
+#
+# Mide el tiempo de codificación y los bytes de cada renderer, sin comprimir y comprimidos
+# con gzip y brotli (si está instalado), y escribe el resultado en JSON por la salida estándar.
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "backend_webapp"))
+
+import django
+from django.conf import settings
+
+settings.configure(INSTALLED_APPS=["rest_framework"])
+django.setup()
+
+from rest_framework.renderers import JSONRenderer
+from apps.inspections.renderers import FastJSONRenderer, ColumnarJSONRenderer, ArrowRenderer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Función para generar una respuesta con los KPIs y una tabla de `filas` ubicaciones
+def respuesta_sintetica(filas, semilla=0):
+    rng = np.random.default_rng(semilla)
+    ubicaciones = pd.DataFrame({
+        "latitude": rng.uniform(41.64, 42.02, filas),
+        "longitude": rng.uniform(-87.94, -87.52, filas),
+        "inspection_date": pd.to_datetime("2010-01-01") + pd.to_timedelta(rng.integers(0, 5500, filas), unit="D"),
+    })
+    return {
+        "total_inspections": filas,
+        "passed_inspections": filas // 2,
+        "failed_inspections": filas // 5,
+        "inspections_by_month": {mes: filas // 12 for mes in range(1, 13)},
+        "risk_distribution": {"Risk 1 (High)": filas // 2, "Risk 2 (Medium)": filas // 3, "Risk 3 (Low)": filas // 6},
+        "inspection_locations": ubicaciones,
+    }
+
+
+# Función para medir el mejor tiempo de `funcion` en `repeticiones` ejecuciones
+def medir(funcion, repeticiones):
+    mejor, resultado = float("inf"), None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los formatos de respuesta de la API")
+    parser.add_argument("--filas", type=int, default=300000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    datos = respuesta_sintetica(args.filas)
+
+    # Línea base: lo que hacía la vista antes (registros de Python + JSONRenderer de DRF)
+    def base():
+        registros = dict(datos, inspection_locations=datos["inspection_locations"].to_dict(orient="records"))
+        return JSONRenderer().render(registros)
+
+    formatos = {
+        "drf_json_registros": base,
+        "json_registros": lambda: FastJSONRenderer().render(datos),
+        "json_columnas": lambda: ColumnarJSONRenderer().render(datos),
+        "arrow": lambda: ArrowRenderer().render(datos),
+    }
+
+    resultados = {"filas": args.filas, "brotli_disponible": brotli is not None, "formatos": {}}
+    for nombre, funcion in formatos.items():
+        segundos, cuerpo = medir(funcion, args.repeticiones)
+        fila = {"segundos": round(segundos, 4), "bytes": len(cuerpo)}
+        segundos_gzip, comprimido = medir(lambda: gzip.compress(cuerpo, compresslevel=6), 1)
+        fila.update(gzip_bytes=len(comprimido), gzip_segundos=round(segundos_gzip, 4))
+        if brotli is not None:
+            segundos_br, comprimido = medir(lambda: brotli.compress(cuerpo, quality=5), 1)
+            fila.update(brotli_bytes=len(comprimido), brotli_segundos=round(segundos_br, 4))
+        resultados["formatos"][nombre] = fila
+
+    base_segundos = resultados["formatos"]["drf_json_registros"]["segundos"]
+    for fila in resultados["formatos"].values():
+        fila["aceleracion"] = round(base_segundos / fila["segundos"], 2)
+
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
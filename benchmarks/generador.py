@@ -0,0 +1,204 @@
+# Generador de inspecciones sintéticas con el esquema de Socrata (dataset 4ijn-s7e5).
+#
+# Reproduce lo que afecta al rendimiento del pipeline: texto largo de `violations`, coordenadas
+# nulas, `facility_type` muy sesgado con una cola larga de valores raros, resultados que la
+# limpieza descarta y licencias con varias inspecciones. Todos los valores son texto, como los
+# devuelve la API.
+#
+# Las filas se generan por bloques de tamaño fijo con una semilla por bloque, así que cualquier
+# rango de inspection_id (una página de la API) se obtiene sin generar las anteriores y siempre
+# con el mismo contenido.
+import numpy as np
+import pandas as pd
+
+TAM_BLOQUE = 10000
+FECHA_INICIO = pd.Timestamp("2010-01-01")
+DIAS = 4748  # Hasta 2022-12-31: todo entra en la ingesta inicial
+
+TIPOS_ESTABLECIMIENTO = [
+    ("Restaurant", 0.67), ("Grocery Store", 0.13), ("School", 0.06), ("Children's Services Facility", 0.03),
+    ("Bakery", 0.02), ("Daycare (2 - 6 Years)", 0.02), ("Daycare Above and Under 2 Years", 0.015),
+    ("Long Term Care", 0.01), ("Catering", 0.008), ("Mobile Food Dispenser", 0.007), ("Liquor", 0.006),
+    ("Hospital", 0.005), ("Wholesale", 0.005), ("Golden Diner", 0.003),
+]
+PROBABILIDAD_TIPO_RARO = 0.01
+PROBABILIDAD_TIPO_NULO = 0.01
+RIESGOS = [("Risk 1 (High)", 0.71), ("Risk 2 (Medium)", 0.19), ("Risk 3 (Low)", 0.09), ("All", 0.005), (None, 0.005)]
+RESULTADOS = [("Pass", 0.52), ("Fail", 0.19), ("Pass w/ Conditions", 0.14), ("Out of Business", 0.09),
+              ("No Entry", 0.04), ("Not Ready", 0.01), ("Business Not Located", 0.01)]
+TIPOS_INSPECCION = [("Canvass", 0.52), ("License", 0.13), ("Canvass Re-Inspection", 0.11), ("Complaint", 0.09),
+                    ("License Re-Inspection", 0.05), ("Short Form Complaint", 0.04), ("Complaint Re-Inspection", 0.04),
+                    ("Suspected Food Poisoning", 0.01), ("Consultation", 0.01)]
+VIOLACIONES = [
+    "1. PERSON IN CHARGE PRESENT, DEMONSTRATES KNOWLEDGE, AND PERFORMS DUTIES",
+    "2. CITY OF CHICAGO FOOD SERVICE SANITATION CERTIFICATE",
+    "3. MANAGEMENT, FOOD EMPLOYEE AND CONDITIONAL EMPLOYEE; KNOWLEDGE, RESPONSIBILITIES AND REPORTING",
+    "5. PROCEDURES FOR RESPONDING TO VOMITING AND DIARRHEAL EVENTS",
+    "10. ADEQUATE HANDWASHING SINKS PROPERLY SUPPLIED AND ACCESSIBLE",
+    "16. FOOD-CONTACT SURFACES: CLEANED & SANITIZED",
+    "22. PROPER COLD HOLDING TEMPERATURES",
+    "33. PROPER COOLING METHODS USED; ADEQUATE EQUIPMENT FOR TEMPERATURE CONTROL",
+    "38. INSECTS, RODENTS, & ANIMALS NOT PRESENT",
+    "41. WIPING CLOTHS: PROPERLY USED & STORED",
+    "47. FOOD & NON-FOOD CONTACT SURFACES CLEANABLE, PROPERLY DESIGNED, CONSTRUCTED & USED",
+    "49. NON-FOOD/FOOD CONTACT SURFACES CLEAN",
+    "51. PLUMBING INSTALLED; PROPER BACKFLOW DEVICES",
+    "53. TOILET FACILITIES: PROPERLY CONSTRUCTED, SUPPLIED, & CLEANED",
+    "55. PHYSICAL FACILITIES INSTALLED, MAINTAINED & CLEAN",
+    "58. ALLERGEN TRAINING AS REQUIRED",
+]
+COMENTARIOS = [
+    "OBSERVED NO HAND WASHING SIGNAGE AT HAND SINK IN THE KITCHEN. INSTRUCTED TO PROVIDE.",
+    "OBSERVED ACCUMULATION OF GREASE AND FOOD DEBRIS ON THE INTERIOR OF THE DEEP FRYER CABINET. INSTRUCTED TO CLEAN AND MAINTAIN.",
+    "OBSERVED APPROXIMATELY 20 MICE DROPPINGS ON THE FLOOR ALONG THE WALLS IN THE REAR STORAGE AREA. INSTRUCTED TO CLEAN AND SANITIZE.",
+    "MUST PROVIDE PROOF OF CITY OF CHICAGO FOOD SANITATION CERTIFICATE FOR PERSON IN CHARGE. PRIORITY FOUNDATION VIOLATION 7-38-012.",
+    "OBSERVED TCS FOODS HELD AT IMPROPER TEMPERATURES IN THE PREP COOLER. PRODUCT DISCARDED. PRIORITY VIOLATION 7-38-005.",
+    "WATER LEAKING FROM THE PIPE UNDER THE THREE COMPARTMENT SINK. INSTRUCTED TO REPAIR.",
+    "OBSERVED DAMAGED CEILING TILES IN THE DINING AREA. INSTRUCTED TO REPLACE AND MAINTAIN.",
+]
+CODIGOS_POSTALES = [f"606{n:02d}" for n in range(1, 62)] + ["60707", "60827"]
+CALLES = ["N CLARK ST", "W MADISON ST", "S HALSTED ST", "N MILWAUKEE AVE", "W 63RD ST", "N BROADWAY", "S STATE ST",
+          "W CHICAGO AVE", "N LINCOLN AVE", "E 79TH ST", "W FULLERTON AVE", "S ASHLAND AVE"]
+PROBABILIDAD_COORDENADAS_NULAS = 0.03
+
+
+def _elegir(rng, opciones, filas):
+    valores = np.array([valor for valor, _ in opciones], dtype=object)
+    pesos = np.array([peso for _, peso in opciones])
+    return valores[rng.choice(len(valores), filas, p=pesos / pesos.sum())]
+
+
+# Función para generar el catálogo de establecimientos; cada licencia conserva sus datos entre inspecciones
+def establecimientos(cantidad, semilla=0):
+    rng = np.random.default_rng([semilla, 0])
+    tipos = _elegir(rng, TIPOS_ESTABLECIMIENTO, cantidad)
+    azar = rng.random(cantidad)
+    raros = azar < PROBABILIDAD_TIPO_RARO
+    tipos[raros] = np.char.add("FACILITY TYPE ", rng.integers(1, 500, raros.sum()).astype(str)).astype(object)
+    tipos[(azar >= PROBABILIDAD_TIPO_RARO) & (azar < PROBABILIDAD_TIPO_RARO + PROBABILIDAD_TIPO_NULO)] = None
+
+    latitud = rng.normal(41.85, 0.09, cantidad).clip(41.64, 42.02).round(9)
+    longitud = rng.normal(-87.68, 0.07, cantidad).clip(-87.94, -87.52).round(9)
+    nulas = rng.random(cantidad) < PROBABILIDAD_COORDENADAS_NULAS
+    numeros = rng.integers(1, 9999, cantidad).astype(str)
+    return pd.DataFrame({
+        "dba_name": np.char.add("ESTABLECIMIENTO ", np.arange(cantidad).astype(str)),
+        "license_": (np.arange(cantidad) + 1000000).astype(str),
+        "facility_type": tipos,
+        "risk": _elegir(rng, RIESGOS, cantidad),
+        "address": np.char.add(np.char.add(numeros, " "), np.array(CALLES)[rng.integers(0, len(CALLES), cantidad)]),
+        "zip": np.array(CODIGOS_POSTALES)[rng.integers(0, len(CODIGOS_POSTALES), cantidad)],
+        "latitude": np.where(nulas, None, latitud.astype(str)),
+        "longitude": np.where(nulas, None, longitud.astype(str)),
+    })
+
+
+# Función para generar un repertorio de textos de violaciones: entradas numeradas con comentarios, separadas por " | "
+def repertorio_violaciones(cantidad=4096, semilla=0):
+    rng = np.random.default_rng([semilla, 0, 1])
+    textos = np.empty(cantidad, dtype=object)
+    for i, n in enumerate(np.clip(rng.poisson(3.5, cantidad), 1, len(VIOLACIONES))):
+        codigos = sorted(rng.choice(len(VIOLACIONES), n, replace=False))
+        textos[i] = " | ".join(f"{VIOLACIONES[c]} - Comments: {COMENTARIOS[rng.integers(len(COMENTARIOS))]}" for c in codigos)
+    return textos
+
+
+# Función para asignar violaciones según el resultado: menos en las aprobadas y ninguna si no hubo inspección
+def violaciones(rng, resultados, repertorio):
+    textos = repertorio[rng.integers(0, len(repertorio), len(resultados))]
+    sin_violaciones = np.isin(resultados, ["Out of Business", "No Entry", "Business Not Located"])
+    sin_violaciones |= (resultados == "Pass") & (rng.random(len(resultados)) < 0.6)
+    textos[sin_violaciones] = None
+    return textos
+
+
+# Función para sortear el establecimiento, el resultado y la fecha de las inspecciones de un bloque
+def sortear_bloque(rng, total_establecimientos):
+    # Distribución sesgada: unos pocos establecimientos concentran muchas inspecciones
+    indices = np.minimum(rng.zipf(1.3, TAM_BLOQUE) - 1, total_establecimientos - 1)
+    indices = np.where(rng.random(TAM_BLOQUE) < 0.5, rng.integers(0, total_establecimientos, TAM_BLOQUE), indices)
+    resultados = _elegir(rng, RESULTADOS, TAM_BLOQUE)
+    fechas = FECHA_INICIO + pd.to_timedelta(rng.integers(0, DIAS, TAM_BLOQUE), unit="D")
+    return indices, resultados, fechas
+
+
+# Función para generar un bloque de TAM_BLOQUE inspecciones; el bloque `numero` siempre produce las mismas filas
+def generar_bloque(numero, catalogo, repertorio, semilla=0):
+    rng = np.random.default_rng([semilla, numero + 1])
+    indices, resultados, fechas = sortear_bloque(rng, len(catalogo))
+    bloque = catalogo.iloc[indices].reset_index(drop=True)
+    bloque.insert(0, "inspection_id", (np.arange(TAM_BLOQUE) + numero * TAM_BLOQUE + 1).astype(str))
+    bloque.insert(2, "aka_name", bloque["dba_name"])
+    bloque["city"] = "CHICAGO"
+    bloque["state"] = "IL"
+    bloque["inspection_date"] = fechas.strftime("%Y-%m-%dT00:00:00.000")
+    bloque["inspection_type"] = _elegir(rng, TIPOS_INSPECCION, TAM_BLOQUE)
+    bloque["results"] = resultados
+    bloque["violations"] = violaciones(rng, resultados, repertorio)
+    return bloque[["inspection_id", "dba_name", "aka_name", "license_", "facility_type", "risk", "address", "city",
+                   "state", "zip", "inspection_date", "inspection_type", "results", "violations", "latitude", "longitude"]]
+
+
+class GeneradorInspecciones:
+    """
+    Conjunto sintético de `filas` inspecciones que se puede leer por rangos de inspection_id.
+
+    Attributes:
+        filas (int): Total de inspecciones del conjunto.
+        semilla (int): Semilla del catálogo y de los bloques.
+        catalogo (pd.DataFrame): Establecimientos, aproximadamente uno por cada ocho inspecciones.
+        repertorio (np.ndarray): Textos de violaciones entre los que se elige para cada inspección.
+    """
+
+    def __init__(self, filas, semilla=0):
+        self.filas = filas
+        self.semilla = semilla
+        self.catalogo = establecimientos(max(filas // 8, 10), semilla)
+        self.repertorio = repertorio_violaciones(semilla=semilla)
+        self._bloque = (None, None)
+
+    # Método para obtener las filas [inicio, inicio + cantidad) en orden de inspection_id
+    def rango(self, inicio, cantidad):
+        fin = min(inicio + cantidad, self.filas)
+        partes = []
+        for numero in range(inicio // TAM_BLOQUE, -(-fin // TAM_BLOQUE)):
+            # Se conserva el último bloque: las páginas consecutivas suelen compartirlo
+            actual = self._bloque
+            if actual[0] != numero:
+                actual = (numero, generar_bloque(numero, self.catalogo, self.repertorio, self.semilla))
+                self._bloque = actual
+            desde = max(inicio - numero * TAM_BLOQUE, 0)
+            hasta = min(fin - numero * TAM_BLOQUE, TAM_BLOQUE)
+            partes.append(actual[1].iloc[desde:hasta])
+        if not partes:
+            return generar_bloque(0, self.catalogo, self.repertorio, self.semilla).iloc[:0]
+        return pd.concat(partes, ignore_index=True)
+
+    # Método para obtener las filas en las posiciones dadas (inspection_id - 1), en ese orden
+    def tomar(self, posiciones):
+        posiciones = np.asarray(posiciones, dtype="int64")
+        if len(posiciones) and (np.diff(posiciones) == 1).all():
+            return self.rango(int(posiciones[0]), len(posiciones))
+        bloques = posiciones // TAM_BLOQUE
+        orden = np.argsort(bloques, kind="stable")
+        partes = [self.rango(int(numero) * TAM_BLOQUE, TAM_BLOQUE).iloc[posiciones[orden][bloques[orden] == numero]
+                                                                       - int(numero) * TAM_BLOQUE]
+                  for numero in np.unique(bloques)]
+        if not partes:
+            return self.rango(0, 0)
+        filas = pd.concat(partes, ignore_index=True)
+        return filas.iloc[np.argsort(orden, kind="stable")].reset_index(drop=True)
+
+    # Método para obtener inspection_id e inspection_date de todas las filas sin generar el resto de columnas
+    def claves(self):
+        fechas = [sortear_bloque(np.random.default_rng([self.semilla, numero + 1]), len(self.catalogo))[2].values
+                  for numero in range(-(-self.filas // TAM_BLOQUE))]
+        return pd.DataFrame({
+            "inspection_id": np.arange(1, self.filas + 1, dtype="int64"),
+            "inspection_date": np.concatenate(fechas)[:self.filas] if fechas else np.array([], dtype="datetime64[ns]"),
+        })
+
+    # Método para recorrer el conjunto completo en páginas
+    def paginas(self, tam_pagina):
+        for inicio in range(0, self.filas, tam_pagina):
+            yield self.rango(inicio, tam_pagina)
@@ -0,0 +1,167 @@
+# API de Socrata local para los benchmarks y las pruebas.
+#
+# Uso:
+#   python benchmarks/socrata_local.py --filas 1000000 [--puerto 8080] [--latencia-ms 50]
+#
+# Sirve /resource/4ijn-s7e5.json con el conjunto de generador.py y atiende lo que usan las dos
+# ingestas: count(*), páginas con $limit/$offset y los filtros $where y órdenes $order sobre
+# inspection_date e inspection_id (comparaciones, AND, OR y paréntesis). Sin $where y en orden de
+# inspection_id las páginas salen directamente del generador; con filtros u otro orden se evalúan
+# sobre las claves (id y fecha) de todas las filas, que se calculan una vez sin generar el resto de
+# columnas. Para las pruebas puede responder 503 a un número de peticiones y lleva la cuenta de las
+# peticiones y de las que estuvieron en curso a la vez. Escribe el puerto en la primera línea de la
+# salida estándar.
+import os
+import re
+import sys
+import time
+import json
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generador import GeneradorInspecciones
+
+_patron_literal = re.compile(r"'([^']*)'")
+_patron_igual = re.compile(r"(?<![<>!=])=(?!=)")
+
+
+# Función para evaluar un $where de SoQL sobre las claves; devuelve la máscara de filas que lo cumplen
+def filtrar_soql(claves, where):
+    literales = {}
+
+    def literal(coincidencia):
+        nombre = f"literal_{len(literales)}"
+        literales[nombre] = pd.Timestamp(coincidencia.group(1))
+        return f"@{nombre}"
+
+    expresion = _patron_literal.sub(literal, where)
+    expresion = _patron_igual.sub("==", expresion)
+    expresion = re.sub(r"\bAND\b", "and", re.sub(r"\bOR\b", "or", expresion, flags=re.I), flags=re.I)
+    return claves.eval(expresion, local_dict=literales).to_numpy(dtype=bool)
+
+
+class SocrataLocal:
+    """
+    Estado del endpoint local: el conjunto, los fallos pendientes y la cuenta de peticiones.
+
+    Attributes:
+        generador (GeneradorInspecciones): Conjunto servido.
+        latencia_ms (float): Espera añadida a cada petición.
+        fallos (int): Peticiones que aún se responderán con un 503.
+        peticiones (list): Parámetros de cada petición atendida, en orden de llegada.
+        en_curso (int): Peticiones en curso.
+        max_en_curso (int): Máximo de peticiones en curso a la vez.
+    """
+
+    def __init__(self, generador, latencia_ms=0, fallos=0):
+        self.generador = generador
+        self.latencia_ms = latencia_ms
+        self.fallos = fallos
+        self.peticiones = []
+        self.en_curso = 0
+        self.max_en_curso = 0
+        self._claves = None
+        self._candado = threading.Lock()
+
+    # Método para obtener las claves de todas las filas, calculadas una vez
+    def claves(self):
+        with self._candado:
+            if self._claves is None:
+                self._claves = self.generador.claves()
+            return self._claves
+
+    # Método para obtener las posiciones de las filas que cumplen `where`, en el orden de `order`
+    def posiciones(self, where=None, order=None):
+        columnas = [columna.strip().split()[0] for columna in (order or "inspection_id").split(",")]
+        if where is None and columnas == ["inspection_id"]:
+            return None
+        claves = self.claves()
+        posiciones = np.flatnonzero(filtrar_soql(claves, where)) if where else np.arange(len(claves))
+        if columnas != ["inspection_id"]:
+            # lexsort ordena por la última clave primero; inspection_id desempata siempre
+            ordenadas = claves.iloc[posiciones]
+            orden = np.lexsort([ordenadas["inspection_id"].to_numpy()] +
+                               [ordenadas[columna].to_numpy() for columna in reversed(columnas)])
+            posiciones = posiciones[orden]
+        return posiciones
+
+    # Método para responder a una consulta con el cuerpo JSON: el total de count(*) o una página de registros
+    def responder(self, parametros):
+        posiciones = self.posiciones(parametros.get("$where"), parametros.get("$order"))
+        if parametros.get("$select", "").startswith("count"):
+            total = self.generador.filas if posiciones is None else len(posiciones)
+            return json.dumps([{"total": str(total)}]).encode()
+        offset, limit = int(parametros.get("$offset", 0)), int(parametros.get("$limit", 1000))
+        if posiciones is None:
+            pagina = self.generador.rango(offset, limit)
+        else:
+            pagina = self.generador.tomar(posiciones[offset:offset + limit])
+        return pagina.to_json(orient="records").encode()
+
+    def _entrar(self, parametros):
+        with self._candado:
+            self.peticiones.append(parametros)
+            self.en_curso += 1
+            self.max_en_curso = max(self.max_en_curso, self.en_curso)
+            fallar = self.fallos > 0
+            self.fallos -= fallar
+        return fallar
+
+    def _salir(self):
+        with self._candado:
+            self.en_curso -= 1
+
+
+# Función para crear el manejador de peticiones sobre el estado del endpoint
+def crear_manejador(socrata):
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            parametros = {clave: valores[0] for clave, valores in parse_qs(urlparse(self.path).query).items()}
+            fallar = socrata._entrar(parametros)
+            try:
+                if socrata.latencia_ms:
+                    time.sleep(socrata.latencia_ms / 1000)
+                if fallar:
+                    estado, cuerpo = 503, json.dumps({"error": "servicio no disponible"}).encode()
+                else:
+                    estado, cuerpo = 200, socrata.responder(parametros)
+            finally:
+                socrata._salir()
+            self.send_response(estado)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+    return Manejador
+
+
+# Función para levantar el servidor en un hilo; devuelve el servidor y su puerto. El estado queda
+# en `servidor.socrata`
+def iniciar(filas, puerto=0, latencia_ms=0, semilla=0, fallos=0):
+    socrata = SocrataLocal(GeneradorInspecciones(filas, semilla), latencia_ms, fallos)
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), crear_manejador(socrata))
+    servidor.socrata = socrata
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, servidor.server_address[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API de Socrata local para los benchmarks")
+    parser.add_argument("--filas", type=int, required=True)
+    parser.add_argument("--puerto", type=int, default=0)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+    servidor, puerto = iniciar(args.filas, args.puerto, args.latencia_ms, args.semilla)
+    print(puerto, flush=True)
+    threading.Event().wait()
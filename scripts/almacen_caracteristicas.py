@@ -0,0 +1,124 @@
+import json
+import hashlib
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import almacenamiento
+import caracteristicas
+import compactacion
+
+# Almacén incremental de la matriz de diseño, por inspection_id.
+#
+# Las características se guardan en Parquet particionado por año-mes, una fila por inspección, con
+# las columnas de la matriz como float32 (ver caracteristicas.py). Cada ejecución solo recalcula las
+# particiones del conjunto actual que cambiaron desde la anterior, es decir, los meses que tocaron los
+# lotes nuevos; el resto se reutiliza. El almacén está versionado por el codificador: si se reajusta
+# el codificador, las características se escriben bajo un prefijo nuevo.
+#   caracteristicas/cod={hash}/manifiesto.json
+#   caracteristicas/cod={hash}/anio=YYYY/mes=MM/caracteristicas-{version}.parquet
+
+ruta_almacen = "caracteristicas"
+columnas_clave = ["inspection_id", "inspection_date", "etiqueta"]
+
+
+# Función para identificar un codificador por el contenido de sus vocabularios
+def hash_codificador(codificador):
+    contenido = json.dumps(codificador.a_dict(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:16]
+
+
+# Función para obtener el prefijo del almacén de un codificador
+def prefijo_almacen(codificador):
+    return f"{ruta_almacen}/cod={hash_codificador(codificador)}"
+
+
+# Función para cargar el manifiesto del almacén de un codificador
+def cargar_manifiesto_almacen(s3, bucket, codificador):
+    vacio = {"codificador": hash_codificador(codificador), "nombres": codificador.nombres(),
+             "version_datos": None, "particiones": {}, "actualizado": None}
+    return almacenamiento.leer_json(s3, bucket, f"{prefijo_almacen(codificador)}/manifiesto.json") or vacio
+
+
+# Función para construir la tabla de características de una partición del conjunto actual
+def tabla_caracteristicas(df, codificador):
+    matriz, etiqueta, _, preparados = caracteristicas.construir_caracteristicas(df, codificador)
+    tabla = pd.DataFrame(matriz.toarray(), columns=codificador.nombres())
+    tabla.insert(0, "inspection_id", df.loc[preparados.index, "inspection_id"].to_numpy())
+    tabla.insert(1, "inspection_date", df.loc[preparados.index, "inspection_date"].to_numpy())
+    tabla.insert(2, "etiqueta", etiqueta)
+    return tabla
+
+
+# Función principal: pone al día el almacén con las particiones que cambiaron en el conjunto actual
+def actualizar_almacen(s3, bucket, codificador):
+    puntero = compactacion.cargar_puntero(s3, bucket)
+    if not puntero:
+        logging.warning("No hay conjunto actual; el almacén de características no se actualiza.")
+        return None
+
+    prefijo = prefijo_almacen(codificador)
+    manifiesto = cargar_manifiesto_almacen(s3, bucket, codificador)
+    if manifiesto["version_datos"] == puntero["version"]:
+        logging.info(f"Almacén de características al día con la versión {puntero['version']}.")
+        return manifiesto
+
+    particiones = {}
+    pendientes = []
+    for particion, clave_datos in puntero["particiones"].items():
+        entrada = manifiesto["particiones"].get(particion)
+        if entrada and entrada["fuente"] == clave_datos:
+            particiones[particion] = entrada
+        else:
+            pendientes.append(particion)
+
+    logging.info(f"Calculando características de {len(pendientes)} particiones "
+                 f"({len(particiones)} reutilizadas, codificador {hash_codificador(codificador)}).")
+    filas = 0
+    for particion in pendientes:
+        clave_datos = puntero["particiones"][particion]
+        tabla = tabla_caracteristicas(almacenamiento.leer_objeto(s3, bucket, clave_datos), codificador)
+        anio, mes = map(int, particion.split("-"))
+        clave = almacenamiento.clave_particion(prefijo, anio, mes, f"caracteristicas-{puntero['version']}")
+        s3.put_object(Bucket=bucket, Key=clave, Body=almacenamiento.a_parquet(tabla))
+        particiones[particion] = {"fuente": clave_datos, "clave": clave, "filas": len(tabla)}
+        filas += len(tabla)
+
+    manifiesto.update({
+        "version_datos": puntero["version"],
+        "particiones": dict(sorted(particiones.items())),
+        "actualizado": datetime.today().isoformat(timespec="seconds"),
+    })
+    almacenamiento.escribir_json(s3, bucket, f"{prefijo}/manifiesto.json", manifiesto)
+    logging.info(f"Almacén de características actualizado: {filas} filas nuevas o modificadas.")
+    return manifiesto
+
+
+# Función para leer del almacén la matriz de un rango de fechas sin descargar el resto
+def leer_caracteristicas(s3, bucket, codificador, desde=None, hasta=None):
+    manifiesto = cargar_manifiesto_almacen(s3, bucket, codificador)
+    desde = pd.Timestamp(desde) if desde is not None else None
+    hasta = pd.Timestamp(hasta) if hasta is not None else None
+    filtros = []
+    if desde is not None:
+        filtros.append(("inspection_date", ">=", desde))
+    if hasta is not None:
+        filtros.append(("inspection_date", "<=", hasta))
+
+    tablas = []
+    for particion, entrada in manifiesto["particiones"].items():
+        if particion != "0000-00":
+            if desde is not None and particion < f"{desde.year:04d}-{desde.month:02d}":
+                continue
+            if hasta is not None and particion > f"{hasta.year:04d}-{hasta.month:02d}":
+                continue
+        tablas.append(almacenamiento.leer_objeto(s3, bucket, entrada["clave"], filtros=filtros or None))
+
+    nombres = manifiesto["nombres"]
+    if not tablas:
+        return sparse.csr_matrix((0, len(nombres)), dtype=np.float32), np.array([], dtype=np.int8), \
+            pd.DataFrame(columns=["inspection_id", "inspection_date"]), nombres
+    tabla = pd.concat(tablas, ignore_index=True)
+    matriz = sparse.csr_matrix(tabla[nombres].to_numpy(dtype=np.float32))
+    return matriz, tabla["etiqueta"].to_numpy(dtype=np.int8), tabla[["inspection_id", "inspection_date"]], nombres
@@ -0,0 +1,478 @@
+import io
+import os
+import json
+import hashlib
+import re
+import pickle
+import logging
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Capa de almacenamiento compartida por la ingesta y la limpieza.
+# Los DataFrames se guardan como Parquet comprimido, particionado por año y mes de inspección:
+#   {prefijo}/anio=YYYY/mes=MM/{nombre}.parquet
+# Las salidas de la limpieza son un único archivo por lote (ver EscritorLote); la compactación las reparte.
+# Los objetos .pkl antiguos siguen siendo legibles mediante el lector de compatibilidad.
+
+COMPRESION = "zstd"
+EXTENSIONES = (".parquet", ".pkl")
+
+# Tipos explícitos de las columnas del conjunto de inspecciones de Socrata
+ESQUEMA = {
+    "inspection_id": "Int64",
+    "dba_name": "string",
+    "aka_name": "string",
+    "license_": "string",
+    "facility_type": "string",
+    "risk": "string",
+    "address": "string",
+    "city": "string",
+    "state": "string",
+    "zip": "string",
+    "inspection_date": "datetime64[ns]",
+    "inspection_type": "string",
+    "results": "string",
+    "violations": "string",
+    "latitude": "float64",
+    "longitude": "float64",
+}
+
+# Esquema canónico de los datos limpios. Las columnas con pocos valores distintos son categóricas,
+# con vocabularios estables entre lotes (ver ampliar_vocabulario), y los números se reducen:
+# inspection_id cabe en 32 bits y float32 guarda las coordenadas con precisión por debajo del metro.
+# location_zip no viene de Socrata: es el ZIP del polígono en el que caen las coordenadas (ver zonas.py)
+COLUMNAS_CATEGORICAS = ["results", "risk", "facility_type", "inspection_type", "city", "state", "zip", "location_zip"]
+ESQUEMA_LIMPIO = {
+    **ESQUEMA,
+    **{columna: "category" for columna in COLUMNAS_CATEGORICAS},
+    "inspection_id": "Int32",
+    "latitude": "float32",
+    "longitude": "float32",
+}
+
+# Columnas que no se guardan: 'location' es un diccionario redundante con latitude/longitude
+COLUMNAS_DESCARTADAS = ["location"]
+
+_patron_particion = re.compile(r"anio=(\d{4})/mes=(\d{2})/")
+_candado_vocabularios = threading.Lock()
+
+
+# Función para aplicar los tipos explícitos del esquema a un DataFrame; las columnas que ya tienen
+# el tipo del esquema canónico se conservan
+def aplicar_tipos(df):
+    df = df.drop(columns=[c for c in COLUMNAS_DESCARTADAS if c in df.columns])
+    tipos = {}
+    for columna in df.columns:
+        tipo = ESQUEMA.get(columna, "string")
+        if str(df[columna].dtype) in (tipo, ESQUEMA_LIMPIO.get(columna)):
+            continue
+        if tipo == "Int64":
+            tipos[columna] = pd.to_numeric(df[columna], errors="coerce").astype("Int64")
+        elif tipo == "float64":
+            tipos[columna] = pd.to_numeric(df[columna], errors="coerce").astype("float64")
+        elif tipo.startswith("datetime64"):
+            tipos[columna] = pd.to_datetime(df[columna], errors="coerce")
+        elif not isinstance(df[columna].dtype, pd.CategoricalDtype):
+            tipos[columna] = df[columna].astype(tipo)
+    return df.assign(**tipos)
+
+
+# Función para añadir al vocabulario de una columna los valores que aún no tiene. Los valores
+# nuevos van al final, así que los códigos de los conocidos no cambian y el vocabulario de un lote
+# anterior es un prefijo del actual. Devuelve una copia del vocabulario ampliado
+def ampliar_vocabulario(vocabularios, columna, valores):
+    nuevos = {str(valor) for valor in valores if not pd.isna(valor)}
+    with _candado_vocabularios:
+        vocabulario = vocabularios.setdefault(columna, [])
+        vocabulario.extend(sorted(nuevos.difference(vocabulario)))
+        return list(vocabulario)
+
+
+# Función para comprobar en una sola pasada que todas las columnas tienen el tipo del esquema canónico
+def validar_esquema(df):
+    esperados = pd.Series({columna: ESQUEMA_LIMPIO.get(columna, "string") for columna in df.columns}, dtype=object)
+    erroneas = esperados[df.dtypes.astype(str) != esperados]
+    if not erroneas.empty:
+        detalle = ", ".join(f"{columna} ({df[columna].dtype}, se espera {tipo})" for columna, tipo in erroneas.items())
+        raise ValueError(f"El DataFrame no cumple el esquema canónico: {detalle}")
+    return df
+
+
+# Función para aplicar el esquema canónico de los datos limpios. `vocabularios` ({columna: [valores]})
+# se amplía con los valores nuevos de las columnas categóricas
+def aplicar_esquema(df, vocabularios):
+    df = aplicar_tipos(df)
+    tipos = {}
+    for columna in df.columns:
+        tipo = ESQUEMA_LIMPIO.get(columna)
+        serie = df[columna]
+        if tipo == "category":
+            categorica = isinstance(serie.dtype, pd.CategoricalDtype)
+            categorias = ampliar_vocabulario(vocabularios, columna,
+                                             serie.cat.categories if categorica else serie.dropna().unique())
+            if not categorica:
+                tipos[columna] = pd.Categorical(serie, categories=categorias)
+            elif serie.cat.categories.tolist() != categorias:
+                tipos[columna] = serie.cat.set_categories(categorias)
+        elif tipo is not None and str(serie.dtype) != tipo:
+            try:
+                tipos[columna] = serie.astype(tipo)
+            except (TypeError, ValueError, OverflowError) as e:
+                raise ValueError(f"La columna {columna} no cabe en el tipo {tipo}: {e}")
+    return validar_esquema(df.assign(**tipos))
+
+
+# Función para concatenar DataFrames sin perder las columnas categóricas: pandas las convierte en
+# texto si las categorías difieren, así que antes se unen. Con vocabularios estables, el más
+# reciente contiene a los demás y los códigos no cambian
+def concatenar(marcos):
+    marcos = list(marcos)
+    categoricas = {columna for marco in marcos for columna, tipo in marco.dtypes.items()
+                   if isinstance(tipo, pd.CategoricalDtype)}
+    for columna in categoricas:
+        categorias = pd.Index([], dtype=object)
+        for marco in marcos:
+            if columna in marco.columns:
+                serie = marco[columna]
+                valores = serie.cat.categories if isinstance(serie.dtype, pd.CategoricalDtype) \
+                    else pd.Index(serie.dropna().unique())
+                categorias = categorias.append(valores[~valores.isin(categorias)])
+        for i, marco in enumerate(marcos):
+            if columna not in marco.columns:
+                continue
+            serie = marco[columna]
+            if not isinstance(serie.dtype, pd.CategoricalDtype):
+                marcos[i] = marco.assign(**{columna: pd.Categorical(serie, categories=categorias)})
+            elif not serie.cat.categories.equals(categorias):
+                marcos[i] = marco.assign(**{columna: serie.cat.set_categories(categorias)})
+    return pd.concat(marcos, ignore_index=True)
+
+
+# Función para serializar un DataFrame a Parquet comprimido en memoria
+def a_parquet(df):
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, engine="pyarrow", compression=COMPRESION, index=False)
+    return buffer.getvalue()
+
+
+# Función para obtener el identificador de una versión nueva (prefijo v= de las publicaciones): la marca
+# de tiempo lleva microsegundos y un sufijo aleatorio, así que dos publicaciones en el mismo segundo no
+# comparten prefijo y el orden alfabético sigue siendo el cronológico
+def nueva_version():
+    return f"{datetime.today().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+
+# Función para obtener la clave de S3 de una partición
+def clave_particion(prefijo, anio, mes, nombre):
+    return f"{prefijo}/anio={anio:04d}/mes={mes:02d}/{nombre}.parquet"
+
+
+# Función para obtener (año, mes) a partir de la clave de un objeto particionado
+def particion_de_clave(clave):
+    coincidencia = _patron_particion.search(clave)
+    if not coincidencia:
+        return None
+    return int(coincidencia.group(1)), int(coincidencia.group(2))
+
+
+# Función para dividir un DataFrame por año y mes de inspección; las fechas nulas van a la partición 0000/00
+def particionar(df, columna="inspection_date"):
+    fechas = pd.to_datetime(df[columna], errors="coerce")
+    anios = fechas.dt.year.fillna(0).astype(int)
+    meses = fechas.dt.month.fillna(0).astype(int)
+    for (anio, mes), grupo in df.groupby([anios, meses], sort=True):
+        yield (int(anio), int(mes)), grupo
+
+
+# Función para escribir un DataFrame en S3 como un único objeto Parquet; devuelve el objeto
+# con los mismos campos que un listado (Key, ETag, Size)
+def escribir_objeto(s3, bucket, clave, df):
+    cuerpo = a_parquet(aplicar_tipos(df))
+    respuesta = s3.put_object(Bucket=bucket, Key=clave, Body=cuerpo)
+    logging.info(f"{len(df)} filas guardadas en {bucket}/{clave}")
+    return {"Key": clave, "ETag": respuesta["ETag"], "Size": len(cuerpo)}
+
+
+# Función para listar todos los objetos bajo un prefijo, siguiendo la paginación de list_objects_v2
+def listar_objetos(s3, bucket, prefijo, extensiones=EXTENSIONES):
+    paginador = s3.get_paginator("list_objects_v2")
+    for pagina in paginador.paginate(Bucket=bucket, Prefix=prefijo):
+        for obj in pagina.get("Contents", []):
+            if obj["Key"].endswith(extensiones):
+                yield obj
+
+
+class ArchivoS3(io.RawIOBase):
+    """Objeto de S3 de solo lectura con acceso aleatorio mediante peticiones Range.
+
+    Permite que pyarrow lea únicamente el pie del archivo y las columnas solicitadas.
+    """
+
+    def __init__(self, s3, bucket, clave, tamano=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.clave = clave
+        self.tamano = tamano if tamano is not None else s3.head_object(Bucket=bucket, Key=clave)["ContentLength"]
+        self.posicion = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.posicion
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.posicion
+        elif whence == io.SEEK_END:
+            offset += self.tamano
+        self.posicion = max(0, min(offset, self.tamano))
+        return self.posicion
+
+    def readinto(self, buffer):
+        fin = min(self.posicion + len(buffer), self.tamano)
+        if fin <= self.posicion:
+            return 0
+        rango = f"bytes={self.posicion}-{fin - 1}"
+        datos = self.s3.get_object(Bucket=self.bucket, Key=self.clave, Range=rango)["Body"].read()
+        buffer[:len(datos)] = datos
+        self.posicion += len(datos)
+        return len(datos)
+
+
+# Función para aplicar filtros en formato pyarrow ([(columna, operador, valor), ...]) sobre un DataFrame
+def filtrar(df, filtros):
+    operadores = {
+        "=": lambda s, v: s == v, "==": lambda s, v: s == v, "!=": lambda s, v: s != v,
+        "<": lambda s, v: s < v, "<=": lambda s, v: s <= v,
+        ">": lambda s, v: s > v, ">=": lambda s, v: s >= v,
+        "in": lambda s, v: s.isin(v), "not in": lambda s, v: ~s.isin(v),
+    }
+    for columna, operador, valor in filtros or []:
+        df = df[operadores[operador](df[columna], valor)]
+    return df
+
+
+# Función para leer un objeto de S3 con proyección de columnas y filtros; admite .pkl por compatibilidad
+# Las columnas pedidas que el objeto no tiene se omiten, p. ej. location_zip en particiones anteriores a las zonas
+def leer_objeto(s3, bucket, clave, columnas=None, filtros=None, tamano=None):
+    if clave.endswith(".pkl"):
+        body = s3.get_object(Bucket=bucket, Key=clave)["Body"].read()
+        df = filtrar(aplicar_tipos(pd.DataFrame(pickle.loads(body))), filtros)
+        return df[[c for c in columnas if c in df.columns]] if columnas is not None else df
+
+    if columnas is None and not filtros:
+        body = s3.get_object(Bucket=bucket, Key=clave)["Body"].read()
+        return pq.read_table(pa.BufferReader(body)).to_pandas()
+
+    # Con proyección o filtros solo se descargan los bloques de columnas necesarios
+    with ArchivoS3(s3, bucket, clave, tamano) as archivo:
+        fuente = pa.PythonFile(archivo, mode="r")
+        if columnas is not None:
+            columnas = [c for c in columnas if c in pq.read_schema(fuente).names]
+        tabla = pq.read_table(fuente, columns=columnas, filters=filtros)
+    return tabla.to_pandas()
+
+
+# Función para leer las particiones {"YYYY-MM": clave} de una versión; las que quedan fuera de
+# [desde, hasta] ni se descargan. Es el lector común del pipeline y de la API
+def leer_particiones(s3, bucket, particiones, columnas=None, filtros=None, desde=None, hasta=None):
+    filtros = list(filtros or [])
+    if desde is not None:
+        desde = pd.Timestamp(desde)
+        filtros.append(("inspection_date", ">=", desde))
+    if hasta is not None:
+        hasta = pd.Timestamp(hasta)
+        filtros.append(("inspection_date", "<=", hasta))
+
+    marcos = []
+    for particion, clave in particiones.items():
+        if particion != "0000-00":
+            if desde is not None and particion < f"{desde.year:04d}-{desde.month:02d}":
+                continue
+            if hasta is not None and particion > f"{hasta.year:04d}-{hasta.month:02d}":
+                continue
+        marcos.append(leer_objeto(s3, bucket, clave, columnas, filtros or None))
+
+    if not marcos:
+        return pd.DataFrame(columns=columnas)
+    return concatenar(marcos)
+
+
+# Función para descargar un objeto a un archivo temporal sin cargarlo en memoria
+def descargar_a_temporal(s3, bucket, clave, directorio=None):
+    sufijo = ".pkl" if clave.endswith(".pkl") else ".parquet"
+    descriptor, ruta = tempfile.mkstemp(suffix=sufijo, dir=directorio)
+    os.close(descriptor)
+    try:
+        s3.download_file(bucket, clave, ruta)
+    except BaseException:
+        # Una descarga fallida no deja el temporal a medias en el disco
+        os.remove(ruta)
+        raise
+    return ruta
+
+
+# Función para leer un archivo local por bloques de filas; los .pkl se cargan completos y se trocean
+def leer_bloques(ruta, tam_bloque, columnas=None):
+    if ruta.endswith(".pkl"):
+        with open(ruta, "rb") as archivo:
+            df = aplicar_tipos(pd.DataFrame(pickle.load(archivo)))
+        if columnas is not None:
+            df = df[[c for c in columnas if c in df.columns]]
+        for inicio in range(0, len(df), tam_bloque):
+            yield df.iloc[inicio:inicio + tam_bloque]
+        return
+
+    archivo = pq.ParquetFile(ruta)
+    if columnas is not None:
+        columnas = [c for c in columnas if c in archivo.schema_arrow.names]
+    for lote in archivo.iter_batches(batch_size=tam_bloque, columns=columnas):
+        yield lote.to_pandas()
+
+
+# Función para leer un objeto de S3 por bloques; en Parquet solo se descargan las columnas pedidas
+def leer_bloques_s3(s3, bucket, clave, tam_bloque, columnas=None, tamano=None):
+    if clave.endswith(".pkl"):
+        ruta = descargar_a_temporal(s3, bucket, clave)
+        try:
+            yield from leer_bloques(ruta, tam_bloque, columnas)
+        finally:
+            os.remove(ruta)
+        return
+
+    with ArchivoS3(s3, bucket, clave, tamano) as objeto:
+        archivo = pq.ParquetFile(pa.PythonFile(objeto, mode="r"))
+        if columnas is not None:
+            columnas = [c for c in columnas if c in archivo.schema_arrow.names]
+        for lote in archivo.iter_batches(batch_size=tam_bloque, columns=columnas):
+            yield lote.to_pandas()
+
+
+# Función para contar los nulos por columna de un archivo local; en Parquet se leen de los metadatos
+def contar_nulos(ruta):
+    if ruta.endswith(".pkl"):
+        with open(ruta, "rb") as archivo:
+            return pd.DataFrame(pickle.load(archivo)).isnull().sum()
+    metadatos = pq.ParquetFile(ruta).metadata
+    nulos = pd.Series(0, index=metadatos.schema.to_arrow_schema().names)
+    for i in range(metadatos.num_row_groups):
+        grupo = metadatos.row_group(i)
+        for j in range(grupo.num_columns):
+            columna = grupo.column(j)
+            if columna.statistics is not None and columna.statistics.has_null_count:
+                nulos[columna.path_in_schema] += columna.statistics.null_count
+    return nulos
+
+
+# Esquema de Arrow de un DataFrame con el índice de los diccionarios fijo en int32. pandas ensancha los
+# códigos de una categórica (int8 -> int16) al pasar de 127 categorías, así que el esquema tomado del
+# primer bloque no admitiría los siguientes si el vocabulario crece durante la escritura
+def esquema_arrow(df):
+    esquema = pa.Schema.from_pandas(df, preserve_index=False)
+    campos = [campo.with_type(pa.dictionary(pa.int32(), pa.string())) if pa.types.is_dictionary(campo.type)
+              else campo for campo in esquema]
+    return pa.schema(campos, metadata=esquema.metadata)
+
+
+class EscritorParticionado:
+    """Escribe bloques de un DataFrame en archivos Parquet locales, uno por partición año/mes.
+
+    Cada partición mantiene un ParquetWriter abierto, así que solo el bloque actual vive en memoria.
+    """
+
+    def __init__(self, directorio=None):
+        self.directorio = tempfile.mkdtemp(dir=directorio)
+        self.escritores = {}
+        self.rutas = {}
+        self.filas = 0
+        self.esquema = None
+
+    def escribir(self, df):
+        df = aplicar_tipos(df)
+        for (anio, mes), grupo in particionar(df):
+            escritor = self.escritores.get((anio, mes))
+            if escritor is None:
+                tabla = pa.Table.from_pandas(grupo, schema=esquema_arrow(grupo), preserve_index=False)
+                ruta = os.path.join(self.directorio, f"{anio:04d}-{mes:02d}.parquet")
+                escritor = pq.ParquetWriter(ruta, tabla.schema, compression=COMPRESION)
+                self.esquema = self.esquema or tabla.schema
+                self.escritores[(anio, mes)] = escritor
+                self.rutas[(anio, mes)] = ruta
+            else:
+                tabla = pa.Table.from_pandas(grupo, schema=escritor.schema, preserve_index=False)
+            escritor.write_table(tabla)
+            self.filas += len(grupo)
+
+    def cerrar(self):
+        for escritor in self.escritores.values():
+            escritor.close()
+        self.escritores = {}
+        return self.rutas
+
+
+class EscritorLote:
+    """Escribe bloques de un DataFrame en un único archivo Parquet local, un row group por bloque.
+
+    Es la salida de la limpieza: un archivo por lote, sin trocearlo por partición, para no
+    multiplicar objetos pequeños. La compactación lo reparte por año y mes.
+    """
+
+    def __init__(self, directorio=None):
+        self.directorio = tempfile.mkdtemp(dir=directorio)
+        self.ruta = os.path.join(self.directorio, "datos.parquet")
+        self.escritor = None
+        self.filas = 0
+        self.esquema = None
+
+    def escribir(self, df):
+        df = aplicar_tipos(df)
+        if df.empty:
+            return
+        if self.escritor is None:
+            self.esquema = esquema_arrow(df)
+            self.escritor = pq.ParquetWriter(self.ruta, self.esquema, compression=COMPRESION)
+        self.escritor.write_table(pa.Table.from_pandas(df, schema=self.esquema, preserve_index=False))
+        self.filas += len(df)
+
+    def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+            self.escritor = None
+        return self.ruta if self.filas else None
+
+
+# Función para leer completo un archivo Parquet local
+def leer_local(ruta, columnas=None):
+    return pq.read_table(ruta, columns=columnas).to_pandas()
+
+
+# Función para obtener un hash estable de un esquema de Arrow (nombres y tipos, sin metadatos)
+def hash_esquema(esquema):
+    if esquema is None:
+        return None
+    firma = ";".join(f"{campo.name}:{campo.type}" for campo in esquema.remove_metadata())
+    return hashlib.sha256(firma.encode()).hexdigest()[:16]
+
+
+# Función para leer un objeto JSON de S3; devuelve None si no existe
+def leer_json(s3, bucket, clave):
+    try:
+        body = s3.get_object(Bucket=bucket, Key=clave)["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)
+
+
+# Función para escribir un objeto JSON en S3 con un único PUT, que S3 aplica de forma atómica
+def escribir_json(s3, bucket, clave, contenido):
+    cuerpo = json.dumps(contenido, ensure_ascii=False, indent=1, default=str).encode("utf-8")
+    return s3.put_object(Bucket=bucket, Key=clave, Body=cuerpo, ContentType="application/json")
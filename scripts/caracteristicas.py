@@ -0,0 +1,208 @@
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import almacenamiento
+
+# Ingeniería de características para el modelo, extraída de notebooks/feature_engineering.ipynb.
+#
+# Todas las transformaciones son vectorizadas. Las reglas de texto (resultados, riesgo, tipo de
+# establecimiento) se aplican sobre las categorías y no fila a fila. El codificador guarda los
+# vocabularios aprendidos (los 20 tipos de establecimiento más frecuentes y las categorías de
+# cada variable), así que cada lote nuevo se transforma sin volver a ajustar sobre todo el
+# historial. La salida es una matriz dispersa CSR con los mismos nombres de columna que el
+# ColumnTransformer del notebook.
+
+resultados_excluidos = ['Business Not Located', 'No Entry', 'Out of Business']
+resultados_aprobados = ['Pass', 'Pass w/ Conditions']
+mapa_riesgo = {
+    'Risk 1 (High)': 'high',
+    'Risk 2 (Medium)': 'medium',
+    'Risk 3 (Low)': 'low',
+    'All': 'all',
+}
+# Patrones de tipo de establecimiento, en el orden en que los aplica el notebook
+patrones_establecimiento = [
+    ('.*Daycare.*', 'daycare'),
+    ('.*Restaurant.*', 'restaurant'),
+    ('.*Mobile Food.*', 'mobile food'),
+]
+top_establecimientos = 20
+otro_establecimiento = 'other'
+
+columnas_categoricas = ['facility_type', 'risk']
+columnas_fecha = ['month', 'year', 'day_of_month', 'week_of_year', 'week_day', 'weekend', 'day_of_week']
+# Orden de las columnas de paso en la matriz del notebook ('results' es la etiqueta)
+columnas_paso = ['latitude', 'longitude', 'results'] + columnas_fecha
+
+codificador_file_name = 'modelos/caracteristicas/codificador.json'
+
+
+# Función para aplicar una transformación de texto sobre las categorías en lugar de sobre las filas
+def _por_categoria(serie, funcion):
+    categorica = serie.astype('category')
+    nuevas = pd.Series(funcion(pd.Series(categorica.cat.categories, dtype=object)), dtype=object).to_numpy()
+    codigos = categorica.cat.codes.to_numpy()
+    return pd.Series(np.where(codigos >= 0, nuevas[codigos], np.nan) if len(nuevas) else np.full(len(serie), np.nan),
+                     index=serie.index, dtype=object)
+
+
+# Función para quitar las inspecciones cuyo resultado no es una inspección real
+def filtrar_resultados(df):
+    return df[~df['results'].isin(resultados_excluidos)]
+
+
+# Función para reducir los resultados a pass/fail (todo lo que no es aprobado, incluido nulo, es fail)
+def transformar_resultados(serie):
+    return pd.Series(np.where(serie.isin(resultados_aprobados), 'pass', 'fail'), index=serie.index, dtype=object)
+
+
+# Función para simplificar las etiquetas de riesgo; los valores sin regla se conservan
+def transformar_riesgo(serie):
+    return _por_categoria(serie, lambda categorias: categorias.map(lambda valor: mapa_riesgo.get(valor, valor)))
+
+
+# Función para agrupar los tipos de establecimiento con los patrones del notebook
+def normalizar_establecimiento(serie):
+    def reglas(categorias):
+        texto = categorias.astype(str)
+        condiciones = [texto.str.contains(patron, regex=True) for patron, _ in patrones_establecimiento]
+        return np.select(condiciones, [valor for _, valor in patrones_establecimiento], default=None)
+
+    def aplicar(categorias):
+        reemplazos = reglas(categorias)
+        return np.where(pd.isna(reemplazos), categorias.to_numpy(), reemplazos)
+
+    return _por_categoria(serie, aplicar)
+
+
+# Función para calcular las variables de fecha del notebook
+def variables_fecha(fechas):
+    fechas = pd.to_datetime(fechas)
+    dia_semana = fechas.dt.dayofweek
+    return pd.DataFrame({
+        'month': fechas.dt.month,
+        'year': fechas.dt.year,
+        'day_of_month': fechas.dt.day,
+        'week_of_year': fechas.dt.isocalendar().week,
+        'week_day': (dia_semana < 5).astype('int64'),
+        'weekend': (dia_semana >= 5).astype('int64'),
+        'day_of_week': dia_semana,
+    }, index=fechas.index)
+
+
+# Función para aplicar todas las transformaciones de fila; el vocabulario se aplica aparte
+def preparar(df):
+    df = filtrar_resultados(df)
+    return pd.concat([
+        pd.DataFrame({
+            'facility_type': normalizar_establecimiento(df['facility_type']),
+            'risk': transformar_riesgo(df['risk']),
+            'latitude': df['latitude'],
+            'longitude': df['longitude'],
+            'results': transformar_resultados(df['results']),
+        }, index=df.index),
+        variables_fecha(df['inspection_date']),
+    ], axis=1)
+
+
+def _ordenar_categorias(valores):
+    # Mismo orden que OneHotEncoder: valores ordenados y el nulo al final
+    presentes = pd.Series(valores, dtype=object)
+    ordenados = sorted(presentes.dropna().unique().tolist())
+    return ordenados + [None] if presentes.isna().any() else ordenados
+
+
+class CodificadorCaracteristicas:
+    """
+    Vocabularios ajustados de las variables categóricas y codificación one-hot dispersa.
+
+    Attributes:
+        establecimientos (list): Tipos de establecimiento que conservan su nombre; el resto pasa a 'other'.
+        categorias (dict): Categorías de cada columna one-hot, en el orden de las columnas de salida.
+    """
+
+    def __init__(self, establecimientos=None, categorias=None):
+        self.establecimientos = establecimientos or []
+        self.categorias = categorias or {}
+
+    # Método para aprender los vocabularios a partir de datos ya preparados
+    def ajustar(self, preparados):
+        self.establecimientos = preparados['facility_type'].value_counts().nlargest(top_establecimientos).index.tolist()
+        agrupados = self.agrupar_establecimientos(preparados['facility_type'])
+        self.categorias = {
+            'facility_type': _ordenar_categorias(agrupados),
+            'risk': _ordenar_categorias(preparados['risk']),
+        }
+        return self
+
+    # Método para llevar a 'other' los tipos de establecimiento fuera del vocabulario
+    def agrupar_establecimientos(self, serie):
+        return pd.Series(np.where(serie.isin(self.establecimientos), serie, otro_establecimiento),
+                         index=serie.index, dtype=object)
+
+    # Método para obtener los nombres de las columnas de salida (como get_feature_names_out)
+    def nombres(self, incluir_resultados=False):
+        nombres = [f'{columna}__{columna}_{"nan" if categoria is None else categoria}'
+                   for columna in columnas_categoricas for categoria in self.categorias[columna]]
+        paso = columnas_paso if incluir_resultados else [c for c in columnas_paso if c != 'results']
+        return nombres + [f'remainder__{columna}' for columna in paso]
+
+    # Método para codificar una columna como bloque one-hot disperso; lo desconocido queda en cero
+    def _one_hot(self, serie, columna):
+        categorias = self.categorias[columna]
+        conocidas = [c for c in categorias if c is not None]
+        codigos = pd.Categorical(serie, categories=conocidas).codes.astype(np.int64)
+        if None in categorias:
+            codigos = np.where(serie.isna().to_numpy(), len(conocidas), codigos)
+        filas = np.flatnonzero(codigos >= 0)
+        return sparse.csr_matrix(
+            (np.ones(len(filas), dtype=np.float32), (filas, codigos[filas])),
+            shape=(len(serie), len(categorias)),
+        )
+
+    # Método para transformar datos preparados en (matriz dispersa, etiqueta 1 = fail)
+    def transformar(self, preparados):
+        preparados = preparados.assign(facility_type=self.agrupar_establecimientos(preparados['facility_type']))
+        numericas = [c for c in columnas_paso if c != 'results']
+        bloques = [self._one_hot(preparados[columna], columna) for columna in columnas_categoricas]
+        bloques.append(sparse.csr_matrix(preparados[numericas].to_numpy(dtype=np.float32, na_value=np.nan)))
+        matriz = sparse.hstack(bloques, format='csr', dtype=np.float32)
+        etiqueta = (preparados['results'] == 'fail').to_numpy(dtype=np.int8)
+        return matriz, etiqueta
+
+    # Método para reproducir exactamente la matriz de diseño del notebook (densa, con 'results')
+    def matriz_notebook(self, preparados):
+        preparados = preparados.assign(facility_type=self.agrupar_establecimientos(preparados['facility_type']))
+        one_hot = sparse.hstack([self._one_hot(preparados[c], c) for c in columnas_categoricas]).toarray()
+        valores = np.hstack([one_hot.astype(np.float64).astype(object), preparados[columnas_paso].to_numpy(dtype=object)])
+        return pd.DataFrame(valores, columns=self.nombres(incluir_resultados=True))
+
+    def a_dict(self):
+        return {'establecimientos': self.establecimientos, 'categorias': self.categorias}
+
+    @classmethod
+    def desde_dict(cls, contenido):
+        return cls(contenido['establecimientos'], contenido['categorias'])
+
+
+# Función para cargar el codificador guardado; None si aún no se ha ajustado
+def cargar_codificador(s3, bucket):
+    contenido = almacenamiento.leer_json(s3, bucket, codificador_file_name)
+    return CodificadorCaracteristicas.desde_dict(contenido) if contenido else None
+
+
+# Función para guardar el codificador ajustado
+def guardar_codificador(s3, bucket, codificador):
+    almacenamiento.escribir_json(s3, bucket, codificador_file_name, codificador.a_dict())
+    logging.info(f"Codificador guardado en {codificador_file_name}: {len(codificador.nombres())} columnas.")
+
+
+# Función principal: prepara un lote y lo codifica con el codificador dado (o ajusta uno nuevo)
+def construir_caracteristicas(df, codificador=None):
+    preparados = preparar(df)
+    if codificador is None:
+        codificador = CodificadorCaracteristicas().ajustar(preparados)
+    matriz, etiqueta = codificador.transformar(preparados)
+    return matriz, etiqueta, codificador, preparados
+
@@ -0,0 +1,213 @@
+import os
+import shutil
+import logging
+import tempfile
+from datetime import datetime
+import pandas as pd
+import almacenamiento
+import indicadores
+import fotogramas
+import historial
+import violaciones
+import zonas
+
+# Compactación de los lotes limpios en un único conjunto "actual", deduplicado por inspection_id.
+#
+# Cada versión reescribe solo las particiones afectadas por los lotes nuevos; las demás se
+# heredan de la versión anterior. El puntero se publica al final con una sola escritura, así
+# que los lectores siempre ven una versión completa:
+#   datos_actuales/ACTUAL.json                               -> puntero a la versión vigente
+#   datos_actuales/v={version}/anio=YYYY/mes=MM/datos.parquet -> particiones reescritas
+#   datos_actuales/v={version}/indice.parquet                 -> inspection_id -> partición
+#   datos_actuales/v={version}/kpis.json                      -> KPIs agregados (ver indicadores.py)
+#   datos_actuales/v={version}/fotogramas/anio=YYYY/mes=MM/   -> fotogramas del mapa (ver fotogramas.py)
+#   datos_actuales/v={version}/violaciones/anio=YYYY/mes=MM/  -> violaciones desglosadas (ver violaciones.py)
+#   datos_actuales/v={version}/historial.parquet              -> estado por establecimiento (ver historial.py)
+
+ruta_actual = "datos_actuales"
+tam_bloque = int(os.getenv("COMPACTACION_TAM_BLOQUE", "50000"))
+puntero_file_name = f"{ruta_actual}/ACTUAL.json"
+manifiesto_file_name = "datos_limpios/manifiesto.json"
+
+
+# Función para formatear una partición (año, mes) como texto "YYYY-MM"
+def nombre_particion(particion):
+    return f"{particion[0]:04d}-{particion[1]:02d}"
+
+
+# Función para cargar el puntero de la versión vigente; None si nunca se ha compactado
+def cargar_puntero(s3, bucket):
+    return almacenamiento.leer_json(s3, bucket, puntero_file_name)
+
+
+# Función para cargar el índice inspection_id -> partición de la versión vigente
+def cargar_indice(s3, bucket, puntero):
+    if not puntero or not puntero.get("indice"):
+        return pd.DataFrame({"inspection_id": pd.Series(dtype="Int64"), "particion": pd.Series(dtype="string")})
+    return almacenamiento.leer_objeto(s3, bucket, puntero["indice"])
+
+
+# Función para repartir por partición los lotes pendientes, en orden de limpieza: cada lote se
+# descarga una vez y se escribe por bloques en archivos locales, uno por partición. Devuelve el
+# escritor con las particiones en disco y los ids nuevos con su partición, también en orden de limpieza
+def repartir_lotes(s3, bucket, lotes, vocabularios, directorio):
+    escritor = almacenamiento.EscritorParticionado(directorio)
+    ids = []
+    try:
+        for _, entrada in sorted(lotes.items(), key=lambda item: item[1].get("limpiado") or ""):
+            for clave in entrada["claves"]:
+                ruta = almacenamiento.descargar_a_temporal(s3, bucket, clave, directorio)
+                for bloque in almacenamiento.leer_bloques(ruta, tam_bloque):
+                    # Mismas categorías en todos los bloques, para que cada partición tenga un solo esquema
+                    bloque = almacenamiento.aplicar_esquema(bloque, vocabularios)
+                    ids.extend(grupo[["inspection_id"]].assign(particion_nueva=nombre_particion(particion))
+                               for particion, grupo in almacenamiento.particionar(bloque))
+                    escritor.escribir(bloque)
+                os.remove(ruta)
+    finally:
+        escritor.cerrar()
+    if not ids:
+        # Lotes que solo tienen objetos vacíos
+        return escritor, pd.DataFrame({"inspection_id": pd.Series(dtype=almacenamiento.ESQUEMA_LIMPIO["inspection_id"]),
+                                       "particion_nueva": pd.Series(dtype="string")})
+    return escritor, pd.concat(ids, ignore_index=True)
+
+
+# Función para fusionar una partición: las filas nuevas sustituyen a las existentes con el mismo id
+# y las de `ids_salientes` (que ahora viven en otra partición) se quitan de ambas
+def fusionar_particion(existentes, nuevas, ids_salientes):
+    nuevas = nuevas.drop_duplicates(subset="inspection_id", keep="last")
+    nuevas = nuevas[~nuevas["inspection_id"].isin(ids_salientes)]
+    if existentes is not None:
+        reemplazados = existentes["inspection_id"].isin(nuevas["inspection_id"]) | \
+            existentes["inspection_id"].isin(ids_salientes)
+        nuevas = almacenamiento.concatenar([existentes[~reemplazados], nuevas])
+    return nuevas.sort_values(["inspection_date", "inspection_id"], ignore_index=True)
+
+
+# Función principal: incorpora al conjunto actual los lotes del manifiesto aún no compactados
+def compactar(s3, bucket):
+    manifiesto = almacenamiento.leer_json(s3, bucket, manifiesto_file_name) or {"archivos": {}}
+    # Las particiones reescritas usan el vocabulario del último lote limpio; los valores de
+    # particiones anteriores al esquema canónico que no estén en él se añaden solo en esta copia
+    vocabularios = {columna: list(valores) for columna, valores in (manifiesto.get("vocabularios") or {}).items()}
+    puntero = cargar_puntero(s3, bucket) or {"version": None, "particiones": {}, "indice": None,
+                                             "filas": 0, "lotes": []}
+    compactados = set(puntero["lotes"])
+    lotes = {etag: entrada for etag, entrada in manifiesto["archivos"].items()
+             if etag not in compactados and entrada.get("claves")}
+    if not lotes:
+        logging.info("No hay lotes limpios nuevos que compactar.")
+        return puntero
+
+    directorio = tempfile.mkdtemp()
+    try:
+        return publicar_version(s3, bucket, puntero, lotes, vocabularios, directorio)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+# Función para escribir y publicar una versión nueva; los lotes pendientes se reparten en `directorio`
+def publicar_version(s3, bucket, puntero, lotes, vocabularios, directorio):
+    compactados = set(puntero["lotes"])
+    version = almacenamiento.nueva_version()
+    prefijo = f"{ruta_actual}/v={version}"
+
+    # Primera pasada: los lotes se reparten por partición en disco y se reúnen sus ids, para detectar
+    # filas que cambian de partición. Van en orden de limpieza: si un id llega en varios lotes gana
+    # el último, aunque caigan en particiones distintas
+    escritor, ids_nuevos = repartir_lotes(s3, bucket, lotes, vocabularios, directorio)
+    nuevas_por_particion = {nombre_particion(particion): ruta for particion, ruta in escritor.rutas.items()}
+    logging.info(f"Compactando {len(lotes)} lotes en {len(nuevas_por_particion)} particiones (versión {version}).")
+    ganadores = ids_nuevos.drop_duplicates("inspection_id", keep="last")
+    cruce = ids_nuevos.merge(ganadores, on="inspection_id", suffixes=("", "_ganadora"))
+    perdedores = cruce.loc[cruce["particion_nueva"] != cruce["particion_nueva_ganadora"],
+                           ["inspection_id", "particion_nueva"]].rename(columns={"particion_nueva": "particion"})
+    ids_nuevos = ganadores
+
+    # Salen de su partición las filas que ya estaban en otra y las copias perdedoras de los lotes nuevos
+    indice = cargar_indice(s3, bucket, puntero)
+    cruce = indice.merge(ids_nuevos, on="inspection_id", how="inner")
+    salientes = pd.concat([cruce.loc[cruce["particion"] != cruce["particion_nueva"], ["inspection_id", "particion"]],
+                           perdedores], ignore_index=True)
+    salientes_por_particion = salientes.groupby("particion")["inspection_id"].apply(list).to_dict()
+    ids_existentes = cruce["inspection_id"]
+    afectadas = sorted(set(nuevas_por_particion) | set(salientes_por_particion))
+
+    # Segunda pasada: reescribir cada partición afectada, de una en una para acotar la memoria
+    particiones = dict(puntero["particiones"])
+    resumenes = {}
+    nuevos_fotogramas = {}
+    nuevas_violaciones = {}
+    filas_historial = []
+    filas_historial_anteriores = []
+    for particion in afectadas:
+        clave_existente = particiones.get(particion)
+        existentes = almacenamiento.leer_objeto(s3, bucket, clave_existente) if clave_existente else None
+        ruta_nuevas = nuevas_por_particion.get(particion)
+        nuevas = almacenamiento.leer_local(ruta_nuevas) if ruta_nuevas else existentes.iloc[0:0]
+        salientes_particion = salientes_por_particion.get(particion, [])
+        filas_historial.append(nuevas.loc[~nuevas["inspection_id"].isin(salientes_particion), historial.columnas_historial])
+        # Filas previas de los ids que vuelven a llegar: si cambian, su licencia se reconstruye en el historial
+        if existentes is not None:
+            filas_historial_anteriores.append(
+                existentes.loc[existentes["inspection_id"].isin(ids_existentes), historial.columnas_historial])
+        fusion = fusionar_particion(existentes, nuevas, salientes_particion)
+        # Las filas de particiones anteriores a las zonas reciben la suya al reescribirse
+        fusion = zonas.completar_zonas(fusion, zonas.cargar_indice_zonas())
+        fusion = almacenamiento.aplicar_esquema(fusion, vocabularios)
+        if fusion.empty:
+            particiones.pop(particion, None)
+            resumenes[particion] = None
+            nuevos_fotogramas[particion] = None
+            nuevas_violaciones[particion] = None
+            continue
+        resumenes[particion] = indicadores.resumir_particion(fusion)
+        nuevos_fotogramas[particion] = fotogramas.resumir_fotogramas(fusion)
+        nuevas_violaciones[particion] = violaciones.desglosar(fusion)
+        anio, mes = map(int, particion.split("-"))
+        clave = almacenamiento.clave_particion(prefijo, anio, mes, "datos")
+        s3.put_object(Bucket=bucket, Key=clave, Body=almacenamiento.a_parquet(fusion))
+        particiones[particion] = clave
+
+    # Índice actualizado: los ids nuevos apuntan a su partición nueva
+    indice = pd.concat([
+        indice[~indice["inspection_id"].isin(ids_nuevos["inspection_id"])],
+        ids_nuevos.rename(columns={"particion_nueva": "particion"}),
+    ], ignore_index=True)
+    clave_indice = f"{prefijo}/indice.parquet"
+    s3.put_object(Bucket=bucket, Key=clave_indice, Body=almacenamiento.a_parquet(indice))
+
+    # KPIs: solo se recalculan las particiones reescritas
+    clave_kpis = indicadores.actualizar_kpis(s3, bucket, puntero, particiones, resumenes, prefijo, version)
+    claves_fotogramas = fotogramas.actualizar_fotogramas(s3, bucket, puntero, particiones, nuevos_fotogramas, prefijo)
+    claves_violaciones = violaciones.actualizar_violaciones(s3, bucket, puntero, particiones, nuevas_violaciones, prefijo)
+    clave_historial = historial.actualizar_historial(s3, bucket, puntero, particiones, filas_historial, prefijo,
+                                                     filas_historial_anteriores)
+
+    # Publicación del puntero: último paso, con una sola escritura
+    puntero = {
+        "version": version,
+        "version_anterior": puntero["version"],
+        "particiones": dict(sorted(particiones.items())),
+        "particiones_reescritas": afectadas,
+        "indice": clave_indice,
+        "kpis": clave_kpis,
+        "fotogramas": claves_fotogramas,
+        "violaciones": claves_violaciones,
+        "historial": clave_historial,
+        "filas": len(indice),
+        "lotes": sorted(compactados | set(lotes)),
+        "actualizado": datetime.today().isoformat(timespec="seconds"),
+    }
+    almacenamiento.escribir_json(s3, bucket, puntero_file_name, puntero)
+    logging.info(f"Versión {version} publicada: {len(indice)} inspecciones, {len(afectadas)} particiones reescritas.")
+    return puntero
+
+
+# Función para leer el conjunto actual completo o un rango de fechas
+def leer_actual(s3, bucket, columnas=None, filtros=None, desde=None, hasta=None):
+    puntero = cargar_puntero(s3, bucket)
+    if not puntero:
+        return pd.DataFrame(columns=columnas)
+    return almacenamiento.leer_particiones(s3, bucket, puntero["particiones"], columnas, filtros, desde, hasta)
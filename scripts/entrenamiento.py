@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import shutil
+import logging
+import resource
+import numpy as np
+from scipy import sparse
+from joblib import Parallel, delayed
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import ParameterGrid, TimeSeriesSplit
+import almacen_caracteristicas
+import modelo
+
+# Búsqueda de hiperparámetros en paralelo y reanudable.
+#
+# La matriz de diseño se descarga del almacén una sola vez por versión de datos y se guarda en
+# disco como arrays .npy, que los procesos de trabajo abren en modo memmap sin copiarla. Los
+# pliegues de validación cruzada (temporales) se preprocesan una vez y también quedan en disco,
+# así cada ensayo solo ajusta el clasificador. Cada ensayo terminado se añade a ensayos.jsonl:
+# si la ejecución falla, la siguiente retoma los pendientes.
+#   {ruta_cache}/cod={hash}/datos={version}/
+#       matriz/  etiqueta.npy  fechas.npy  completo
+#       pliegue=N/entrenamiento/  pliegue=N/validacion/  pliegue=N/etiquetas.npz
+#       ensayos.jsonl
+
+ruta_cache = os.getenv("ENTRENAMIENTO_CACHE", "/tmp/entrenamiento")
+trabajos_entrenamiento = int(os.getenv("ENTRENAMIENTO_TRABAJOS", "-1"))
+espacio_busqueda = {
+    "C": [0.01, 0.1, 1.0, 10.0],
+    "class_weight": [None, "balanced"],
+}
+fraccion_validacion = 0.2
+
+
+# Función para obtener el pico de memoria residente del proceso en MB
+def memoria_pico_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Función para guardar una matriz CSR como tres arrays .npy
+def guardar_csr(directorio, matriz):
+    os.makedirs(directorio, exist_ok=True)
+    for nombre in ("data", "indices", "indptr"):
+        np.save(os.path.join(directorio, f"{nombre}.npy"), getattr(matriz, nombre))
+    with open(os.path.join(directorio, "forma.json"), "w") as archivo:
+        json.dump(list(matriz.shape), archivo)
+
+
+# Función para abrir una matriz CSR guardada sin leerla a memoria
+def cargar_csr(directorio):
+    with open(os.path.join(directorio, "forma.json")) as archivo:
+        forma = tuple(json.load(archivo))
+    partes = [np.load(os.path.join(directorio, f"{nombre}.npy"), mmap_mode="r") for nombre in ("data", "indices", "indptr")]
+    return sparse.csr_matrix(tuple(partes), shape=forma, copy=False)
+
+
+# Función para obtener el directorio de caché de la versión actual del almacén
+def directorio_cache(s3, bucket, codificador):
+    manifiesto = almacen_caracteristicas.cargar_manifiesto_almacen(s3, bucket, codificador)
+    return os.path.join(ruta_cache, f"cod={manifiesto['codificador']}", f"datos={manifiesto['version_datos']}")
+
+
+# Función para tener la matriz de diseño en disco, ordenada por fecha; solo se descarga si cambió la versión
+def cachear_caracteristicas(s3, bucket, codificador):
+    directorio = directorio_cache(s3, bucket, codificador)
+    if not os.path.exists(os.path.join(directorio, "completo")):
+        # Las versiones anteriores ya no se van a usar
+        shutil.rmtree(os.path.dirname(directorio), ignore_errors=True)
+        matriz, etiqueta, ids, _ = almacen_caracteristicas.leer_caracteristicas(s3, bucket, codificador)
+        orden = np.argsort(ids["inspection_date"].to_numpy(), kind="stable")
+        guardar_csr(os.path.join(directorio, "matriz"), matriz[orden])
+        np.save(os.path.join(directorio, "etiqueta.npy"), etiqueta[orden])
+        np.save(os.path.join(directorio, "fechas.npy"), ids["inspection_date"].to_numpy()[orden])
+        open(os.path.join(directorio, "completo"), "w").close()
+        logging.info(f"Matriz de diseño guardada en {directorio}: {matriz.shape[0]} filas.")
+    else:
+        logging.info(f"Matriz de diseño reutilizada desde {directorio}.")
+    return (cargar_csr(os.path.join(directorio, "matriz")),
+            np.load(os.path.join(directorio, "etiqueta.npy"), mmap_mode="r"),
+            directorio)
+
+
+# Función para preprocesar un pliegue y guardarlo; el preprocesado no depende de los hiperparámetros
+def preparar_pliegue(directorio, numero, entrenamiento, validacion):
+    destino = os.path.join(directorio, f"pliegue={numero}")
+    if os.path.exists(os.path.join(destino, "etiquetas.npz")):
+        return destino
+    matriz = cargar_csr(os.path.join(directorio, "matriz"))
+    etiqueta = np.load(os.path.join(directorio, "etiqueta.npy"), mmap_mode="r")
+    preprocesado = modelo.crear_preprocesado().fit(matriz[entrenamiento])
+    guardar_csr(os.path.join(destino, "entrenamiento"), sparse.csr_matrix(preprocesado.transform(matriz[entrenamiento])))
+    guardar_csr(os.path.join(destino, "validacion"), sparse.csr_matrix(preprocesado.transform(matriz[validacion])))
+    # Las etiquetas se escriben al final: su presencia marca el pliegue como completo
+    np.savez(os.path.join(destino, "etiquetas.npz"), entrenamiento=etiqueta[entrenamiento], validacion=etiqueta[validacion])
+    return destino
+
+
+# Función para preparar los pliegues temporales sobre las primeras `filas` inspecciones
+def preparar_pliegues(directorio, filas, pliegues, trabajos=None):
+    divisiones = TimeSeriesSplit(n_splits=pliegues).split(np.empty((filas, 1)))
+    return Parallel(n_jobs=trabajos or trabajos_entrenamiento)(
+        delayed(preparar_pliegue)(directorio, numero, entrenamiento, validacion)
+        for numero, (entrenamiento, validacion) in enumerate(divisiones)
+    )
+
+
+# Función para identificar una combinación de hiperparámetros en el registro de ensayos
+def clave_parametros(parametros):
+    return json.dumps(parametros, sort_keys=True)
+
+
+# Función para ajustar y evaluar una combinación en un pliegue; se ejecuta en un proceso de trabajo
+def evaluar(directorio_pliegue, parametros):
+    inicio = time.perf_counter()
+    etiquetas = np.load(os.path.join(directorio_pliegue, "etiquetas.npz"))
+    clasificador = modelo.crear_clasificador(**parametros).fit(
+        cargar_csr(os.path.join(directorio_pliegue, "entrenamiento")), etiquetas["entrenamiento"])
+    probabilidades = modelo.puntuar_matriz(clasificador, cargar_csr(os.path.join(directorio_pliegue, "validacion")))
+    return {
+        "parametros": parametros,
+        "pliegue": os.path.basename(directorio_pliegue),
+        "auc": float(roc_auc_score(etiquetas["validacion"], probabilidades)),
+        "segundos": round(time.perf_counter() - inicio, 3),
+        "memoria_pico_mb": round(memoria_pico_mb(), 1),
+    }
+
+
+# Función para leer los ensayos ya terminados; una última línea incompleta (corte a mitad de escritura) se ignora
+def cargar_ensayos(ruta):
+    ensayos = []
+    if os.path.exists(ruta):
+        with open(ruta) as archivo:
+            for linea in archivo:
+                try:
+                    ensayos.append(json.loads(linea))
+                except json.JSONDecodeError:
+                    break
+    return ensayos
+
+
+# Función principal de la búsqueda: evalúa en paralelo los ensayos pendientes y los registra al terminar cada uno
+def buscar(directorio, pliegues, trabajos=None, reiniciar=False):
+    ruta_ensayos = os.path.join(directorio, "ensayos.jsonl")
+    if reiniciar and os.path.exists(ruta_ensayos):
+        os.remove(ruta_ensayos)
+    ensayos = cargar_ensayos(ruta_ensayos)
+    hechos = {(clave_parametros(e["parametros"]), e["pliegue"]) for e in ensayos}
+    pendientes = [(pliegue, parametros) for parametros in ParameterGrid(espacio_busqueda) for pliegue in pliegues
+                  if (clave_parametros(parametros), os.path.basename(pliegue)) not in hechos]
+    logging.info(f"Búsqueda de hiperparámetros: {len(pendientes)} ensayos pendientes, {len(ensayos)} reanudados.")
+
+    reanudados = len(ensayos)
+    with open(ruta_ensayos, "w") as archivo:
+        # Se reescribe el registro sin la posible línea incompleta antes de seguir añadiendo
+        archivo.writelines(json.dumps(e) + "\n" for e in ensayos)
+        resultados = Parallel(n_jobs=trabajos or trabajos_entrenamiento, return_as="generator")(
+            delayed(evaluar)(pliegue, parametros) for pliegue, parametros in pendientes)
+        for ensayo in resultados:
+            archivo.write(json.dumps(ensayo) + "\n")
+            archivo.flush()
+            os.fsync(archivo.fileno())
+            ensayos.append(ensayo)
+
+    resumen = {}
+    for ensayo in ensayos:
+        resumen.setdefault(clave_parametros(ensayo["parametros"]), []).append(ensayo)
+    ranking = sorted((
+        {"parametros": grupo[0]["parametros"],
+         "auc_cv": float(np.mean([e["auc"] for e in grupo])),
+         "auc_cv_std": float(np.std([e["auc"] for e in grupo]))}
+        for grupo in resumen.values()
+    ), key=lambda fila: fila["auc_cv"], reverse=True)
+    return ranking, {
+        "ensayos": len(ensayos),
+        "ensayos_reanudados": reanudados,
+        "memoria_pico_trabajadores_mb": max((e["memoria_pico_mb"] for e in ensayos), default=0),
+    }
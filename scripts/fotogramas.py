@@ -0,0 +1,77 @@
+import logging
+import numpy as np
+import pandas as pd
+import almacenamiento
+
+# Fotogramas diarios del mapa: inspecciones agregadas por día y celda de una cuadrícula Web Mercator.
+#
+# Igual que los KPIs, se guardan por partición año-mes y cada compactación solo recalcula las
+# particiones que reescribe:
+#   datos_actuales/v={version}/fotogramas/anio=YYYY/mes=MM/fotogramas.parquet
+# con columnas fecha, celda_x, celda_y, total, aprobadas y reprobadas. El puntero los enlaza como
+# {"zoom", "celdas_por_lado", "particiones"}. La API agrupa los días en semanas cuando se le pide.
+
+# Zoom y celdas por tesela de la cuadrícula (las mismas convenciones que apps/inspections/spatial.py)
+zoom_fotogramas = 12
+celdas_por_tesela = 32
+celdas_por_lado = (2 ** zoom_fotogramas) * celdas_por_tesela
+max_latitud_mercator = 85.05112878
+
+columnas_fotogramas = ["inspection_date", "latitude", "longitude", "results"]
+
+
+# Función para calcular la celda (x, y) de la cuadrícula de cada coordenada
+def celdas(latitud, longitud):
+    lat = np.radians(np.clip(latitud, -max_latitud_mercator, max_latitud_mercator))
+    x = (longitud + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return (np.clip((x * celdas_por_lado).astype(np.int64), 0, celdas_por_lado - 1),
+            np.clip((y * celdas_por_lado).astype(np.int64), 0, celdas_por_lado - 1))
+
+
+# Función para calcular los fotogramas diarios de una partición del conjunto actual
+def resumir_fotogramas(df):
+    df = df.dropna(subset=["inspection_date", "latitude", "longitude"])
+    celda_x, celda_y = celdas(df["latitude"].to_numpy(dtype="float64"), df["longitude"].to_numpy(dtype="float64"))
+    resultados = df["results"].astype("string")
+    marco = pd.DataFrame({
+        "fecha": df["inspection_date"].dt.normalize().to_numpy(),
+        "celda_x": celda_x.astype("int32"),
+        "celda_y": celda_y.astype("int32"),
+        "total": np.ones(len(df), dtype="int32"),
+        "aprobadas": (resultados == "Pass").fillna(False).to_numpy(dtype="int32"),
+        "reprobadas": (resultados == "Fail").fillna(False).to_numpy(dtype="int32"),
+    })
+    return marco.groupby(["fecha", "celda_x", "celda_y"], as_index=False, sort=True).sum()
+
+
+# Función para escribir los fotogramas de una partición y devolver su clave
+def escribir_fotogramas(s3, bucket, prefijo, particion, fotogramas):
+    anio, mes = map(int, particion.split("-"))
+    clave = almacenamiento.clave_particion(f"{prefijo}/fotogramas", anio, mes, "fotogramas")
+    s3.put_object(Bucket=bucket, Key=clave, Body=almacenamiento.a_parquet(fotogramas))
+    return clave
+
+
+# Función para actualizar los fotogramas a partir de las particiones reescritas en una compactación.
+# `reescritas` asocia cada partición afectada con sus fotogramas nuevos (None si quedó vacía).
+def actualizar_fotogramas(s3, bucket, puntero_anterior, particiones, reescritas, prefijo):
+    claves = dict(((puntero_anterior or {}).get("fotogramas") or {}).get("particiones") or {})
+    for particion, fotogramas in reescritas.items():
+        claves.pop(particion, None)
+        if fotogramas is not None:
+            claves[particion] = escribir_fotogramas(s3, bucket, prefijo, particion, fotogramas)
+
+    # Versiones anteriores a los fotogramas: se calculan una vez las particiones heredadas
+    faltantes = [p for p in particiones if p not in claves and p not in reescritas]
+    if faltantes:
+        logging.info(f"Calculando fotogramas de {len(faltantes)} particiones sin fotogramas previos.")
+    for particion in faltantes:
+        df = almacenamiento.leer_objeto(s3, bucket, particiones[particion], columnas=columnas_fotogramas)
+        claves[particion] = escribir_fotogramas(s3, bucket, prefijo, particion, resumir_fotogramas(df))
+
+    return {
+        "zoom": zoom_fotogramas,
+        "celdas_por_lado": celdas_por_lado,
+        "particiones": {p: claves[p] for p in sorted(claves) if p in particiones},
+    }
@@ -0,0 +1,183 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+import almacenamiento
+import caracteristicas
+
+# Historial por establecimiento: estado acumulado de cada licencia.
+#
+# Una fila por license_ con el número de inspecciones y de reprobadas, la primera y la última
+# inspección (fecha, id y resultado) y una tasa de reprobación móvil (media exponencial, la más
+# reciente pesa `alfa_reprobacion`). Solo cuentan las inspecciones reales (las mismas que usa el
+# modelo). Cada compactación pliega en el estado anterior las filas nuevas, sin recorrer el
+# historial completo. Las licencias de las filas que no encajan al final de su estado se
+# reconstruyen desde las particiones de la versión nueva: ids ya plegados que llegan corregidos
+# (otra licencia, fecha o resultado) e ids nuevos anteriores a la última inspección plegada:
+#   datos_actuales/v={version}/historial.parquet
+# El puntero enlaza la clave como "historial". Con el estado indexado por licencia, consultar
+# una licencia es una búsqueda en una tabla hash.
+
+alfa_reprobacion = float(os.getenv("HISTORIAL_ALFA", "0.3"))
+
+columnas_historial = ["license_", "inspection_id", "inspection_date", "results"]
+
+
+# Función para obtener un historial vacío con los tipos del estado
+def historial_vacio():
+    return pd.DataFrame({
+        "inspecciones": pd.Series(dtype="int64"),
+        "reprobadas": pd.Series(dtype="int64"),
+        "tasa_reprobacion": pd.Series(dtype="float64"),
+        "primera_fecha": pd.Series(dtype="datetime64[ns]"),
+        "ultima_fecha": pd.Series(dtype="datetime64[ns]"),
+        "ultimo_id": pd.Series(dtype="int64"),
+        "ultimo_resultado": pd.Series(dtype="string"),
+    }, index=pd.Index([], dtype="string", name="license_"))
+
+
+# Función para normalizar los tipos de las columnas del historial
+def normalizar(df):
+    return pd.DataFrame({
+        "license_": df["license_"].astype("string"),
+        "inspection_date": pd.to_datetime(df["inspection_date"]),
+        "inspection_id": df["inspection_id"].astype("int64"),
+        "results": df["results"].astype("string"),
+    }, index=df.index)
+
+
+# Función para obtener las inspecciones reales de un lote, con los tipos del historial y sin ids repetidos
+def inspecciones_reales(df):
+    df = caracteristicas.filtrar_resultados(df.dropna(subset=["license_", "inspection_date", "inspection_id"]))
+    return normalizar(df).drop_duplicates("inspection_id", keep="last")
+
+
+# Función para marcar las filas posteriores a la última inspección ya plegada de su licencia
+def posteriores(historial, df):
+    previas = historial.reindex(df["license_"])
+    fecha_previa = previas["ultima_fecha"].to_numpy()
+    id_previo = previas["ultimo_id"].to_numpy()
+    fechas, ids = df["inspection_date"].to_numpy(), df["inspection_id"].to_numpy()
+    return np.isnat(fecha_previa) | (fechas > fecha_previa) | ((fechas == fecha_previa) & (ids > id_previo))
+
+
+# Función para plegar un lote de inspecciones en el estado de las licencias.
+# La tasa sigue ewm(alpha, adjust=False): la primera inspección de una licencia la inicializa y
+# cada una posterior la actualiza como (1 - alfa) * tasa + alfa * reprobada. Para k inspecciones
+# nuevas eso equivale a (1 - alfa)^k * base + suma de alfa * (1 - alfa)^r * reprobada, con r la
+# posición contada desde la última, así que se calcula por grupos sin recorrer las filas.
+def plegar(historial, df, alfa=None):
+    alfa = alfa_reprobacion if alfa is None else alfa
+    df = inspecciones_reales(df)
+
+    # Solo las inspecciones posteriores a la última ya plegada de cada licencia
+    df = df[posteriores(historial, df)].sort_values(["license_", "inspection_date", "inspection_id"], ignore_index=True)
+    if df.empty:
+        return historial
+
+    reprobada = (caracteristicas.transformar_resultados(df["results"]) == "fail").to_numpy(dtype="float64")
+    grupos = df.groupby("license_", sort=False)
+    desde_final = grupos.cumcount(ascending=False).to_numpy()
+    lote = df.assign(reprobada=reprobada, peso=alfa * (1 - alfa) ** desde_final * reprobada).groupby(
+        "license_", sort=False).agg(
+        inspecciones=("inspection_id", "size"),
+        reprobadas=("reprobada", "sum"),
+        suma_pesos=("peso", "sum"),
+        primera_reprobada=("reprobada", "first"),
+        primera_fecha=("inspection_date", "first"),
+        ultima_fecha=("inspection_date", "last"),
+        ultimo_id=("inspection_id", "last"),
+        ultimo_resultado=("results", "last"),
+    )
+
+    anteriores = historial.reindex(lote.index)
+    existentes = anteriores["inspecciones"].notna().to_numpy()
+    base = np.where(existentes, anteriores["tasa_reprobacion"].to_numpy(dtype="float64"),
+                    lote["primera_reprobada"].to_numpy())
+    actualizadas = pd.DataFrame({
+        "inspecciones": anteriores["inspecciones"].fillna(0).astype("int64") + lote["inspecciones"],
+        "reprobadas": anteriores["reprobadas"].fillna(0).astype("int64") + lote["reprobadas"].astype("int64"),
+        "tasa_reprobacion": (1 - alfa) ** lote["inspecciones"].to_numpy() * base + lote["suma_pesos"].to_numpy(),
+        "primera_fecha": anteriores["primera_fecha"].where(existentes, lote["primera_fecha"]),
+        "ultima_fecha": lote["ultima_fecha"],
+        "ultimo_id": lote["ultimo_id"],
+        "ultimo_resultado": lote["ultimo_resultado"],
+    }, index=lote.index)
+    return pd.concat([historial[~historial.index.isin(actualizadas.index)], actualizadas]).astype(
+        historial_vacio().dtypes.to_dict())
+
+
+# Función para cargar el historial de una versión; None si la versión no lo tiene
+def cargar_historial(s3, bucket, puntero):
+    if not puntero or not puntero.get("historial"):
+        return None
+    historial = almacenamiento.leer_objeto(s3, bucket, puntero["historial"])
+    return historial.set_index(historial["license_"].astype("string")).drop(columns="license_")
+
+
+# Función para obtener las licencias que no se pueden plegar de forma incremental. `anteriores` son
+# las filas que ya estaban en el conjunto de los ids que llegan de nuevo y `nuevas` las filas nuevas:
+# cuentan las licencias (anterior y nueva) de los ids corregidos y las de los ids nuevos anteriores a
+# la última inspección plegada. Un id que llega otra vez sin cambios no obliga a reconstruir nada
+def licencias_a_reconstruir(historial, anteriores, nuevas):
+    anteriores, nuevas = normalizar(anteriores), normalizar(nuevas)
+    cruce = anteriores.merge(nuevas, on="inspection_id", how="left", suffixes=("", "_nueva"))
+    corregida = pd.Series(False, index=cruce.index)
+    for columna in ["license_", "inspection_date", "results"]:
+        anterior, nueva = cruce[columna], cruce[f"{columna}_nueva"]
+        corregida |= (anterior != nueva).fillna(True) & ~(anterior.isna() & nueva.isna())
+    corregidas = pd.concat([cruce.loc[corregida, "license_"], cruce.loc[corregida, "license__nueva"]])
+
+    ids_nuevos = inspecciones_reales(nuevas[~nuevas["inspection_id"].isin(anteriores["inspection_id"])])
+    tardias = ids_nuevos.loc[~posteriores(historial, ids_nuevos), "license_"]
+    return pd.Index(pd.concat([corregidas, tardias]).dropna().unique(), dtype="string")
+
+
+# Función para actualizar el historial con las filas nuevas de una compactación y devolver su clave.
+# `anteriores` son las filas previas de los ids que vuelven a llegar (ver licencias_a_reconstruir)
+def actualizar_historial(s3, bucket, puntero_anterior, particiones, nuevas, prefijo, anteriores=()):
+    historial = cargar_historial(s3, bucket, puntero_anterior)
+    if historial is None:
+        # Versiones anteriores al historial: se construye una vez desde el conjunto completo
+        logging.info(f"Construyendo el historial por establecimiento desde {len(particiones)} particiones.")
+        historial = historial_vacio()
+        nuevas = [almacenamiento.leer_objeto(s3, bucket, clave, columnas=columnas_historial)
+                  for clave in particiones.values()]
+    elif nuevas:
+        nuevas = [pd.concat(nuevas, ignore_index=True)]
+        anteriores = pd.concat(anteriores, ignore_index=True) if anteriores else nuevas[0].iloc[0:0]
+        reconstruir = licencias_a_reconstruir(historial, anteriores, nuevas[0])
+        if len(reconstruir):
+            # Las licencias afectadas se pliegan desde cero con todas sus filas de la versión nueva
+            logging.info(f"Reconstruyendo el historial de {len(reconstruir)} licencias con inspecciones corregidas "
+                         f"o tardías.")
+            historial = historial[~historial.index.isin(reconstruir)]
+            nuevas = [nuevas[0][~nuevas[0]["license_"].astype("string").isin(reconstruir)],
+                      almacenamiento.leer_particiones(s3, bucket, particiones, columnas_historial,
+                                                      [("license_", "in", reconstruir.tolist())])]
+    if nuevas:
+        historial = plegar(historial, almacenamiento.concatenar(nuevas))
+
+    clave = f"{prefijo}/historial.parquet"
+    s3.put_object(Bucket=bucket, Key=clave, Body=almacenamiento.a_parquet(historial.reset_index()))
+    logging.info(f"Historial guardado en {clave}: {len(historial)} licencias.")
+    return clave
+
+
+# Función para consultar el estado de una o varias licencias; las desconocidas quedan en nulo
+def consultar(historial, licencias):
+    return historial.reindex(pd.Index(licencias, dtype="string"))
+
+
+# Función para calcular las variables de historial de inspecciones posteriores al estado
+# (p. ej. para puntuar): lo acumulado por la licencia y los días desde su última inspección
+def variables_historial(df, historial):
+    estado = consultar(historial, df["license_"].astype("string"))
+    fechas = pd.to_datetime(df["inspection_date"]).to_numpy()
+    return pd.DataFrame({
+        "inspecciones_previas": estado["inspecciones"].fillna(0).to_numpy(dtype="int64"),
+        "reprobadas_previas": estado["reprobadas"].fillna(0).to_numpy(dtype="int64"),
+        "tasa_reprobacion": estado["tasa_reprobacion"].to_numpy(dtype="float64"),
+        "dias_desde_ultima": (fechas - estado["ultima_fecha"].to_numpy()) / np.timedelta64(1, "D"),
+        "ultimo_resultado": estado["ultimo_resultado"].to_numpy(),
+    }, index=df.index)
@@ -0,0 +1,60 @@
+import logging
+from datetime import datetime
+import almacenamiento
+
+# KPIs materializados del conjunto actual.
+#
+# Se guardan agregados por partición (año-mes), así que cada compactación solo recalcula las
+# particiones que reescribe y hereda el resto de la versión anterior; la API suma los agregados
+# sin leer filas:
+#   datos_actuales/v={version}/kpis.json
+#   {"version": ..., "particiones": {"YYYY-MM": {"total": n, "resultados": {...}, "riesgo": {...}}}}
+
+columnas_kpis = ["inspection_date", "results", "risk"]
+
+
+# Función para calcular los agregados de una partición del conjunto actual. Con columnas
+# categóricas value_counts incluye las categorías sin filas, que no se guardan
+def resumir_particion(df):
+    return {
+        "total": int(len(df)),
+        "resultados": {str(k): int(v) for k, v in df["results"].value_counts().items() if v},
+        "riesgo": {str(k): int(v) for k, v in df["risk"].value_counts().items() if v},
+    }
+
+
+# Función para cargar los KPIs de una versión; None si la versión no los tiene
+def cargar_kpis(s3, bucket, puntero):
+    if not puntero or not puntero.get("kpis"):
+        return None
+    return almacenamiento.leer_json(s3, bucket, puntero["kpis"])
+
+
+# Función para actualizar los KPIs a partir de las particiones reescritas en una compactación.
+# `reescritas` asocia cada partición afectada con su resumen nuevo (None si quedó vacía).
+def actualizar_kpis(s3, bucket, puntero_anterior, particiones, reescritas, prefijo, version):
+    anteriores = cargar_kpis(s3, bucket, puntero_anterior)
+    agregados = dict(anteriores["particiones"]) if anteriores else {}
+
+    for particion, resumen in reescritas.items():
+        if resumen is None:
+            agregados.pop(particion, None)
+        else:
+            agregados[particion] = resumen
+
+    # Versiones anteriores a la materialización: se calculan una vez las particiones heredadas
+    faltantes = [p for p in particiones if p not in agregados]
+    if faltantes:
+        logging.info(f"Calculando KPIs de {len(faltantes)} particiones sin agregados previos.")
+    for particion in faltantes:
+        df = almacenamiento.leer_objeto(s3, bucket, particiones[particion], columnas=columnas_kpis)
+        agregados[particion] = resumir_particion(df)
+
+    kpis = {
+        "version": version,
+        "particiones": {p: agregados[p] for p in sorted(particiones)},
+        "actualizado": datetime.today().isoformat(timespec="seconds"),
+    }
+    clave = f"{prefijo}/kpis.json"
+    almacenamiento.escribir_json(s3, bucket, clave, kpis)
+    return clave
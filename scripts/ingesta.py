@@ -5,15 +5,14 @@ import boto3
 from sodapy import Socrata
 from datetime import datetime
 import logging
-import subprocess
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import almacenamiento
+import metricas
+import limpieza
 
-# Configurar el logger para mostrar el tiempo, nivel, nombre de archivo y línea de cada mensaje
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s"
-)
-
-logging.info("Iniciando ejecución del script 'ingesta.py'.")
 # Variables de entorno y configuración
 s3_bucket = os.getenv("S3_BUCKET_NAME")
 socrata_username = os.getenv("SOCRATA_USERNAME")
@@ -22,46 +21,178 @@ socrata_app_token = os.getenv("SOCRATA_APP_TOKEN")
 aws_access_key_id = os.getenv("AWS_ACCESS_KEY_ID")
 aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY")
 
-# Archivo de estado para la última fecha procesada en S3
+# Dominio de Socrata; admite un prefijo http:// para apuntar a un endpoint local de pruebas
+socrata_domain = os.getenv("SOCRATA_DOMAIN", "data.cityofchicago.org")
+dataset_id = "4ijn-s7e5"
+
+# Parámetros de la extracción paginada
+tam_pagina = int(os.getenv("SOCRATA_PAGE_SIZE", "50000"))
+max_workers = int(os.getenv("SOCRATA_MAX_WORKERS", "4"))
+max_reintentos = int(os.getenv("SOCRATA_MAX_RETRIES", "5"))
+espera_base = float(os.getenv("SOCRATA_BACKOFF_SECONDS", "1.0"))
+
+# Filas ingeridas que se retienen en memoria para limpiarlas sin releerlas de S3; el resto del lote
+# (p. ej. una ingesta inicial completa) se limpia desde los objetos ya guardados
+max_filas_memoria = int(os.getenv("PIPELINE_MAX_FILAS_MEMORIA", "1000000"))
+
+# Archivo de estado con la marca de agua (inspection_date, inspection_id) de la última ingesta en S3
 estado_file_name = "estado/last_processed_date.pkl"
 
 # Función para obtener un cliente de la API de Socrata
 def get_client():
     logging.info("Creando cliente de Socrata para la API.")
-    return Socrata('data.cityofchicago.org', socrata_app_token, socrata_username, socrata_password)
+    # El pool de conexiones se dimensiona para las descargas concurrentes de páginas
+    prefijo = "http://" if socrata_domain.startswith("http://") else "https://"
+    adaptador = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    client = Socrata(
+        socrata_domain.replace(prefijo, "", 1),
+        socrata_app_token,
+        socrata_username,
+        socrata_password,
+        session_adapter={"prefix": prefijo, "adapter": adaptador},
+        timeout=60
+    )
+    # Bytes recibidos de la API, para las métricas de la ejecución
+    client.session.hooks["response"].append(
+        lambda respuesta, *args, **kwargs: metricas.contar("bytes", "socrata_descarga", len(respuesta.content)))
+    return client
 
 # Función para crear el recurso de S3
 def get_s3_resource():
     logging.info("Obteniendo recurso S3.")
-    return boto3.resource(
+    recurso = boto3.resource(
         "s3",
         aws_access_key_id=aws_access_key_id,
         aws_secret_access_key=aws_secret_access_key
     )
+    metricas.instrumentar_s3(recurso.meta.client)
+    return recurso
 
-# Función para subir datos al bucket de S3
+# Función para subir datos al bucket de S3 como Parquet; la partición por año y mes se hace al limpiar.
+# Devuelve el objeto guardado (Key, ETag, Size) para limpiarlo sin volver a listar el bucket
 def guardar_ingesta(bucket_name, ruta, data_frame):
     logging.info(f"Guardando datos en {bucket_name}/{ruta}")
     s3 = get_s3_resource()
-    pickle_data = pickle.dumps(data_frame)
-    s3.Object(bucket_name, ruta).put(Body=pickle_data)
+    objeto = almacenamiento.escribir_objeto(s3.meta.client, bucket_name, ruta, data_frame)
     logging.info(f"Datos guardados exitosamente en {bucket_name}/{ruta}")
+    return objeto
+
+# Función para ejecutar una petición a la API con reintentos y espera exponencial
+def con_reintentos(peticion, descripcion):
+    for intento in range(1, max_reintentos + 1):
+        try:
+            return peticion()
+        except Exception as e:
+            if intento == max_reintentos:
+                logging.error(f"Error definitivo al {descripcion}: {e}")
+                raise
+            metricas.contar("reintentos", "socrata")
+            espera = espera_base * 2 ** (intento - 1)
+            logging.warning(f"Error al {descripcion} (intento {intento}): {e}. Reintentando en {espera}s.")
+            time.sleep(espera)
+
+# Función para contar los registros que cumplen una condición
+def contar_registros(client, query):
+    resultado = con_reintentos(lambda: client.get(dataset_id, select="count(*) AS total", where=query),
+                               "contar los registros")
+    return int(resultado[0]["total"])
+
+# Función para descargar una página con reintentos y espera exponencial
+def obtener_pagina(client, query, offset, limit, order="inspection_id"):
+    registros = con_reintentos(lambda: client.get(dataset_id, where=query, order=order, limit=limit, offset=offset),
+                               f"descargar la página con offset {offset}")
+    logging.info(f"Página con offset {offset} descargada: {len(registros)} registros.")
+    metricas.contar("filas", "entrada", len(registros))
+    return registros
 
-# Función para la ingesta inicial
-def ingesta_inicial(client, limit=300000):
+# Función para extraer páginas concurrentemente y entregarlas en orden, una a una
+def extraer_paginas(client, query, page_size=None, workers=None):
+    page_size = page_size or tam_pagina
+    workers = workers or max_workers
+    total = contar_registros(client, query)
+    logging.info(f"{total} registros por extraer en páginas de {page_size} con {workers} workers.")
+
+    offsets = iter(range(0, total, page_size))
+    ultima_completa = False
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Como máximo 'workers' páginas en vuelo para acotar la memoria
+        pendientes = deque()
+        for offset in offsets:
+            pendientes.append(executor.submit(obtener_pagina, client, query, offset, page_size))
+            if len(pendientes) >= workers:
+                break
+        while pendientes:
+            registros = pendientes.popleft().result()
+            siguiente = next(offsets, None)
+            if siguiente is not None:
+                pendientes.append(executor.submit(obtener_pagina, client, query, siguiente, page_size))
+            ultima_completa = len(registros) == page_size
+            if registros:
+                yield pd.DataFrame.from_records(registros)
+
+    # Si el conjunto creció durante la extracción se continúa hasta recibir una página incompleta
+    offset = -(-total // page_size) * page_size
+    while ultima_completa:
+        registros = obtener_pagina(client, query, offset, page_size)
+        ultima_completa = len(registros) == page_size
+        if registros:
+            yield pd.DataFrame.from_records(registros)
+        offset += page_size
+
+# Función para la ingesta inicial; devuelve un generador de páginas
+def ingesta_inicial(client, page_size=None, workers=None):
     logging.info("Realizando la ingesta de datos inicial hasta el año 2022.")
     query = "inspection_date < '2023-01-01T00:00:00'"
-    results = client.get("4ijn-s7e5", where=query, limit=limit)
+    yield from extraer_paginas(client, query, page_size, workers)
     logging.info("Ingesta inicial completada.")
-    return pd.DataFrame.from_records(results)
 
-# Función para la ingesta consecutiva de datos
-def ingesta_consecutiva(client, fecha_inicio, limit=1000):
-    logging.info(f"Realizando ingesta incremental desde {fecha_inicio}.")
-    query = f"inspection_date > '{fecha_inicio}'"
-    results = client.get("4ijn-s7e5", where=query, limit=limit)
+# Función para obtener la marca de agua (inspection_date, inspection_id) más alta de una página
+def marca_de_agua(df):
+    fecha = df['inspection_date'].max()
+    ids = pd.to_numeric(df.loc[df['inspection_date'] == fecha, 'inspection_id'])
+    return {"inspection_date": fecha, "inspection_id": int(ids.max())}
+
+# Función para descartar filas que no son posteriores a la marca de agua ni repetidas en la página
+def descartar_frontera(df, marca):
+    df = df.drop_duplicates(subset='inspection_id')
+    if marca["inspection_id"] is None:
+        return df
+    ids = pd.to_numeric(df['inspection_id'])
+    posteriores = (df['inspection_date'] > marca["inspection_date"]) | (
+        (df['inspection_date'] == marca["inspection_date"]) & (ids > marca["inspection_id"])
+    )
+    descartadas = len(df) - int(posteriores.sum())
+    if descartadas:
+        logging.info(f"{descartadas} filas descartadas en la frontera de la marca de agua.")
+    return df[posteriores]
+
+# Función para la ingesta consecutiva; drena todas las páginas posteriores a la marca de agua
+def ingesta_consecutiva(client, marca, page_size=None):
+    page_size = page_size or tam_pagina
+    logging.info(f"Realizando ingesta incremental desde {marca}.")
+    while True:
+        fecha = marca["inspection_date"]
+        if marca["inspection_id"] is None:
+            # Estado heredado sin inspection_id: se releen las filas de la misma fecha
+            query = f"inspection_date >= '{fecha}'"
+        else:
+            query = (f"inspection_date > '{fecha}' OR "
+                     f"(inspection_date = '{fecha}' AND inspection_id > {marca['inspection_id']})")
+        registros = obtener_pagina(client, query, 0, page_size, order="inspection_date, inspection_id")
+        if not registros:
+            break
+
+        pagina = pd.DataFrame.from_records(registros)
+        pagina.columns = pagina.columns.str.strip().str.lower()
+        pagina = descartar_frontera(pagina, marca)
+        if pagina.empty:
+            break
+        marca = marca_de_agua(pagina)
+        yield pagina, marca
+
+        if len(registros) < page_size:
+            break
     logging.info("Ingesta consecutiva completada.")
-    return pd.DataFrame.from_records(results)
 
 # Función para verificar acceso a S3
 def verificar_acceso_s3(bucket_name):
@@ -75,74 +206,143 @@ def verificar_acceso_s3(bucket_name):
         logging.error(f"Error al acceder a S3: {e}")
         return False
 
-# Función para cargar la última fecha procesada desde el archivo de estado en S3
-def cargar_fecha_ultimo_proceso():
-    logging.info("Cargando la última fecha procesada desde el archivo de estado en S3.")
+# Función para cargar el estado de la última ingesta desde el archivo de estado en S3
+def cargar_estado_ingesta():
+    logging.info("Cargando el estado de la última ingesta desde el archivo de estado en S3.")
     s3 = get_s3_resource()
     try:
         obj = s3.Object(s3_bucket, estado_file_name)
         with obj.get()['Body'] as f:
-            fecha = pickle.load(f)
-            logging.info(f"Última fecha procesada cargada: {fecha}")
-            return fecha
+            estado = pickle.load(f)
     except s3.meta.client.exceptions.NoSuchKey:
         logging.warning("Archivo de estado no encontrado. Se realizará una ingesta completa.")
         return None
 
-# Función para guardar la última fecha procesada en el archivo de estado en S3
-def guardar_fecha_ultimo_proceso(fecha):
-    logging.info(f"Guardando la última fecha procesada: {fecha}")
+    # Los estados antiguos solo guardaban la fecha como texto
+    if isinstance(estado, str):
+        estado = {"inspection_date": estado, "inspection_id": None, "filas_ingeridas": None, "actualizado": None}
+    logging.info(f"Estado de la última ingesta cargado: {estado}")
+    return estado
+
+# Función para guardar el estado de la ingesta en el archivo de estado en S3
+def guardar_estado_ingesta(marca, filas_ingeridas, estado_anterior=None):
+    estado = {
+        "inspection_date": marca["inspection_date"],
+        "inspection_id": marca["inspection_id"],
+        "filas_ingeridas": (estado_anterior or {}).get("filas_ingeridas") or 0,
+        "actualizado": datetime.today().isoformat(timespec='seconds'),
+    }
+    estado["filas_ingeridas"] += filas_ingeridas
+    logging.info(f"Guardando el estado de la ingesta: {estado}")
     s3 = get_s3_resource()
-    pickle_data = pickle.dumps(fecha)
+    pickle_data = pickle.dumps(estado)
     s3.Object(s3_bucket, estado_file_name).put(Body=pickle_data)
-    logging.info(f"Fecha procesada actualizada exitosamente a {fecha}")
+    logging.info(f"Marca de agua actualizada exitosamente a {marca}")
+    return estado
 
-# Función principal para la ingesta y almacenamiento
+# Función principal para la ingesta y almacenamiento; cierra las métricas de la ejecución aunque falle
 def ingest_data():
+    metricas.iniciar("ingesta")
+    try:
+        estado = _ingerir()
+    except Exception:
+        metricas.finalizar(get_s3_resource().meta.client, s3_bucket, estado="error")
+        raise
+    metricas.finalizar(get_s3_resource().meta.client, s3_bucket, estado=estado)
+
+class LoteIngesta:
+    """
+    Páginas de una ejecución de la ingesta pendientes de limpieza.
+
+    Las páginas se retienen en memoria hasta alcanzar el límite de filas; a partir de ahí solo se
+    guarda el objeto de S3 de cada página.
+
+    Attributes:
+        max_filas (int): Máximo de filas retenidas en memoria.
+        en_memoria (list): Pares (objeto guardado, DataFrame) retenidos.
+        en_s3 (list): Objetos guardados cuyas páginas no se retuvieron.
+        filas (int): Filas retenidas en memoria.
+    """
+
+    def __init__(self, max_filas=None):
+        self.max_filas = max_filas_memoria if max_filas is None else max_filas
+        self.en_memoria = []
+        self.en_s3 = []
+        self.filas = 0
+
+    def agregar(self, objeto, pagina):
+        if self.en_s3 or self.filas + len(pagina) > self.max_filas:
+            self.en_s3.append(objeto)
+        else:
+            self.en_memoria.append((objeto, pagina))
+            self.filas += len(pagina)
+
+# Función con los pasos de la ingesta; devuelve el estado de la ejecución para las métricas
+def _ingerir():
     client = get_client()
     fecha_hoy = datetime.today().strftime('%Y-%m-%dT%H-%M-%S')
 
     # Verificar acceso a S3
     if not verificar_acceso_s3(s3_bucket):
         logging.error("No se pudo acceder a S3. Deteniendo el proceso de ingesta.")
-        return
+        return "error"
 
     # Verificar si es una ingesta inicial o consecutiva
-    fecha_ultimo_proceso = cargar_fecha_ultimo_proceso()
-
-    if fecha_ultimo_proceso:
-        # Ingesta consecutiva
-        new_data = ingesta_consecutiva(client, fecha_ultimo_proceso)
-        new_data.columns = new_data.columns.str.strip().str.lower()
+    estado = cargar_estado_ingesta()
+    lote = LoteIngesta()
 
-        # Verificar si hay datos nuevos antes de guardar en S3
-        if not new_data.empty:
-            s3_object_name = f"ingesta/consecutiva/inspecciones-consecutivas-{fecha_hoy}.pkl"
-            guardar_ingesta(s3_bucket, s3_object_name, new_data)
+    if estado:
+        # Ingesta consecutiva: cada página se guarda y confirma antes de pedir la siguiente
+        paginas = 0
+        for numero, (pagina, marca) in enumerate(metricas.medir_iterador(ingesta_consecutiva(client, estado), "extraccion")):
+            s3_object_name = f"ingesta/consecutiva/inspecciones-consecutivas-{fecha_hoy}-parte-{numero:05d}.parquet"
+            with metricas.etapa("guardado", filas=len(pagina)):
+                objeto = guardar_ingesta(s3_bucket, s3_object_name, pagina)
+                estado = guardar_estado_ingesta(marca, len(pagina), estado)
+            lote.agregar(objeto, pagina)
+            metricas.contar("filas", "salida", len(pagina))
+            paginas += 1
 
-            if 'inspection_date' in new_data.columns:
-                ultima_fecha = new_data['inspection_date'].max()
-                guardar_fecha_ultimo_proceso(ultima_fecha)
-        else:
+        if not paginas:
             logging.info("No hay datos nuevos desde la última ingesta. No se generará un archivo.")
     else:
-        # Ingesta inicial
-        initial_data = ingesta_inicial(client)
-        initial_data.columns = initial_data.columns.str.strip().str.lower()
+        # Ingesta inicial: cada página se guarda en su propio objeto para no acumularlas en memoria
+        marca = None
+        filas = 0
+        for numero, pagina in enumerate(metricas.medir_iterador(ingesta_inicial(client), "extraccion")):
+            pagina.columns = pagina.columns.str.strip().str.lower()
+
+            s3_object_name = f"ingesta/inicial/inspecciones-historicas-{fecha_hoy}-parte-{numero:05d}.parquet"
+            with metricas.etapa("guardado", filas=len(pagina)):
+                objeto = guardar_ingesta(s3_bucket, s3_object_name, pagina)
+            lote.agregar(objeto, pagina)
+            metricas.contar("filas", "salida", len(pagina))
+            filas += len(pagina)
 
-        s3_object_name = f"ingesta/inicial/inspecciones-historicas-{fecha_hoy}.pkl"
-        guardar_ingesta(s3_bucket, s3_object_name, initial_data)
+            if 'inspection_date' in pagina.columns:
+                marca_pagina = marca_de_agua(pagina)
+                if marca is None or (marca_pagina["inspection_date"], marca_pagina["inspection_id"]) > (
+                        marca["inspection_date"], marca["inspection_id"]):
+                    marca = marca_pagina
 
-        if 'inspection_date' in initial_data.columns:
-            ultima_fecha = initial_data['inspection_date'].max()
-            guardar_fecha_ultimo_proceso(ultima_fecha)
+        if marca:
+            guardar_estado_ingesta(marca, filas)
 
-    # Ejecutar el script de limpieza tras completar la ingesta
-    logging.info("Ejecutando proceso de limpieza...")
-    subprocess.run(["python", "/app/limpieza.py"],check=True,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+    # Limpiar en este mismo proceso solo lo recién ingerido; las etapas de la limpieza
+    # se registran en la misma ejecución. Los reprocesos completos usan limpieza.py
+    logging.info(f"Limpiando el lote ingerido: {len(lote.en_memoria)} archivos en memoria y {len(lote.en_s3)} desde S3.")
+    limpieza.limpiar_ingesta(s3_bucket, lote.en_memoria, lote.en_s3)
     logging.info("Proceso de limpieza completado.")
+    return "ok"
 
 # Punto de entrada del programa
 if __name__ == "__main__":
+    # Configurar el logger para mostrar el tiempo, nivel, nombre de archivo y línea de cada mensaje. Solo
+    # al ejecutar el script: al importarlo (la limpieza, los benchmarks) el logging es de quien lo importa
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s"
+    )
+    logging.info("Iniciando ejecución del script 'ingesta.py'.")
     logging.info("Iniciando el proceso completo de ingesta de datos.")
     ingest_data()
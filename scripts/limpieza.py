@@ -1,23 +1,21 @@
 import os
+import sys
 import boto3
+from botocore.config import Config
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import pickle
+import re
 import time
-import tempfile
+import resource
+import shutil
 import logging
-from logging.handlers import TimedRotatingFileHandler
-
-# Configuración de logging con rotación mensual
-log_filename = "limpieza_log.log"
-log_handler = TimedRotatingFileHandler(log_filename, when="M", interval=1, backupCount=12)
-log_handler.suffix = "%Y-%m"
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s',
-    handlers=[log_handler]
-)
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import almacenamiento
+import compactacion
+import metricas
+import puntuacion
+import zonas
 
 # Carga de variables de entorno
 socrata_username = os.getenv("SOCRATA_USERNAME")
@@ -27,21 +25,42 @@ aws_access_key_id = os.getenv("AWS_ACCESS_KEY_ID")
 aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY")
 s3_bucket = os.getenv("S3_BUCKET_NAME")
 
-# Inicializa el cliente de S3 utilizando las credenciales de AWS
+# Número de filas por bloque en el pipeline de limpieza
+tam_bloque = int(os.getenv("LIMPIEZA_TAM_BLOQUE", "50000"))
+
+# Concurrencia de cada etapa del pipeline: descargas, limpieza y subidas
+hilos_descarga = int(os.getenv("LIMPIEZA_HILOS_DESCARGA", "4"))
+hilos_limpieza = int(os.getenv("LIMPIEZA_HILOS_LIMPIEZA", "2"))
+hilos_subida = int(os.getenv("LIMPIEZA_HILOS_SUBIDA", "4"))
+
+# Manifiesto de idempotencia: ETag del archivo de ingesta -> salida limpia, filas y hash de esquema
+ruta_limpia = 'datos_limpios'
+manifiesto_file_name = f"{ruta_limpia}/manifiesto.json"
+_patron_limpio = re.compile(r"datos_limpios_(?:\d{4}-\d{2}-\d{2}_)?([0-9a-f]{32}(?:-\d+)?)")
+
+# Columnas cuyos faltantes se imputan con la moda del archivo completo
+columnas_imputar = ['license_', 'zip', 'state', 'facility_type', 'risk']
+columnas_coordenadas = ['latitude', 'longitude']
+# La primera pasada cuenta también las categóricas del esquema canónico, para ampliar sus vocabularios.
+# La zona no viene en la ingesta: su vocabulario son los códigos del índice de zonas
+columnas_contar = list(dict.fromkeys(columnas_imputar + [c for c in almacenamiento.COLUMNAS_CATEGORICAS
+                                                         if c != zonas.columna_zona]))
+
+# Inicializa el cliente de S3 utilizando las credenciales de AWS; es único y compartido por todos los hilos,
+# con un pool de conexiones dimensionado para las etapas concurrentes
 s3 = boto3.client(
     's3',
     aws_access_key_id=aws_access_key_id,
-    aws_secret_access_key=aws_secret_access_key
+    aws_secret_access_key=aws_secret_access_key,
+    config=Config(max_pool_connections=hilos_descarga + hilos_limpieza + hilos_subida + 2)
 )
+metricas.instrumentar_s3(s3)
 
 def cargar_datos_s3(bucket, ruta):
     logging.info(f"Cargando archivos desde {bucket}/{ruta}")
     archivos = []
     try:
-        response = s3.list_objects_v2(Bucket=bucket, Prefix=ruta)
-        for obj in response.get('Contents', []):
-            if obj['Key'].endswith('.pkl'):
-                archivos.append(obj)
+        archivos = list(almacenamiento.listar_objetos(s3, bucket, ruta))
         logging.info(f"{len(archivos)} archivos encontrados.")
     except Exception as e:
         logging.error(f"Error al cargar archivos desde S3: {e}")
@@ -51,116 +70,445 @@ def descargar_archivo_s3(bucket, archivo_obj):
     archivo = archivo_obj['Key']
     logging.info(f"Descargando archivo {archivo} de S3.")
     try:
-        archivo_obj_data = s3.get_object(Bucket=bucket, Key=archivo)
-        data = pickle.load(archivo_obj_data['Body'])
-        etag = archivo_obj['ETag'].strip('"')
-        logging.info(f"Archivo {archivo} descargado con éxito.")
-        return data, etag
+        with metricas.etapa("descarga", archivo=archivo):
+            ruta_local = almacenamiento.descargar_a_temporal(s3, bucket, archivo)
+        logging.info(f"Archivo {archivo} descargado con éxito en {ruta_local}.")
+        return ruta_local
     except Exception as e:
         logging.error(f"Error al descargar el archivo {archivo} de S3: {e}")
-        return None, None
-
-def transformar_ingesta(data):
-    logging.info("Transformando datos de ingesta.")
-    df = pd.DataFrame(data)
-    return df
+        return None
 
-def faltantes(df):
+def faltantes(ruta_local):
     logging.info("Verificando valores faltantes.")
-    missing_data = df.isnull().sum()
+    missing_data = almacenamiento.contar_nulos(ruta_local)
     logging.info(f"Valores faltantes por columna:\n{missing_data}")
 
-def elimina_faltantes_latitud_longitud(df, columnas):
-    logging.info(f"Eliminando filas con valores nulos en las columnas {columnas}.")
-    before_rows = len(df)
-    df = df.dropna(subset=columnas)
-    after_rows = len(df)
-    logging.info(f"Filas eliminadas: {before_rows - after_rows}")
+# Función para rellenar las coordenadas que faltan a partir de la dirección, antes de descartar filas sin ellas
+def recuperar_coordenadas(df, direcciones):
+    df, recuperadas = zonas.recuperar_coordenadas(df, direcciones)
+    metricas.contar("filas", "coordenadas_recuperadas", recuperadas)
+    logging.debug(f"Coordenadas recuperadas por dirección en {recuperadas} filas.")
     return df
 
-def imputar_faltantes(df, columna, valor_imputar):
-    logging.info(f"Imputando valores faltantes en la columna {columna}.")
-    df[columna].fillna(valor_imputar)
-    return df
+def elimina_faltantes_latitud_longitud(df, columnas):
+    logging.debug(f"Eliminando filas con valores nulos en las columnas {columnas}.")
+    return df.dropna(subset=columnas)
+
+def imputar_faltantes(df, valores_imputar):
+    logging.debug(f"Imputando valores faltantes en las columnas {list(valores_imputar)}.")
+    return df.fillna(valores_imputar)
 
 def transformar_enteros(df, columnas):
-    logging.info(f"Transformando columnas {columnas} a enteros.")
+    logging.debug(f"Transformando columnas {columnas} a enteros.")
     for columna in columnas:
         df[columna] = df[columna].astype('Int64')
     return df
 
 def transformar_flotantes(df, columnas):
-    logging.info(f"Transformando columnas {columnas} a flotantes.")
+    logging.debug(f"Transformando columnas {columnas} a flotantes.")
     for columna in columnas:
         df[columna] = df[columna].astype(float)
     return df
 
 def transformar_fechas(df, columnas):
-    logging.info(f"Transformando columnas {columnas} a fechas.")
+    logging.debug(f"Transformando columnas {columnas} a fechas.")
     for columna in columnas:
         df[columna] = pd.to_datetime(df[columna], errors='coerce')
     return df
 
-def existe_archivo_limpio(bucket, ruta_limpia, etag):
-    archivo_limpio = f"{ruta_limpia}/datos_limpios/datos_limpios_{datetime.today().strftime('%Y-%m-%d')}_{etag}.pkl"
-    try:
-        response = s3.list_objects_v2(Bucket=bucket, Prefix=archivo_limpio)
-        if 'Contents' in response:
-            logging.info(f"El archivo limpio {archivo_limpio} ya existe en S3.")
-            return True
-        return False
-    except Exception as e:
-        logging.error(f"Error al verificar la existencia del archivo limpio: {e}")
-        return False
-
-def guardar_datos_s3(bucket, ruta, df, etag):
-    fecha = datetime.today().strftime('%Y-%m-%d')
-    archivo = f"{ruta}/datos_limpios/datos_limpios_{fecha}_{etag}.pkl"
-    
-    # Guardar el DataFrame en un archivo temporal
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        pickle.dump(df, temp_file)
-        temp_file_path = temp_file.name  # Ruta al archivo temporal
-    
-    # Subir directamente el archivo temporal a S3
+# Función para asignar a cada fila la zona (ZIP) de sus coordenadas y contar las que no coinciden con el zip declarado
+def asignar_zonas(df):
+    df = zonas.asignar_zonas(df, zonas.cargar_indice_zonas())
+    metricas.contar("filas", "zip_discordante", zonas.contar_zip_discordantes(df))
+    return df
+
+# Función para obtener la memoria de unas columnas de un DataFrame en bytes, incluido el texto
+def memoria_columnas(df, columnas):
+    return int(df[columnas].memory_usage(index=False, deep=True).sum())
+
+# Función para aplicar el esquema canónico (categóricas y tipos reducidos) y contar la memoria que ahorra.
+# Solo se mide lo que el esquema cambia: medir el texto del resto de columnas costaría casi tanto como limpiar
+def transformar_esquema(df, vocabularios):
+    logging.debug("Aplicando el esquema canónico.")
+    columnas = [c for c in df.columns if almacenamiento.ESQUEMA_LIMPIO.get(c) != almacenamiento.ESQUEMA.get(c)]
+    memoria_entrada = memoria_columnas(df, columnas)
+    df = almacenamiento.aplicar_esquema(df, vocabularios)
+    metricas.contar("memoria", "sin_esquema", memoria_entrada)
+    metricas.contar("memoria", "esquema", memoria_columnas(df, columnas))
+    return df
+
+# Función para obtener los conteos vacíos: valores por columna contada y coordenadas por dirección
+def conteos_vacios():
+    conteos = {columna: pd.Series(dtype='int64') for columna in columnas_contar}
+    conteos["direcciones"] = zonas.direcciones_vacias()
+    return conteos
+
+# Función para sumar a `conteos` los valores de las columnas contadas de todas las filas, incluidas las
+# que recuperarán sus coordenadas por dirección. La tabla de direcciones solo resume las filas con coordenadas
+def contar_bloque(conteos, bloque):
+    for columna in columnas_contar:
+        if columna in bloque.columns:
+            conteos[columna] = conteos[columna].add(bloque[columna].value_counts(), fill_value=0)
+    conteos["direcciones"] = conteos["direcciones"].add(zonas.resumir_direcciones(bloque), fill_value=0)
+    return conteos
+
+# Función para contar los valores de las columnas contadas en un archivo, leyendo solo esas columnas
+def contar_valores(bucket, archivo_obj):
+    conteos = conteos_vacios()
+    bloques = almacenamiento.leer_bloques_s3(s3, bucket, archivo_obj['Key'], tam_bloque,
+                                             columnas_contar + columnas_coordenadas + ['address'], archivo_obj.get('Size'))
+    for bloque in bloques:
+        contar_bloque(conteos, bloque)
+    return conteos
+
+# Función para obtener las modas de las columnas a imputar a partir de los conteos acumulados
+def modas(conteos):
+    # Igual que Series.mode(): ante un empate gana el valor menor
+    valores = {columna: conteos[columna].sort_index().idxmax() for columna in columnas_imputar
+               if not conteos[columna].empty}
+    logging.info(f"Valores de imputación calculados: {valores}")
+    return valores
+
+# Función para ampliar los vocabularios de las columnas categóricas con los valores contados, antes
+# de limpiar: así todos los bloques de la ejecución comparten las mismas categorías
+def ampliar_vocabularios(vocabularios, conteos):
+    indice = zonas.cargar_indice_zonas()
+    valores_zona = indice.codigos if indice is not None else []
+    for columna in almacenamiento.COLUMNAS_CATEGORICAS:
+        valores = conteos[columna].index if columna in conteos else valores_zona
+        tamano = len(vocabularios.get(columna, []))
+        nuevos = len(almacenamiento.ampliar_vocabulario(vocabularios, columna, valores)) - tamano
+        if nuevos:
+            logging.info(f"Vocabulario de {columna}: {nuevos} valores nuevos, {tamano + nuevos} en total.")
+
+# Función para sumar a `conteos` los conteos de un archivo
+def sumar_conteos(conteos, conteos_archivo):
+    for columna, conteo in conteos_archivo.items():
+        conteos[columna] = conteos[columna].add(conteo, fill_value=0)
+    return conteos
+
+# Función para ampliar la tabla de direcciones guardada con las coordenadas contadas en la primera pasada;
+# devuelve la tabla guardada y la ampliada, con la que se limpia
+def ampliar_direcciones(bucket, conteos):
+    guardadas = zonas.cargar_direcciones(s3, bucket)
+    direcciones = guardadas.add(conteos["direcciones"], fill_value=0)
+    logging.info(f"Tabla de direcciones: {len(direcciones)} direcciones con coordenadas.")
+    return guardadas, direcciones
+
+# Función para preparar la segunda pasada a partir de los conteos: amplía los vocabularios y la tabla
+# de direcciones y devuelve los valores de imputación, la tabla guardada y la ampliada
+def preparar_limpieza(bucket, conteos, vocabularios):
+    ampliar_vocabularios(vocabularios, conteos)
+    return (modas(conteos),) + ampliar_direcciones(bucket, conteos)
+
+# Primera pasada: solo agregados (modas de las columnas a imputar, vocabularios y coordenadas por dirección)
+# sobre todos los archivos pendientes. Devuelve también las direcciones resumidas de cada archivo, por ETag
+def calcular_valores_imputacion(bucket, archivos, vocabularios, hilos=None):
+    conteos = conteos_vacios()
+    direcciones_archivos = {}
+    with ThreadPoolExecutor(max_workers=hilos or hilos_descarga) as executor:
+        conteos_archivos = executor.map(lambda obj: contar_valores(bucket, obj), archivos)
+        for archivo_obj, conteos_archivo in zip(archivos, conteos_archivos):
+            sumar_conteos(conteos, conteos_archivo)
+            direcciones_archivos[archivo_obj['ETag'].strip('"')] = conteos_archivo["direcciones"]
+    return preparar_limpieza(bucket, conteos, vocabularios) + (direcciones_archivos,)
+
+# Función para guardar la tabla de direcciones con las coordenadas de los archivos que entraron en el
+# manifiesto. Los que fallaron se vuelven a contar en la siguiente ejecución, así que no se suman aún
+def guardar_direcciones(bucket, guardadas, direcciones_archivos, manifiesto):
+    confirmadas = [resumen for etag, resumen in direcciones_archivos.items() if etag in manifiesto["archivos"]]
+    if not confirmadas:
+        return
+    nuevas = pd.concat(confirmadas).groupby(level=0).sum()
+    zonas.guardar_direcciones(s3, bucket, guardadas.add(nuevas, fill_value=0))
+
+# Etapa fusionada: todas las transformaciones de limpieza sobre un bloque
+def limpiar_bloque(df, valores_imputar, vocabularios, direcciones):
+    df = recuperar_coordenadas(df, direcciones)
+    df = elimina_faltantes_latitud_longitud(df, columnas_coordenadas)
+    df = imputar_faltantes(df, valores_imputar)
+    df = transformar_enteros(df, ['inspection_id'])
+    df = transformar_flotantes(df, columnas_coordenadas)
+    df = transformar_fechas(df, ['inspection_date'])
+    df = asignar_zonas(df)
+    df = transformar_esquema(df, vocabularios)
+    return df
+
+# Función para obtener el pico de memoria residente del proceso en MB
+def memoria_pico_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Función para informar de la memoria que ahorra el esquema canónico en lo limpiado durante la ejecución
+def informar_memoria():
+    sin_esquema, con_esquema = metricas.valor("memoria", "sin_esquema"), metricas.valor("memoria", "esquema")
+    if sin_esquema:
+        logging.info(f"Esquema canónico: {(sin_esquema - con_esquema) / 2**20:.1f} MB menos en memoria; las columnas "
+                     f"categóricas y reducidas ocupan {con_esquema / 2**20:.1f} MB frente a {sin_esquema / 2**20:.1f} MB "
+                     f"({1 - con_esquema / sin_esquema:.0%} menos)")
+    recuperadas, discordantes = metricas.valor("filas", "coordenadas_recuperadas"), metricas.valor("filas", "zip_discordante")
+    if recuperadas or discordantes:
+        logging.info(f"Zonas: {recuperadas} filas con coordenadas recuperadas por dirección; {discordantes} filas "
+                     f"con un zip declarado distinto del de su ubicación")
+
+# Función para cargar el manifiesto una vez por ejecución. Si aún no existe, se construye
+# con un único listado de las salidas limpias previas para no volver a limpiarlas
+def cargar_manifiesto(bucket):
+    manifiesto = almacenamiento.leer_json(s3, bucket, manifiesto_file_name)
+    if manifiesto is not None:
+        logging.info(f"Manifiesto cargado con {len(manifiesto['archivos'])} archivos limpios.")
+        # Manifiestos anteriores al esquema canónico: los vocabularios empiezan vacíos
+        manifiesto.setdefault("vocabularios", {})
+        return manifiesto
+
+    logging.warning("Manifiesto no encontrado. Se reconstruye a partir de las salidas limpias existentes.")
+    manifiesto = {"archivos": {}, "vocabularios": {}, "actualizado": None}
+    for obj in almacenamiento.listar_objetos(s3, bucket, f"{ruta_limpia}/datos_limpios/"):
+        coincidencia = _patron_limpio.search(obj['Key'])
+        if coincidencia:
+            entrada = manifiesto["archivos"].setdefault(
+                coincidencia.group(1), {"fuente": None, "claves": [], "filas": None, "esquema": None})
+            entrada["claves"].append(obj['Key'])
+    return manifiesto
+
+# Función para guardar el manifiesto al final de la ejecución con una sola escritura
+def guardar_manifiesto(bucket, manifiesto):
+    manifiesto["actualizado"] = datetime.today().isoformat(timespec='seconds')
+    almacenamiento.escribir_json(s3, bucket, manifiesto_file_name, manifiesto)
+    logging.info(f"Manifiesto actualizado con {len(manifiesto['archivos'])} archivos limpios.")
+
+def guardar_datos_s3(bucket, ruta, ruta_local, etag):
+    clave = f"{ruta}/datos_limpios/datos_limpios_{etag}.parquet"
+
+    # Subir el archivo Parquet del lote ya escrito en disco, como un único objeto
     try:
-        s3.upload_file(temp_file_path, bucket, archivo)
-        logging.info(f"Archivo limpio guardado en S3: {archivo}")
+        s3.upload_file(ruta_local, bucket, clave)
+        logging.info(f"Archivo limpio guardado en S3: {clave}")
+        return clave
     except Exception as e:
         logging.error(f"Error al guardar el archivo limpio en S3: {e}")
+        raise
+
+# Segunda pasada: limpia bloques y los escribe en un archivo local; devuelve el escritor con el lote en disco
+def limpiar_bloques(bloques, valores_imputar, vocabularios, direcciones):
+    with metricas.etapa("limpieza") as campos:
+        escritor = almacenamiento.EscritorLote()
+        filas_entrada = 0
+        completado = False
+        try:
+            for bloque in bloques:
+                filas_entrada += len(bloque)
+                escritor.escribir(limpiar_bloque(bloque, valores_imputar, vocabularios, direcciones))
+            completado = True
+        finally:
+            escritor.cerrar()
+            # Si la limpieza falla, el directorio temporal no llega a subir_archivo_limpio, que es quien lo borra
+            if not completado:
+                shutil.rmtree(escritor.directorio, ignore_errors=True)
+        campos.update(filas_entrada=filas_entrada, filas_salida=escritor.filas)
+    metricas.contar("filas", "entrada", filas_entrada)
+    metricas.contar("filas", "salida", escritor.filas)
+    metricas.contar("filas", "descartadas", filas_entrada - escritor.filas)
+    logging.info(f"Filas eliminadas: {filas_entrada - escritor.filas}")
+    return escritor
+
+# Función para limpiar un archivo local por bloques
+def limpiar_archivo(ruta_local, valores_imputar, vocabularios, direcciones):
+    faltantes(ruta_local)
+    return limpiar_bloques(almacenamiento.leer_bloques(ruta_local, tam_bloque), valores_imputar, vocabularios,
+                           direcciones)
+
+# Función para limpiar por bloques un DataFrame que ya está en memoria
+def limpiar_marco(df, valores_imputar, vocabularios, direcciones):
+    logging.info(f"Valores faltantes por columna:\n{df.isnull().sum()}")
+    return limpiar_bloques((df.iloc[inicio:inicio + tam_bloque] for inicio in range(0, len(df), tam_bloque)),
+                           valores_imputar, vocabularios, direcciones)
+
+# Función para subir un archivo limpio y borrar sus temporales; devuelve su entrada del manifiesto
+def subir_archivo_limpio(bucket, ruta_limpia, escritor, archivo_obj):
+    etag = archivo_obj['ETag'].strip('"')
+    try:
+        with metricas.etapa("subida", archivo=archivo_obj['Key'], filas=escritor.filas):
+            claves = [guardar_datos_s3(bucket, ruta_limpia, escritor.ruta, etag)] if escritor.filas else []
+    finally:
+        shutil.rmtree(escritor.directorio, ignore_errors=True)
+    logging.info(f"Limpieza realizada y guardada para el archivo con ETag {etag}")
+    return {
+        "fuente": archivo_obj['Key'],
+        "claves": claves,
+        "filas": escritor.filas,
+        "esquema": almacenamiento.hash_esquema(escritor.esquema),
+        "limpiado": datetime.today().isoformat(timespec='seconds'),
+    }
+
+# Pipeline concurrente: las descargas, la limpieza y las subidas de archivos distintos se solapan.
+# Como máximo hay tantos archivos en vuelo como hilos en total, lo que acota el disco y la memoria.
+def ejecutar_pipeline(bucket, ruta_limpia, archivos, valores_imputar, manifiesto, direcciones,
+                      descargas=None, limpiezas=None, subidas=None):
+    descargas = descargas or hilos_descarga
+    limpiezas = limpiezas or hilos_limpieza
+    subidas = subidas or hilos_subida
+    cola = iter(archivos)
+    en_vuelo = {}
+    filas_totales = 0
+
+    with ThreadPoolExecutor(descargas) as pool_descarga, \
+            ThreadPoolExecutor(limpiezas) as pool_limpieza, \
+            ThreadPoolExecutor(subidas) as pool_subida:
+
+        def lanzar_descarga():
+            archivo_obj = next(cola, None)
+            if archivo_obj is not None:
+                futuro = pool_descarga.submit(descargar_archivo_s3, bucket, archivo_obj)
+                en_vuelo[futuro] = ('descarga', archivo_obj, None)
 
-def procesar_archivos(bucket, rutas):
-    ruta_limpia = 'datos_limpios'
+        for _ in range(descargas + limpiezas + subidas):
+            lanzar_descarga()
+
+        while en_vuelo:
+            terminados, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                etapa, archivo_obj, ruta_local = en_vuelo.pop(futuro)
+                etag = archivo_obj['ETag'].strip('"')
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    logging.error(f"Error en la etapa de {etapa} del archivo {archivo_obj['Key']}: {e}")
+                    resultado = None
+                finally:
+                    if etapa == 'limpieza':
+                        os.remove(ruta_local)
+
+                if etapa == 'descarga' and resultado is not None:
+                    futuro = pool_limpieza.submit(limpiar_archivo, resultado, valores_imputar, manifiesto["vocabularios"],
+                                                  direcciones)
+                    en_vuelo[futuro] = ('limpieza', archivo_obj, resultado)
+                elif etapa == 'limpieza' and resultado is not None:
+                    futuro = pool_subida.submit(subir_archivo_limpio, bucket, ruta_limpia, resultado, archivo_obj)
+                    en_vuelo[futuro] = ('subida', archivo_obj, None)
+                else:
+                    # El archivo salió del pipeline (subido o con error): entra el siguiente
+                    if etapa == 'subida' and resultado is not None:
+                        manifiesto["archivos"][etag] = resultado
+                        filas_totales += resultado["filas"]
+                    lanzar_descarga()
+    return filas_totales
+
+# Función para limpiar una lista explícita de objetos de ingesta, sin listar el bucket; devuelve las filas limpias
+def procesar_objetos(bucket, archivos, manifiesto, descargas=None, limpiezas=None, subidas=None):
+    # Validación en memoria contra el manifiesto: los archivos ya limpiados no se descargan
+    pendientes = []
+    for archivo_obj in archivos:
+        etag = archivo_obj['ETag'].strip('"')
+        if etag in manifiesto["archivos"]:
+            logging.debug(f"El archivo con ETag {etag} ya fue limpiado. Saltando...")
+            continue
+        pendientes.append(archivo_obj)
+    logging.info(f"{len(pendientes)} archivos pendientes de limpieza.")
+    if not pendientes:
+        return 0
+
+    with metricas.etapa("imputacion", archivos=len(pendientes)):
+        valores_imputar, guardadas, direcciones, direcciones_archivos = calcular_valores_imputacion(
+            bucket, pendientes, manifiesto["vocabularios"], descargas)
+    filas_totales = ejecutar_pipeline(bucket, ruta_limpia, pendientes, valores_imputar, manifiesto, direcciones,
+                                      descargas, limpiezas, subidas)
+    guardar_direcciones(bucket, guardadas, direcciones_archivos, manifiesto)
+    return filas_totales
+
+def procesar_archivos(bucket, rutas, descargas=None, limpiezas=None, subidas=None):
+    inicio = time.time()
+    filas_totales = 0
+    manifiesto = cargar_manifiesto(bucket)
+    archivos_limpios = len(manifiesto["archivos"])
     for ruta in rutas:
-        archivos = cargar_datos_s3(bucket, ruta)
-        for archivo_obj in archivos:
-            data, etag = descargar_archivo_s3(bucket, archivo_obj)
-            
-            if data is None:
-                continue
-            
-            # Validación: si el archivo limpio ya existe, salta a la siguiente iteración
-            if existe_archivo_limpio(bucket, ruta_limpia, etag):
-                logging.info(f"El archivo con ETag {etag} ya fue limpiado. Saltando...")
+        filas_totales += procesar_objetos(bucket, cargar_datos_s3(bucket, ruta), manifiesto,
+                                          descargas, limpiezas, subidas)
+
+    if len(manifiesto["archivos"]) != archivos_limpios or manifiesto["actualizado"] is None:
+        guardar_manifiesto(bucket, manifiesto)
+    logging.info(f"Ejecución de limpieza: {filas_totales} filas limpias en {time.time() - inicio:.1f}s, "
+                 f"memoria pico del proceso {memoria_pico_mb():.1f} MB")
+    informar_memoria()
+    return filas_totales
+
+# Modo orquestado: limpia un lote recién ingerido que ya está en memoria, sin listar ni descargar nada.
+# `lote` es una lista de (objeto guardado, DataFrame); las modas se calculan sobre el lote completo
+def procesar_lote(bucket, lote, manifiesto, subidas=None):
+    # Mismos tipos que al releer el Parquet guardado, para que la salida no dependa del camino
+    pendientes = [(archivo_obj, almacenamiento.aplicar_tipos(df)) for archivo_obj, df in lote
+                  if archivo_obj['ETag'].strip('"') not in manifiesto["archivos"]]
+    logging.info(f"{len(pendientes)} archivos del lote pendientes de limpieza.")
+    if not pendientes:
+        return 0
+
+    with metricas.etapa("imputacion", archivos=len(pendientes)):
+        conteos = conteos_vacios()
+        direcciones_archivos = {}
+        for archivo_obj, df in pendientes:
+            conteos_archivo = contar_bloque(conteos_vacios(), df)
+            sumar_conteos(conteos, conteos_archivo)
+            direcciones_archivos[archivo_obj['ETag'].strip('"')] = conteos_archivo["direcciones"]
+        valores_imputar, guardadas, direcciones = preparar_limpieza(bucket, conteos, manifiesto["vocabularios"])
+
+    # La limpieza de un archivo se solapa con la subida de los anteriores
+    filas_totales = 0
+    with ThreadPoolExecutor(subidas or hilos_subida) as pool_subida:
+        futuros = []
+        for archivo_obj, df in pendientes:
+            escritor = limpiar_marco(df, valores_imputar, manifiesto["vocabularios"], direcciones)
+            futuros.append((archivo_obj, pool_subida.submit(subir_archivo_limpio, bucket, ruta_limpia, escritor, archivo_obj)))
+        for archivo_obj, futuro in futuros:
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                logging.error(f"Error en la etapa de subida del archivo {archivo_obj['Key']}: {e}")
                 continue
-            
-            df = transformar_ingesta(data)
-            faltantes(df)
-            df = elimina_faltantes_latitud_longitud(df, ['latitude', 'longitude'])
-            
-            for columna in ['license_', 'zip', 'state', 'facility_type', 'risk']:
-                df = imputar_faltantes(df, columna, df[columna].mode()[0])
-                
-            df = transformar_enteros(df, ['inspection_id'])
-            df = transformar_flotantes(df, ['latitude', 'longitude'])
-            df = transformar_fechas(df, ['inspection_date'])
-            
-            guardar_datos_s3(bucket, ruta_limpia, df, etag)
-            logging.info(f"Limpieza realizada y guardada para el archivo con ETag {etag}")
+            manifiesto["archivos"][archivo_obj['ETag'].strip('"')] = resultado
+            filas_totales += resultado["filas"]
+    guardar_direcciones(bucket, guardadas, direcciones_archivos, manifiesto)
+    return filas_totales
+
+# Función para actualizar los productos derivados de los datos limpios: conjunto actual, KPIs y puntuaciones
+def consolidar(bucket):
+    with metricas.etapa("compactacion"):
+        compactacion.compactar(s3, bucket)
+    with metricas.etapa("puntuacion"):
+        puntuacion.actualizar_puntuaciones(s3, bucket)
+
+# Función de entrada del modo orquestado, llamada por la ingesta en el mismo proceso. `lote` son los
+# objetos con sus DataFrames en memoria; `archivos` son objetos de la misma ingesta que no se
+# retuvieron en memoria y se limpian desde S3 sin listar el bucket
+def limpiar_ingesta(bucket, lote, archivos=()):
+    inicio = time.time()
+    manifiesto = cargar_manifiesto(bucket)
+    archivos_limpios = len(manifiesto["archivos"])
+    filas_totales = procesar_lote(bucket, lote, manifiesto)
+    if archivos:
+        filas_totales += procesar_objetos(bucket, archivos, manifiesto)
+
+    if len(manifiesto["archivos"]) != archivos_limpios or manifiesto["actualizado"] is None:
+        guardar_manifiesto(bucket, manifiesto)
+    logging.info(f"Limpieza del lote ingerido: {filas_totales} filas limpias en {time.time() - inicio:.1f}s")
+    informar_memoria()
+    consolidar(bucket)
+    return filas_totales
 
 # Ejecución en bucle con espera de un día
 if __name__ == "__main__":
+    # Configuración de logging por la salida estándar, que recoge el runtime del contenedor
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
     rutas_ingesta = ['ingesta/inicial', 'ingesta/consecutiva']
     logging.info("Inicio de la ejecución de limpieza diaria")
-    procesar_archivos(s3_bucket, rutas_ingesta)    
+    metricas.iniciar("limpieza")
+    try:
+        procesar_archivos(s3_bucket, rutas_ingesta)
+        consolidar(s3_bucket)
+    except Exception:
+        metricas.finalizar(s3, s3_bucket, estado="error")
+        raise
+    metricas.finalizar(s3, s3_bucket)
     logging.info("Limpieza completada. Esperando 24 horas para la próxima ejecución.")
@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+import almacenamiento
+
+# Instrumentación de las etapas del pipeline.
+#
+# Cada script abre una ejecución (iniciar), mide sus etapas (etapa, medir_iterador) y cuenta filas,
+# bytes, reintentos y errores (contar). Cada etapa terminada se emite como un evento JSON por la
+# salida estándar. Al cerrar la ejecución (finalizar) se escribe un resumen junto al archivo de
+# estado de la ingesta y, si METRICAS_PROMETHEUS_DIR está definido, un archivo en formato de texto
+# de Prometheus para el textfile collector de node_exporter:
+#   estado/ejecuciones/{pipeline}/ultima.json
+#   estado/ejecuciones/{pipeline}/{inicio}.json
+#   {METRICAS_PROMETHEUS_DIR}/pipeline_{pipeline}.prom
+
+ruta_ejecuciones = "estado/ejecuciones"
+directorio_prometheus = os.getenv("METRICAS_PROMETHEUS_DIR")
+
+# Los eventos van como JSON por línea, sin el formato de los logs
+logger = logging.getLogger("metricas")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+if not logger.handlers:
+    _manejador = logging.StreamHandler(sys.stdout)
+    _manejador.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_manejador)
+
+
+class Ejecucion:
+    """
+    Métricas acumuladas de una ejecución del pipeline. Es segura entre hilos.
+
+    Attributes:
+        pipeline (str): Nombre del pipeline (ingesta, limpieza...).
+        inicio (datetime): Momento de inicio de la ejecución.
+        etapas (dict): Por etapa: llamadas, segundos acumulados y duración máxima.
+        contadores (dict): Por contador (filas, bytes, reintentos, errores): valor por tipo.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.inicio = datetime.today()
+        self.etapas = {}
+        self.contadores = {}
+        self._reloj = time.perf_counter()
+        self._candado = threading.Lock()
+
+    # Método para acumular la duración de una llamada a una etapa
+    def registrar_etapa(self, etapa, segundos):
+        with self._candado:
+            acumulado = self.etapas.setdefault(etapa, {"llamadas": 0, "segundos": 0.0, "maximo": 0.0})
+            acumulado["llamadas"] += 1
+            acumulado["segundos"] += segundos
+            acumulado["maximo"] = max(acumulado["maximo"], segundos)
+
+    # Método para sumar a un contador
+    def contar(self, nombre, tipo, valor=1):
+        with self._candado:
+            contador = self.contadores.setdefault(nombre, {})
+            contador[tipo] = contador.get(tipo, 0) + valor
+
+    # Método para leer el valor de un contador; 0 si aún no se ha contado
+    def valor(self, nombre, tipo):
+        with self._candado:
+            return self.contadores.get(nombre, {}).get(tipo, 0)
+
+    # Método para obtener el resumen de la ejecución
+    def resumen(self, estado):
+        with self._candado:
+            return {
+                "pipeline": self.pipeline,
+                "estado": estado,
+                "inicio": self.inicio.isoformat(timespec="seconds"),
+                "fin": datetime.today().isoformat(timespec="seconds"),
+                "segundos": round(time.perf_counter() - self._reloj, 3),
+                "memoria_pico_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                "etapas": {etapa: {"llamadas": valores["llamadas"], "segundos": round(valores["segundos"], 3),
+                                   "maximo": round(valores["maximo"], 3)}
+                           for etapa, valores in self.etapas.items()},
+                "contadores": {nombre: dict(valores) for nombre, valores in self.contadores.items()},
+            }
+
+
+_actual = Ejecucion("sin_iniciar")
+
+
+# Función para abrir una ejecución nueva; las etapas y contadores posteriores se acumulan en ella
+def iniciar(pipeline):
+    global _actual
+    _actual = Ejecucion(pipeline)
+    return _actual
+
+
+# Función para emitir un evento estructurado
+def emitir(evento, **campos):
+    logger.info(json.dumps({"evento": evento, "pipeline": _actual.pipeline,
+                            "fecha": datetime.today().isoformat(timespec="milliseconds"), **campos},
+                           ensure_ascii=False, default=str))
+
+
+# Función para sumar a un contador de la ejecución actual
+def contar(nombre, tipo, valor=1):
+    if valor:
+        _actual.contar(nombre, tipo, valor)
+
+
+# Función para leer un contador de la ejecución actual
+def valor(nombre, tipo):
+    return _actual.valor(nombre, tipo)
+
+
+# Función para medir una etapa; los campos se añaden al evento emitido al terminar
+@contextmanager
+def etapa(nombre, **campos):
+    inicio = time.perf_counter()
+    error = None
+    try:
+        yield campos
+    except Exception as e:
+        error = repr(e)
+        contar("errores", nombre)
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        _actual.registrar_etapa(nombre, segundos)
+        emitir("etapa", etapa=nombre, segundos=round(segundos, 4), **campos, **({"error": error} if error else {}))
+
+
+# Función para medir el tiempo que un generador tarda en entregar cada elemento
+def medir_iterador(iterable, nombre):
+    iterador = iter(iterable)
+    while True:
+        with etapa(nombre) as campos:
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                campos["fin"] = True
+                return
+        yield elemento
+
+
+# Función para contar los bytes y reintentos de un cliente de S3
+def instrumentar_s3(cliente):
+    def antes_de_enviar(request, **kwargs):
+        if request.method in ("PUT", "POST"):
+            contar("bytes", "s3_subida", int(request.headers.get("Content-Length") or 0))
+
+    def despues_de_llamada(http_response, parsed, model, **kwargs):
+        contar("reintentos", "s3", parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+        if model.name == "GetObject":
+            contar("bytes", "s3_descarga", parsed.get("ContentLength") or 0)
+
+    cliente.meta.events.register("before-send.s3", antes_de_enviar)
+    cliente.meta.events.register("after-call.s3", despues_de_llamada)
+    return cliente
+
+
+# Función para escribir las métricas en formato de texto de Prometheus, de forma atómica
+def escribir_prometheus(resumen, directorio):
+    etiqueta = f'pipeline="{resumen["pipeline"]}"'
+    lineas = []
+
+    def metrica(nombre, ayuda, muestras):
+        lineas.extend([f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"])
+        lineas.extend(f"{nombre}{{{etiquetas}}} {valor}" for etiquetas, valor in muestras)
+
+    etapas = resumen["etapas"].items()
+    metrica("pipeline_etapa_segundos", "Segundos acumulados por etapa en la última ejecución.",
+            [(f'{etiqueta},etapa="{e}"', v["segundos"]) for e, v in etapas])
+    metrica("pipeline_etapa_llamadas", "Veces que se ejecutó cada etapa en la última ejecución.",
+            [(f'{etiqueta},etapa="{e}"', v["llamadas"]) for e, v in etapas])
+    metrica("pipeline_etapa_maximo_segundos", "Duración máxima de una llamada a cada etapa.",
+            [(f'{etiqueta},etapa="{e}"', v["maximo"]) for e, v in etapas])
+    for nombre, valores in sorted(resumen["contadores"].items()):
+        metrica(f"pipeline_{nombre}", f"Contador de {nombre} de la última ejecución, por tipo.",
+                [(f'{etiqueta},tipo="{tipo}"', valor) for tipo, valor in sorted(valores.items())])
+    metrica("pipeline_duracion_segundos", "Duración de la última ejecución.", [(etiqueta, resumen["segundos"])])
+    metrica("pipeline_memoria_pico_bytes", "Pico de memoria residente de la última ejecución.",
+            [(etiqueta, int(resumen["memoria_pico_mb"] * 2**20))])
+    metrica("pipeline_ultima_ejecucion_timestamp_seconds", "Fin de la última ejecución (epoch).",
+            [(etiqueta, int(datetime.fromisoformat(resumen["fin"]).timestamp()))])
+    metrica("pipeline_ultima_ejecucion_exitosa", "1 si la última ejecución terminó sin errores.",
+            [(etiqueta, int(resumen["estado"] == "ok"))])
+
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"pipeline_{resumen['pipeline']}.prom")
+    with open(f"{ruta}.tmp", "w") as archivo:
+        archivo.write("\n".join(lineas) + "\n")
+    os.replace(f"{ruta}.tmp", ruta)
+    return ruta
+
+
+# Función para cerrar la ejecución: emite el resumen, lo guarda en S3 y exporta las métricas
+def finalizar(s3, bucket, estado="ok"):
+    resumen = _actual.resumen(estado)
+    emitir("ejecucion", **{k: v for k, v in resumen.items() if k != "pipeline"})
+    try:
+        prefijo = f"{ruta_ejecuciones}/{resumen['pipeline']}"
+        almacenamiento.escribir_json(s3, bucket, f"{prefijo}/{_actual.inicio.strftime('%Y-%m-%dT%H-%M-%S')}.json", resumen)
+        almacenamiento.escribir_json(s3, bucket, f"{prefijo}/ultima.json", resumen)
+        if directorio_prometheus:
+            escribir_prometheus(resumen, directorio_prometheus)
+    except Exception as e:
+        # Las métricas no deben hacer fallar el pipeline
+        logging.error(f"Error al guardar las métricas de la ejecución: {e}")
+    return resumen
@@ -0,0 +1,104 @@
+import io
+import os
+import logging
+from datetime import datetime
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import Pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import MaxAbsScaler
+from sklearn.linear_model import LogisticRegression
+import almacenamiento
+import caracteristicas
+import almacen_caracteristicas
+
+# Modelo de riesgo de reprobar una inspección y su artefacto en S3.
+#
+# Cada entrenamiento publica una versión y mueve el puntero al final, como la compactación:
+#   modelos/ACTUAL.json                 -> {"version", "clave", "codificador", "metricas", ...}
+#   modelos/v={version}/modelo.joblib   -> {"modelo": Pipeline, "codificador": vocabularios, "nombres": [...]}
+
+ruta_modelos = "modelos"
+puntero_modelo_file_name = f"{ruta_modelos}/ACTUAL.json"
+tam_bloque_puntuacion = int(os.getenv("PUNTUACION_TAM_BLOQUE", "50000"))
+
+
+# Función para crear el preprocesado: imputación de coordenadas faltantes y escala
+def crear_preprocesado():
+    return Pipeline([
+        ("imputar", SimpleImputer(strategy="median")),
+        ("escalar", MaxAbsScaler()),
+    ])
+
+
+# Función para crear el clasificador con sus hiperparámetros
+def crear_clasificador(C=1.0, class_weight=None, max_iter=1000):
+    return LogisticRegression(C=C, class_weight=class_weight, max_iter=max_iter, solver="liblinear")
+
+
+# Función para crear el modelo base: preprocesado y regresión logística
+def crear_modelo(**parametros):
+    return Pipeline(crear_preprocesado().steps + [("clasificador", crear_clasificador(**parametros))])
+
+
+# Función para publicar un modelo entrenado como nueva versión
+def guardar_modelo(s3, bucket, modelo, codificador, metricas=None, parametros=None):
+    version = almacenamiento.nueva_version()
+    clave = f"{ruta_modelos}/v={version}/modelo.joblib"
+    buffer = io.BytesIO()
+    joblib.dump({"modelo": modelo, "codificador": codificador.a_dict(), "nombres": codificador.nombres()},
+                buffer, compress=3)
+    s3.put_object(Bucket=bucket, Key=clave, Body=buffer.getvalue())
+
+    puntero = {
+        "version": version,
+        "clave": clave,
+        "codificador": almacen_caracteristicas.hash_codificador(codificador),
+        "metricas": metricas or {},
+        "parametros": parametros or {},
+        "entrenado": datetime.today().isoformat(timespec="seconds"),
+    }
+    almacenamiento.escribir_json(s3, bucket, puntero_modelo_file_name, puntero)
+    logging.info(f"Modelo {version} publicado en {clave}.")
+    return puntero
+
+
+# Función para cargar el puntero del modelo vigente; None si aún no hay modelo
+def cargar_puntero_modelo(s3, bucket):
+    return almacenamiento.leer_json(s3, bucket, puntero_modelo_file_name)
+
+
+# Función para cargar el modelo vigente con su codificador; None si aún no hay modelo
+def cargar_modelo(s3, bucket, puntero=None):
+    puntero = puntero or cargar_puntero_modelo(s3, bucket)
+    if not puntero:
+        return None
+    artefacto = joblib.load(io.BytesIO(s3.get_object(Bucket=bucket, Key=puntero["clave"])["Body"].read()))
+    artefacto["codificador"] = caracteristicas.CodificadorCaracteristicas.desde_dict(artefacto["codificador"])
+    artefacto["version"] = puntero["version"]
+    return artefacto
+
+
+# Función para calcular la probabilidad de reprobar por bloques de filas, sin densificar la matriz completa
+def puntuar_matriz(modelo, matriz, tam_bloque=None):
+    tam_bloque = tam_bloque or tam_bloque_puntuacion
+    probabilidades = np.empty(matriz.shape[0], dtype=np.float32)
+    for inicio in range(0, matriz.shape[0], tam_bloque):
+        fin = min(inicio + tam_bloque, matriz.shape[0])
+        probabilidades[inicio:fin] = modelo.predict_proba(matriz[inicio:fin])[:, 1]
+    return probabilidades
+
+
+# Función para puntuar un DataFrame del conjunto limpio; devuelve una fila por inspección puntuada
+def puntuar_datos(df, artefacto, tam_bloque=None):
+    preparados = caracteristicas.preparar(df)
+    matriz, _ = artefacto["codificador"].transformar(preparados)
+    probabilidades = puntuar_matriz(artefacto["modelo"], matriz, tam_bloque)
+    filas = df.loc[preparados.index]
+    return pd.DataFrame({
+        "inspection_id": filas["inspection_id"].to_numpy(),
+        "license_": filas["license_"].to_numpy() if "license_" in filas else None,
+        "inspection_date": filas["inspection_date"].to_numpy(),
+        "probabilidad_fallo": probabilidades,
+    })
@@ -0,0 +1,83 @@
+import time
+import logging
+from datetime import datetime
+import pandas as pd
+import almacenamiento
+import compactacion
+import modelo
+
+# Puntuación por lotes del conjunto actual con el modelo vigente.
+#
+# Se ejecuta después de la limpieza y la compactación. Como el almacén de características, solo
+# puntúa las particiones que cambiaron desde la última ejecución (o todas si cambió el modelo):
+#   puntuaciones/modelo={version}/manifiesto.json
+#   puntuaciones/modelo={version}/anio=YYYY/mes=MM/puntuaciones-{version datos}.parquet
+
+ruta_puntuaciones = "puntuaciones"
+
+
+# Función para puntuar las particiones nuevas o modificadas del conjunto actual
+def actualizar_puntuaciones(s3, bucket, tam_bloque=None):
+    artefacto = modelo.cargar_modelo(s3, bucket)
+    if artefacto is None:
+        logging.info("Aún no hay un modelo publicado; no se puntúa.")
+        return None
+    puntero = compactacion.cargar_puntero(s3, bucket)
+    if not puntero:
+        logging.info("No hay conjunto actual que puntuar.")
+        return None
+
+    prefijo = f"{ruta_puntuaciones}/modelo={artefacto['version']}"
+    clave_manifiesto = f"{prefijo}/manifiesto.json"
+    manifiesto = almacenamiento.leer_json(s3, bucket, clave_manifiesto) or {
+        "modelo": artefacto["version"], "version_datos": None, "particiones": {}}
+    if manifiesto["version_datos"] == puntero["version"]:
+        logging.info(f"Puntuaciones al día con la versión {puntero['version']}.")
+        return manifiesto
+
+    particiones = {p: e for p, e in manifiesto["particiones"].items()
+                   if puntero["particiones"].get(p) == e["fuente"]}
+    pendientes = [p for p in puntero["particiones"] if p not in particiones]
+
+    inicio, filas = time.perf_counter(), 0
+    for particion in pendientes:
+        clave_datos = puntero["particiones"][particion]
+        puntuaciones = modelo.puntuar_datos(almacenamiento.leer_objeto(s3, bucket, clave_datos), artefacto, tam_bloque)
+        anio, mes = map(int, particion.split("-"))
+        clave = almacenamiento.clave_particion(prefijo, anio, mes, f"puntuaciones-{puntero['version']}")
+        s3.put_object(Bucket=bucket, Key=clave, Body=almacenamiento.a_parquet(puntuaciones))
+        particiones[particion] = {"fuente": clave_datos, "clave": clave, "filas": len(puntuaciones)}
+        filas += len(puntuaciones)
+    segundos = time.perf_counter() - inicio
+
+    manifiesto.update({
+        "version_datos": puntero["version"],
+        "particiones": dict(sorted(particiones.items())),
+        "actualizado": datetime.today().isoformat(timespec="seconds"),
+    })
+    almacenamiento.escribir_json(s3, bucket, clave_manifiesto, manifiesto)
+    logging.info(f"Puntuadas {filas} inspecciones de {len(pendientes)} particiones en {segundos:.1f}s "
+                 f"({filas / segundos if segundos else 0:.0f} filas/s) con el modelo {artefacto['version']}.")
+    return manifiesto
+
+
+# Función para leer las puntuaciones vigentes de un rango de fechas; None si aún no hay puntuaciones
+def leer_puntuaciones(s3, bucket, desde=None, hasta=None):
+    puntero = modelo.cargar_puntero_modelo(s3, bucket)
+    manifiesto = puntero and almacenamiento.leer_json(
+        s3, bucket, f"{ruta_puntuaciones}/modelo={puntero['version']}/manifiesto.json")
+    if not manifiesto:
+        return None
+    desde = pd.Timestamp(desde) if desde is not None else None
+    hasta = pd.Timestamp(hasta) if hasta is not None else None
+    filtros = ([("inspection_date", ">=", desde)] if desde is not None else []) + \
+        ([("inspection_date", "<=", hasta)] if hasta is not None else [])
+    marcos = []
+    for particion, entrada in manifiesto["particiones"].items():
+        if particion != "0000-00":
+            if desde is not None and particion < f"{desde.year:04d}-{desde.month:02d}":
+                continue
+            if hasta is not None and particion > f"{hasta.year:04d}-{hasta.month:02d}":
+                continue
+        marcos.append(almacenamiento.leer_objeto(s3, bucket, entrada["clave"], filtros=filtros or None))
+    return pd.concat(marcos, ignore_index=True) if marcos else None
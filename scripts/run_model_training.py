@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import boto3
+import numpy as np
+from sklearn.metrics import roc_auc_score
+import caracteristicas
+import almacen_caracteristicas
+import compactacion
+import entrenamiento
+import modelo
+
+# Etapa de modelado: pone al día el almacén de características del conjunto actual y entrena el modelo
+# (ver entrenamiento.py para la caché local, los pliegues y la reanudación de la búsqueda).
+
+s3_bucket = os.getenv("S3_BUCKET_NAME")
+s3 = boto3.client(
+    "s3",
+    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+)
+
+
+# Función para poner al día el almacén de características; el codificador solo se ajusta si no existe o si se pide
+def actualizar_caracteristicas(reajustar=False):
+    codificador = None if reajustar else caracteristicas.cargar_codificador(s3, s3_bucket)
+    if codificador is None:
+        datos = compactacion.leer_actual(s3, s3_bucket)
+        if datos.empty:
+            logging.warning("El conjunto actual está vacío; no hay nada que modelar.")
+            return None
+        codificador = caracteristicas.CodificadorCaracteristicas().ajustar(caracteristicas.preparar(datos))
+        caracteristicas.guardar_codificador(s3, s3_bucket, codificador)
+    almacen_caracteristicas.actualizar_almacen(s3, s3_bucket, codificador)
+    return codificador
+
+
+# Función para entrenar y publicar el modelo: búsqueda con validación cruzada temporal sobre el 80 % más
+# antiguo, validación con el 20 % más reciente y ajuste final con todo el historial
+def entrenar(codificador, pliegues=5, trabajos=None, reiniciar=False):
+    tiempos, inicio = {}, time.perf_counter()
+    matriz, etiqueta, directorio = entrenamiento.cachear_caracteristicas(s3, s3_bucket, codificador)
+    corte = int(len(etiqueta) * (1 - entrenamiento.fraccion_validacion))
+    tiempos["caracteristicas"] = time.perf_counter() - inicio
+
+    marca = time.perf_counter()
+    directorios_pliegues = entrenamiento.preparar_pliegues(directorio, corte, pliegues, trabajos)
+    tiempos["pliegues"] = time.perf_counter() - marca
+
+    marca = time.perf_counter()
+    ranking, busqueda = entrenamiento.buscar(directorio, directorios_pliegues, trabajos, reiniciar)
+    mejor = ranking[0]
+    tiempos["busqueda"] = time.perf_counter() - marca
+    logging.info(f"Mejores hiperparámetros: {mejor['parametros']} (AUC CV {mejor['auc_cv']:.4f}).")
+
+    marca = time.perf_counter()
+    clasificador = modelo.crear_modelo(**mejor["parametros"]).fit(matriz[:corte], etiqueta[:corte])
+    probabilidades = modelo.puntuar_matriz(clasificador, matriz[corte:])
+    auc_validacion = float(roc_auc_score(etiqueta[corte:], probabilidades))
+    clasificador = modelo.crear_modelo(**mejor["parametros"]).fit(matriz, np.asarray(etiqueta))
+    tiempos["ajuste_final"] = time.perf_counter() - marca
+    tiempos["total"] = time.perf_counter() - inicio
+
+    metricas = {
+        "auc_validacion": round(auc_validacion, 4),
+        "auc_cv": round(mejor["auc_cv"], 4),
+        "auc_cv_std": round(mejor["auc_cv_std"], 4),
+        "filas_entrenamiento": int(corte),
+        "filas_validacion": int(len(etiqueta) - corte),
+        "pliegues": pliegues,
+        "ensayos": busqueda["ensayos"],
+        "ensayos_reanudados": busqueda["ensayos_reanudados"],
+        "segundos": {etapa: round(valor, 2) for etapa, valor in tiempos.items()},
+        "memoria_pico_mb": round(entrenamiento.memoria_pico_mb(), 1),
+        "memoria_pico_trabajadores_mb": busqueda["memoria_pico_trabajadores_mb"],
+    }
+    logging.info(f"Modelo entrenado: {metricas}")
+    return modelo.guardar_modelo(s3, s3_bucket, clasificador, codificador, metricas, mejor["parametros"])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    parser = argparse.ArgumentParser(description="Etapa de modelado")
+    parser.add_argument("--reajustar", action="store_true", help="Volver a ajustar el codificador sobre todo el historial.")
+    parser.add_argument("--pliegues", type=int, default=5, help="Pliegues de la validación cruzada temporal.")
+    parser.add_argument("--trabajos", type=int, default=None, help="Procesos de la búsqueda (-1 = todos los núcleos).")
+    parser.add_argument("--reiniciar", action="store_true", help="Descartar los ensayos registrados y repetir la búsqueda.")
+    args = parser.parse_args()
+    codificador = actualizar_caracteristicas(reajustar=args.reajustar)
+    if codificador is not None:
+        entrenar(codificador, args.pliegues, args.trabajos, args.reiniciar)
@@ -0,0 +1,173 @@
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from scipy import sparse
+import almacenamiento
+
+# Violaciones normalizadas del conjunto actual.
+#
+# La columna `violations` es texto libre con entradas "N. DESCRIPCIÓN - Comments: ..." separadas
+# por " | ". Se desglosa con funciones vectorizadas de Arrow (sin bucles por fila) en una tabla
+# (inspection_id, violation_code, comment) ordenada por código e id, que es a la vez el índice
+# invertido código -> inspecciones. Igual que los fotogramas, se guarda por partición año-mes y
+# cada compactación solo recalcula las particiones que reescribe:
+#   datos_actuales/v={version}/violaciones/anio=YYYY/mes=MM/violaciones.parquet
+# El puntero la enlaza como {"particiones": {"YYYY-MM": clave}}.
+
+separador_violaciones = " | "
+separador_comentario = " - Comments:"
+# Solo el código se extrae con una expresión regular anclada; las partes se separan con
+# split_pattern, mucho más rápido en RE2 que una expresión con grupos perezosos
+patron_codigo = r"^(?P<codigo>\d+)\."
+
+columnas_violaciones = ["inspection_id", "violations"]
+
+
+# Función para partir los textos en entradas; devuelve las entradas, la fila de origen de cada una y su código
+def entradas_violaciones(serie):
+    listas = pc.split_pattern(pa.array(serie.astype("string"), type=pa.string(), from_pandas=True),
+                              pattern=separador_violaciones)
+    entradas = pc.utf8_trim_whitespace(pc.list_flatten(listas))
+    codigos = pc.cast(pc.struct_field(pc.extract_regex(entradas, pattern=patron_codigo), "codigo"), pa.int16())
+    return entradas, pc.list_parent_indices(listas), codigos
+
+
+# Función para desglosar las violaciones de un DataFrame en una fila por inspección y violación
+def desglosar(df):
+    df = df.dropna(subset=columnas_violaciones)
+    entradas, padres, codigos = entradas_violaciones(df["violations"])
+
+    # El comentario es lo que sigue al separador, si lo hay
+    partes = pc.split_pattern(entradas, pattern=separador_comentario, max_splits=1)
+    comentarios = pc.replace_with_mask(
+        pa.nulls(len(entradas), pa.string()), pc.equal(pc.list_value_length(partes), 2),
+        pc.utf8_trim_whitespace(pc.list_flatten(pc.list_slice(partes, 1, 2))))
+    comentarios = pc.if_else(pc.equal(comentarios, ""), None, comentarios)
+
+    # Las entradas sin código (p. ej. un comentario que contiene el separador) se descartan
+    validas = pc.is_valid(codigos)
+    descartadas = len(entradas) - (pc.sum(validas).as_py() or 0)
+    if descartadas:
+        logging.warning(f"{descartadas} entradas de violaciones sin código descartadas.")
+    tabla = pa.table({
+        "inspection_id": pa.array(df["inspection_id"].to_numpy(dtype="int64")).take(padres),
+        "violation_code": codigos,
+        "comment": comentarios,
+    }).filter(validas).sort_by([("violation_code", "ascending"), ("inspection_id", "ascending")])
+    return tabla.to_pandas(types_mapper={pa.string(): pd.StringDtype()}.get)
+
+
+# Función para obtener el catálogo código -> descripción de un DataFrame con violaciones
+def catalogo(df):
+    entradas, _, codigos = entradas_violaciones(df["violations"].dropna())
+    cabeceras = pc.list_element(pc.split_pattern(entradas, pattern=separador_comentario, max_splits=1), 0)
+    descripciones = pc.utf8_trim_whitespace(pc.replace_substring_regex(cabeceras, pattern=patron_codigo, replacement=""))
+    validas = pc.is_valid(codigos)
+    descripciones = pd.Series(descripciones.filter(validas).to_numpy(zero_copy_only=False))
+    codigos = pd.Series(codigos.filter(validas).to_numpy(zero_copy_only=False))
+    # La descripción más frecuente de cada código; el texto de un código cambió entre versiones del formulario
+    return descripciones.groupby(codigos).agg(lambda valores: valores.value_counts().index[0]).sort_index().to_dict()
+
+
+class IndiceViolaciones:
+    """
+    Índice invertido código de violación -> inspecciones, sobre arrays ordenados.
+
+    Los ids de cada código ocupan un tramo contiguo de `ids`, así que buscar las inspecciones de
+    un código es una búsqueda binaria y contar las de todos los códigos es una resta.
+
+    Attributes:
+        codigos (np.ndarray): Códigos de violación presentes, en orden ascendente.
+        inicios (np.ndarray): Inicio del tramo de cada código en `ids`; el último valor es len(ids).
+        ids (np.ndarray): Ids de inspección ordenados por código y, dentro de cada código, por id.
+    """
+
+    def __init__(self, tabla):
+        codigos = tabla["violation_code"].to_numpy(dtype="int64")
+        ids = tabla["inspection_id"].to_numpy(dtype="int64")
+        orden = np.lexsort((ids, codigos))
+        codigos, ids = codigos[orden], ids[orden]
+        # Una inspección cuenta una vez por código aunque lo repita
+        unicos = np.ones(len(ids), dtype=bool)
+        unicos[1:] = (codigos[1:] != codigos[:-1]) | (ids[1:] != ids[:-1])
+        codigos, self.ids = codigos[unicos], ids[unicos]
+        self.codigos, inicios = np.unique(codigos, return_index=True)
+        self.inicios = np.append(inicios, len(self.ids))
+
+    # Método para obtener los ids de las inspecciones con un código
+    def inspecciones(self, codigo):
+        posicion = np.searchsorted(self.codigos, codigo)
+        if posicion == len(self.codigos) or self.codigos[posicion] != codigo:
+            return self.ids[0:0]
+        return self.ids[self.inicios[posicion]:self.inicios[posicion + 1]]
+
+    # Método para contar las inspecciones de cada código
+    def conteos(self):
+        return pd.Series(np.diff(self.inicios), index=pd.Index(self.codigos, name="violation_code"), name="inspecciones")
+
+    # Método para obtener los `n` códigos con más inspecciones
+    def top(self, n=10):
+        return self.conteos().sort_values(ascending=False, kind="stable").head(n)
+
+    # Método para construir la matriz binaria inspección x código para los ids dados, en su orden
+    def matriz(self, ids):
+        filas = pd.Index(np.asarray(ids, dtype="int64")).get_indexer(self.ids)
+        columnas = np.repeat(np.arange(len(self.codigos)), np.diff(self.inicios))
+        presentes = filas >= 0
+        return sparse.csr_matrix(
+            (np.ones(int(presentes.sum()), dtype="float32"), (filas[presentes], columnas[presentes])),
+            shape=(len(ids), len(self.codigos)))
+
+
+# Función para escribir las violaciones de una partición y devolver su clave
+def escribir_violaciones(s3, bucket, prefijo, particion, violaciones):
+    anio, mes = map(int, particion.split("-"))
+    clave = almacenamiento.clave_particion(f"{prefijo}/violaciones", anio, mes, "violaciones")
+    s3.put_object(Bucket=bucket, Key=clave, Body=almacenamiento.a_parquet(violaciones))
+    return clave
+
+
+# Función para actualizar las violaciones a partir de las particiones reescritas en una compactación.
+# `reescritas` asocia cada partición afectada con sus violaciones nuevas (None si quedó vacía).
+def actualizar_violaciones(s3, bucket, puntero_anterior, particiones, reescritas, prefijo):
+    claves = dict(((puntero_anterior or {}).get("violaciones") or {}).get("particiones") or {})
+    for particion, violaciones in reescritas.items():
+        claves.pop(particion, None)
+        if violaciones is not None:
+            claves[particion] = escribir_violaciones(s3, bucket, prefijo, particion, violaciones)
+
+    # Versiones anteriores a las violaciones: se calculan una vez las particiones heredadas
+    faltantes = [p for p in particiones if p not in claves and p not in reescritas]
+    if faltantes:
+        logging.info(f"Desglosando violaciones de {len(faltantes)} particiones sin violaciones previas.")
+    for particion in faltantes:
+        df = almacenamiento.leer_objeto(s3, bucket, particiones[particion], columnas=columnas_violaciones)
+        claves[particion] = escribir_violaciones(s3, bucket, prefijo, particion, desglosar(df))
+
+    return {"particiones": {p: claves[p] for p in sorted(claves) if p in particiones}}
+
+
+# Función para seleccionar las claves de violaciones de un rango de particiones "YYYY-MM"
+def claves_violaciones(puntero, desde=None, hasta=None):
+    claves = ((puntero or {}).get("violaciones") or {}).get("particiones") or {}
+    return [clave for particion, clave in claves.items()
+            if (desde is None or particion >= desde) and (hasta is None or particion <= hasta)]
+
+
+# Función para leer la tabla de violaciones de la versión vigente, opcionalmente de algunos códigos
+def leer_violaciones(s3, bucket, puntero, codigos=None, columnas=None, desde=None, hasta=None):
+    filtros = [("violation_code", "in", [int(c) for c in codigos])] if codigos is not None else None
+    marcos = [almacenamiento.leer_objeto(s3, bucket, clave, columnas, filtros)
+              for clave in claves_violaciones(puntero, desde, hasta)]
+    if not marcos:
+        return pd.DataFrame({"inspection_id": pd.Series(dtype="int64"), "violation_code": pd.Series(dtype="int16"),
+                             "comment": pd.Series(dtype="string")})
+    return pd.concat(marcos, ignore_index=True)
+
+
+# Función para cargar el índice invertido de la versión vigente; solo lee los ids y los códigos
+def cargar_indice_violaciones(s3, bucket, puntero, desde=None, hasta=None):
+    return IndiceViolaciones(leer_violaciones(s3, bucket, puntero, columnas=["inspection_id", "violation_code"],
+                                              desde=desde, hasta=hasta))
@@ -0,0 +1,297 @@
+import os
+import json
+import logging
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import almacenamiento
+
+# Subsistema espacial: zonas (códigos postales) y recuperación de coordenadas.
+#
+# Las zonas son los polígonos de ZIP del mapa del dashboard (TopoJSON). Se indexan una vez en una
+# rejilla regular sobre su extensión: cada celda guarda la zona que la contiene entera o, si la
+# cruza algún borde, las zonas candidatas. Asignar la zona de millones de puntos es una búsqueda de
+# celda vectorizada y, solo para los puntos de celdas de borde, una prueba punto en polígono (regla
+# par-impar) vectorizada sobre las aristas de cada candidata.
+#
+# Las coordenadas que faltan se recuperan de una tabla dirección -> coordenadas construida con las
+# filas que sí las tienen. Guarda sumas y conteos, así que cada ejecución la amplía sin releer nada:
+#   datos_limpios/direcciones.parquet
+
+_directorio = os.path.dirname(os.path.abspath(__file__))
+# En la imagen la topología va junto a los scripts; en el repositorio se usa la del dashboard
+rutas_topologia = [ruta for ruta in (
+    os.getenv("ZONAS_TOPOJSON"),
+    os.path.join(_directorio, "chicago.json"),
+    os.path.join(_directorio, "..", "webapp", "public", "utils", "chicago.json"),
+) if ruta]
+objeto_zonas = os.getenv("ZONAS_OBJETO", "zipcodes")
+propiedad_zona = os.getenv("ZONAS_PROPIEDAD", "ZIP")
+celdas_indice = int(os.getenv("ZONAS_CELDAS", "256"))
+
+direcciones_file_name = "datos_limpios/direcciones.parquet"
+columna_zona = "location_zip"
+
+# Elementos punto x arista que se evalúan a la vez en la prueba punto en polígono
+_tam_lote_prueba = 4_000_000
+
+
+# Función para decodificar los arcos de una topología; con `transform` están cuantizados y en deltas
+def decodificar_arcos(topologia):
+    transformacion = topologia.get("transform")
+    arcos = []
+    for arco in topologia["arcs"]:
+        puntos = np.asarray(arco, dtype="float64")
+        if transformacion:
+            puntos = np.cumsum(puntos, axis=0) * transformacion["scale"] + transformacion["translate"]
+        arcos.append(puntos)
+    return arcos
+
+
+# Función para unir los arcos de un anillo; un índice negativo ~i recorre el arco i al revés
+def unir_anillo(arcos, indices):
+    partes = [arcos[i] if i >= 0 else arcos[~i][::-1] for i in indices]
+    # Arcos consecutivos comparten el punto de unión
+    return np.concatenate([partes[0]] + [parte[1:] for parte in partes[1:]])
+
+
+# Función para leer las zonas de un objeto de una topología: [(código, [anillo, ...])]. Los anillos
+# exteriores, los huecos y las partes de un MultiPolygon se tratan igual con la regla par-impar
+def leer_topologia(ruta, objeto=None, propiedad=None):
+    with open(ruta) as archivo:
+        topologia = json.load(archivo)
+    arcos = decodificar_arcos(topologia)
+    zonas = []
+    for geometria in topologia["objects"][objeto or objeto_zonas]["geometries"]:
+        poligonos = {"Polygon": [geometria.get("arcs", [])], "MultiPolygon": geometria.get("arcs", [])}.get(geometria["type"])
+        if not poligonos:
+            continue
+        anillos = [unir_anillo(arcos, anillo) for poligono in poligonos for anillo in poligono]
+        zonas.append((str(geometria["properties"][propiedad or propiedad_zona]), anillos))
+    return zonas
+
+
+# Función para obtener las aristas (x1, y1, x2, y2) de una lista de anillos
+def aristas_anillos(anillos):
+    return np.concatenate([np.hstack([anillo[:-1], anillo[1:]]) for anillo in anillos if len(anillo) > 1])
+
+
+# Función para probar qué puntos están dentro de un polígono dado por sus aristas (regla par-impar)
+def contiene(aristas, x, y):
+    x1, y1, x2, y2 = (aristas[:, i] for i in range(4))
+    dentro = np.zeros(len(x), dtype=bool)
+    lote = max(_tam_lote_prueba // max(len(aristas), 1), 1)
+    for inicio in range(0, len(x), lote):
+        px, py = x[inicio:inicio + lote, None], y[inicio:inicio + lote, None]
+        cruza = (y1 > py) != (y2 > py)
+        # Las aristas horizontales no cruzan nunca; su división por cero queda enmascarada
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corte = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        dentro[inicio:inicio + lote] = np.count_nonzero(cruza & (px < corte), axis=1) % 2 == 1
+    return dentro
+
+
+class IndiceZonas:
+    """
+    Índice en rejilla de un conjunto de polígonos para asignar la zona de muchos puntos a la vez.
+
+    Attributes:
+        codigos (np.ndarray): Código de cada zona; la zona i es codigos[i].
+        aristas (list): Aristas (x1, y1, x2, y2) de cada zona, en longitud y latitud.
+        extension (tuple): (lon_min, lat_min, lon_max, lat_max) de la rejilla.
+        celdas (int): Celdas por lado de la rejilla.
+        zona_celda (np.ndarray): Por celda, la zona que la contiene entera, -1 si ninguna y -2 si es de borde.
+        candidatas (np.ndarray): Por celda y zona, si hay que probar la zona en esa celda de borde.
+    """
+
+    def __init__(self, zonas, celdas=None):
+        self.codigos = np.array([codigo for codigo, _ in zonas], dtype=object)
+        self.aristas = [aristas_anillos(anillos) for _, anillos in zonas]
+        self.celdas = celdas or celdas_indice
+        todas = np.concatenate(self.aristas)
+        lon_min, lat_min = todas[:, [0, 2]].min(), todas[:, [1, 3]].min()
+        lon_max, lat_max = todas[:, [0, 2]].max(), todas[:, [1, 3]].max()
+        # Un margen para que los vértices del borde exterior no caigan fuera de la rejilla
+        margen = 1e-9 + 1e-6 * max(lon_max - lon_min, lat_max - lat_min)
+        self.extension = (lon_min - margen, lat_min - margen, lon_max + margen, lat_max + margen)
+        self._ancho = (self.extension[2] - self.extension[0]) / self.celdas
+        self._alto = (self.extension[3] - self.extension[1]) / self.celdas
+
+        n = self.celdas
+        borde = np.zeros((n, n, len(zonas)), dtype=bool)
+        for zona, aristas in enumerate(self.aristas):
+            ix, iy = self._celdas_aristas(aristas)
+            borde[iy, ix, zona] = True
+        # Se marcan también las celdas vecinas, para no perder las que una arista solo roza en una esquina
+        dilatado = borde.copy()
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                desplazado = np.roll(np.roll(borde, dy, axis=0), dx, axis=1)
+                if dy:
+                    desplazado[0 if dy > 0 else -1, :, :] = False
+                if dx:
+                    desplazado[:, 0 if dx > 0 else -1, :] = False
+                dilatado |= desplazado
+        borde = dilatado.reshape(n * n, len(zonas))
+
+        # Las celdas sin bordes están enteras dentro de una zona (o fuera de todas): basta su centro
+        centro_x = self.extension[0] + (np.arange(n * n) % n + 0.5) * self._ancho
+        centro_y = self.extension[1] + (np.arange(n * n) // n + 0.5) * self._alto
+        zona_centro = np.full(n * n, -1, dtype=np.int16)
+        for zona, aristas in enumerate(self.aristas):
+            en_caja = np.flatnonzero((zona_centro == -1)
+                                     & (centro_x >= aristas[:, [0, 2]].min()) & (centro_x <= aristas[:, [0, 2]].max())
+                                     & (centro_y >= aristas[:, [1, 3]].min()) & (centro_y <= aristas[:, [1, 3]].max()))
+            zona_centro[en_caja[contiene(aristas, centro_x[en_caja], centro_y[en_caja])]] = zona
+        es_borde = borde.any(axis=1)
+        self.zona_celda = np.where(es_borde, -2, zona_centro).astype(np.int16)
+        # En una celda de borde también puede tocar la zona que contiene su centro
+        con_centro = np.flatnonzero(es_borde & (zona_centro >= 0))
+        borde[con_centro, zona_centro[con_centro]] = True
+        self.candidatas = borde
+
+    # Método para obtener las celdas que recorre cada arista, muestreándola a menos de media celda
+    def _celdas_aristas(self, aristas):
+        x1, y1 = (aristas[:, 0] - self.extension[0]) / self._ancho, (aristas[:, 1] - self.extension[1]) / self._alto
+        x2, y2 = (aristas[:, 2] - self.extension[0]) / self._ancho, (aristas[:, 3] - self.extension[1]) / self._alto
+        muestras = np.ceil(2 * np.hypot(x2 - x1, y2 - y1)).astype(np.int64) + 1
+        arista = np.repeat(np.arange(len(aristas)), muestras)
+        fraccion = (np.arange(len(arista)) - np.repeat(np.cumsum(muestras) - muestras, muestras)) / \
+            np.repeat(np.maximum(muestras - 1, 1), muestras)
+        x = x1[arista] + fraccion * (x2 - x1)[arista]
+        y = y1[arista] + fraccion * (y2 - y1)[arista]
+        return (np.clip(x.astype(np.int64), 0, self.celdas - 1), np.clip(y.astype(np.int64), 0, self.celdas - 1))
+
+    # Método para asignar a cada punto el índice de su zona; -1 si no cae en ninguna o no tiene coordenadas
+    def asignar(self, latitud, longitud):
+        x = np.asarray(longitud, dtype="float64")
+        y = np.asarray(latitud, dtype="float64")
+        zona = np.full(len(x), -1, dtype=np.int16)
+        validos = np.isfinite(x) & np.isfinite(y) & (x >= self.extension[0]) & (x < self.extension[2]) \
+            & (y >= self.extension[1]) & (y < self.extension[3])
+        celda = np.zeros(len(x), dtype=np.int64)
+        celda[validos] = np.minimum(((y[validos] - self.extension[1]) / self._alto).astype(np.int64), self.celdas - 1) \
+            * self.celdas + np.minimum(((x[validos] - self.extension[0]) / self._ancho).astype(np.int64), self.celdas - 1)
+        zona[validos] = self.zona_celda[celda[validos]]
+
+        # Puntos en celdas de borde: prueba exacta contra cada zona candidata de su celda
+        pendientes = np.flatnonzero(zona == -2)
+        zona[pendientes] = -1
+        for indice, aristas in enumerate(self.aristas):
+            puntos = pendientes[self.candidatas[celda[pendientes], indice]]
+            puntos = puntos[zona[puntos] == -1]
+            if len(puntos):
+                zona[puntos[contiene(aristas, x[puntos], y[puntos])]] = indice
+        return zona
+
+    # Método para obtener el código de zona de cada punto como categórica (nulo si no cae en ninguna)
+    def zonas(self, latitud, longitud):
+        return pd.Categorical.from_codes(self.asignar(latitud, longitud), categories=self.codigos)
+
+
+# Función para cargar el índice de zonas una vez por proceso; None si no se encuentra la topología
+@lru_cache(maxsize=1)
+def cargar_indice_zonas():
+    for ruta in rutas_topologia:
+        if os.path.exists(ruta):
+            indice = IndiceZonas(leer_topologia(ruta))
+            logging.info(f"Índice de zonas construido desde {ruta}: {len(indice.codigos)} zonas.")
+            return indice
+    logging.warning(f"No se encontró la topología de zonas en {rutas_topologia}; no se asignarán zonas.")
+    return None
+
+
+# Función para asignar a cada fila la zona (ZIP) en la que caen sus coordenadas
+def asignar_zonas(df, indice):
+    if indice is None:
+        return df.assign(**{columna_zona: pd.Series(pd.NA, index=df.index, dtype="string")})
+    return df.assign(**{columna_zona: pd.Series(
+        indice.zonas(df["latitude"].to_numpy(dtype="float64", na_value=np.nan),
+                     df["longitude"].to_numpy(dtype="float64", na_value=np.nan)), index=df.index)})
+
+
+# Función para asignar la zona a las filas que aún no la tienen, p. ej. las limpiadas antes de existir las zonas
+def completar_zonas(df, indice):
+    if indice is None or (columna_zona in df.columns and df[columna_zona].notna().all()):
+        return df
+    if columna_zona not in df.columns:
+        return asignar_zonas(df, indice)
+    faltan = df[columna_zona].isna().to_numpy()
+    completas = df[columna_zona].astype("string")
+    completas[faltan] = pd.Series(indice.zonas(df["latitude"].to_numpy(dtype="float64", na_value=np.nan)[faltan],
+                                               df["longitude"].to_numpy(dtype="float64", na_value=np.nan)[faltan]),
+                                  dtype="string").to_numpy()
+    return df.assign(**{columna_zona: completas})
+
+
+# Función para contar las filas cuyo zip declarado no coincide con la zona de sus coordenadas
+def contar_zip_discordantes(df):
+    if "zip" not in df.columns or columna_zona not in df.columns:
+        return 0
+    declarado = df["zip"].astype("string").str[:5]
+    ubicado = df[columna_zona].astype("string")
+    return int((declarado.notna() & ubicado.notna() & (declarado != ubicado)).sum())
+
+
+# Función para normalizar direcciones (mayúsculas y espacios simples), una vez por valor distinto
+def normalizar_direcciones(serie):
+    codigos, valores = pd.factorize(serie.astype("string"))
+    normalizadas = pd.Series(valores, dtype="string").str.upper().str.strip().str.replace(r"\s+", " ", regex=True)
+    # El código -1 (nulo) toma el último elemento, que es el nulo añadido al final
+    return pd.Series(np.append(normalizadas.to_numpy(dtype=object, na_value=None), None)[codigos],
+                     index=serie.index, dtype="string")
+
+
+# Función para obtener una tabla de direcciones vacía
+def direcciones_vacias():
+    return pd.DataFrame({
+        "suma_latitud": pd.Series(dtype="float64"),
+        "suma_longitud": pd.Series(dtype="float64"),
+        "filas": pd.Series(dtype="int64"),
+    }, index=pd.Index([], dtype="string", name="direccion"))
+
+
+# Función para resumir por dirección las coordenadas de las filas que las tienen
+def resumir_direcciones(df):
+    if "address" not in df.columns:
+        return direcciones_vacias()
+    df = df.dropna(subset=["address", "latitude", "longitude"])
+    return pd.DataFrame({
+        "direccion": normalizar_direcciones(df["address"]).to_numpy(),
+        "suma_latitud": df["latitude"].to_numpy(dtype="float64"),
+        "suma_longitud": df["longitude"].to_numpy(dtype="float64"),
+        "filas": np.ones(len(df), dtype="int64"),
+    }).dropna(subset=["direccion"]).groupby("direccion").sum()
+
+
+# Función para cargar la tabla de direcciones acumulada; vacía si aún no existe
+def cargar_direcciones(s3, bucket):
+    try:
+        tabla = almacenamiento.leer_objeto(s3, bucket, direcciones_file_name)
+    except s3.exceptions.NoSuchKey:
+        return direcciones_vacias()
+    return tabla.set_index(tabla["direccion"].astype("string")).drop(columns="direccion")
+
+
+# Función para guardar la tabla de direcciones acumulada
+def guardar_direcciones(s3, bucket, direcciones):
+    tabla = direcciones.astype({"filas": "int64"}).rename_axis("direccion").reset_index()
+    s3.put_object(Bucket=bucket, Key=direcciones_file_name, Body=almacenamiento.a_parquet(tabla))
+    logging.info(f"Tabla de direcciones guardada: {len(tabla)} direcciones con coordenadas.")
+
+
+# Función para rellenar las coordenadas que faltan con las medias de su dirección; devuelve el
+# DataFrame y el número de filas recuperadas. Las coordenadas se rellenan siempre en pareja
+def recuperar_coordenadas(df, direcciones):
+    faltan = (df["latitude"].isna() | df["longitude"].isna()).to_numpy()
+    if not faltan.any() or direcciones.empty or "address" not in df.columns:
+        return df, 0
+    encontradas = direcciones.reindex(normalizar_direcciones(df.loc[faltan, "address"]))
+    recuperadas = encontradas["filas"].notna().to_numpy()
+    if not recuperadas.any():
+        return df, 0
+    filas = df.index[faltan][recuperadas]
+    df = df.copy()
+    df.loc[filas, "latitude"] = (encontradas["suma_latitud"] / encontradas["filas"]).to_numpy()[recuperadas]
+    df.loc[filas, "longitude"] = (encontradas["suma_longitud"] / encontradas["filas"]).to_numpy()[recuperadas]
+    return df, int(recuperadas.sum())
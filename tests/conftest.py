@@ -0,0 +1,46 @@
+import os
+import sys
+import uuid
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(RAIZ, "scripts"), os.path.join(RAIZ, "benchmarks")]
+
+
+# S3 local (moto) para toda la sesión; los scripts crean sus clientes al importarse, así que se
+# importan dentro de las pruebas, con el entorno ya apuntando al servidor local
+@pytest.fixture(scope="session")
+def s3_local():
+    from bench_limpieza import iniciar_s3_local
+    servidor = iniciar_s3_local()
+    yield
+    servidor.stop()
+
+
+# Bucket vacío y propio de cada prueba
+@pytest.fixture
+def bucket(s3_local):
+    import limpieza
+    nombre = f"pruebas-{uuid.uuid4().hex[:12]}"
+    limpieza.s3.create_bucket(Bucket=nombre)
+    return nombre
+
+
+# API de Socrata local con un conjunto sintético pequeño; cada prueba ajusta fallos y latencia
+@pytest.fixture
+def socrata():
+    import socrata_local
+    servidor, puerto = socrata_local.iniciar(12000)
+    servidor.url = f"http://127.0.0.1:{puerto}"
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+# Cliente de la ingesta apuntando a la API local, sin esperas entre reintentos
+@pytest.fixture
+def ingesta(s3_local, socrata, monkeypatch):
+    import ingesta
+    monkeypatch.setattr(ingesta, "socrata_domain", socrata.url)
+    monkeypatch.setattr(ingesta, "espera_base", 0.0)
+    return ingesta
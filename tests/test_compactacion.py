@@ -0,0 +1,102 @@
+import pandas as pd
+
+
+# Ingiere y limpia una página como un lote propio; cada llamada es una ejecución de limpieza posterior
+def limpiar_lote(bucket, ruta, pagina):
+    import almacenamiento
+    import limpieza
+    almacenamiento.escribir_objeto(limpieza.s3, bucket, f"{ruta}/parte-00000.parquet", pagina)
+    return limpieza.procesar_archivos(bucket, [ruta])
+
+
+def test_id_repetido_en_lotes_de_particiones_distintas(bucket):
+    import limpieza
+    import compactacion
+    from generador import GeneradorInspecciones
+
+    pagina = GeneradorInspecciones(4000).rango(0, 4000).dropna(subset=["latitude", "longitude"])
+    pagina = pagina[pagina["inspection_date"].str.startswith("2015-")]
+    primero, segundo = pagina.iloc[:50].copy(), pagina.iloc[50:100].copy()
+    repetido = primero["inspection_id"].iloc[0]
+    # El segundo lote (limpiado después) corrige la fecha del id repetido a otra partición
+    corregida = primero.iloc[:1].assign(inspection_date="2016-03-15T00:00:00.000", results="Fail")
+    segundo = pd.concat([segundo, corregida], ignore_index=True)
+
+    limpiar_lote(bucket, "ingesta/inicial", primero)
+    limpiar_lote(bucket, "ingesta/consecutiva", segundo)
+    puntero = compactacion.compactar(limpieza.s3, bucket)
+
+    actual = compactacion.leer_actual(limpieza.s3, bucket)
+    filas = actual[actual["inspection_id"] == int(repetido)]
+    assert len(filas) == 1
+    assert filas["inspection_date"].iloc[0] == pd.Timestamp("2016-03-15")
+    assert filas["results"].astype(str).iloc[0] == "Fail"
+    assert actual["inspection_id"].is_unique
+    assert len(actual) == puntero["filas"] == 100
+
+    indice = compactacion.cargar_indice(limpieza.s3, bucket, puntero)
+    assert indice.loc[indice["inspection_id"] == int(repetido), "particion"].tolist() == ["2016-03"]
+
+
+def test_id_que_cambia_de_particion_entre_compactaciones(bucket):
+    import limpieza
+    import compactacion
+    from generador import GeneradorInspecciones
+
+    pagina = GeneradorInspecciones(4000).rango(0, 4000).dropna(subset=["latitude", "longitude"])
+    primero = pagina[pagina["inspection_date"].str.startswith("2015-")].iloc[:30].copy()
+    limpiar_lote(bucket, "ingesta/inicial", primero)
+    compactacion.compactar(limpieza.s3, bucket)
+
+    movida = primero.iloc[:1].assign(inspection_date="2018-07-01T00:00:00.000")
+    limpiar_lote(bucket, "ingesta/consecutiva", movida)
+    compactacion.compactar(limpieza.s3, bucket)
+
+    actual = compactacion.leer_actual(limpieza.s3, bucket)
+    assert actual["inspection_id"].is_unique
+    assert len(actual) == 30
+    fila = actual[actual["inspection_id"] == int(movida["inspection_id"].iloc[0])]
+    assert fila["inspection_date"].tolist() == [pd.Timestamp("2018-07-01")]
+
+
+def test_compactacion_reparte_los_lotes_por_particion(bucket):
+    import almacenamiento
+    import limpieza
+    import compactacion
+    from generador import GeneradorInspecciones
+
+    pagina = GeneradorInspecciones(4000).rango(0, 4000)
+    filas = limpiar_lote(bucket, "ingesta/inicial", pagina.iloc[:2000]) + \
+        limpiar_lote(bucket, "ingesta/consecutiva", pagina.iloc[2000:])
+    puntero = compactacion.compactar(limpieza.s3, bucket)
+
+    assert len(puntero["particiones"]) > 12
+    for particion, clave in puntero["particiones"].items():
+        fechas = almacenamiento.leer_objeto(limpieza.s3, bucket, clave, columnas=["inspection_date"])["inspection_date"]
+        assert (fechas.dt.strftime("%Y-%m") == particion).all(), particion
+    assert len(compactacion.leer_actual(limpieza.s3, bucket)) == puntero["filas"] == filas
+
+
+def test_compactacion_de_lotes_vacios(bucket):
+    import almacenamiento
+    import limpieza
+    import compactacion
+    from generador import GeneradorInspecciones
+
+    # Un lote cuyo único objeto no tiene filas, como los limpiados antes de omitir los vacíos
+    vacio = almacenamiento.aplicar_esquema(GeneradorInspecciones(10).rango(0, 10).iloc[0:0], {})
+    clave = "datos_limpios/datos_limpios/datos_limpios_vacio.parquet"
+    almacenamiento.escribir_objeto(limpieza.s3, bucket, clave, vacio)
+    almacenamiento.escribir_json(limpieza.s3, bucket, compactacion.manifiesto_file_name, {
+        "archivos": {"vacio": {"fuente": None, "claves": [clave], "filas": 0, "esquema": None}}})
+
+    primero = compactacion.compactar(limpieza.s3, bucket)
+    assert primero["lotes"] == ["vacio"]
+    assert primero["filas"] == 0
+
+    # Dos publicaciones seguidas, en el mismo segundo, no comparten versión
+    almacenamiento.escribir_json(limpieza.s3, bucket, compactacion.manifiesto_file_name, {
+        "archivos": {"vacio": {"fuente": None, "claves": [clave], "filas": 0, "esquema": None},
+                     "otro": {"fuente": None, "claves": [clave], "filas": 0, "esquema": None}}})
+    segundo = compactacion.compactar(limpieza.s3, bucket)
+    assert segundo["version"] != primero["version"]
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+# Inspecciones sintéticas con los tipos del conjunto limpio, en orden de llegada (fecha e id)
+@pytest.fixture(scope="module")
+def inspecciones():
+    import almacenamiento
+    from generador import GeneradorInspecciones
+    df = almacenamiento.aplicar_tipos(GeneradorInspecciones(30000).rango(0, 30000))
+    return df.sort_values(["inspection_date", "inspection_id"], ignore_index=True)
+
+
+# Historial reconstruido desde cero con groupby + ewm sobre todas las inspecciones
+def reconstruir(df, alfa):
+    import caracteristicas
+    df = caracteristicas.filtrar_resultados(df).sort_values(["license_", "inspection_date", "inspection_id"])
+    df = df.assign(reprobada=(caracteristicas.transformar_resultados(df["results"]) == "fail").astype("float64"))
+    grupos = df.groupby("license_")
+    return pd.DataFrame({
+        "inspecciones": grupos.size(),
+        "reprobadas": grupos["reprobada"].sum().astype("int64"),
+        "tasa_reprobacion": grupos["reprobada"].apply(lambda serie: serie.ewm(alpha=alfa, adjust=False).mean().iloc[-1]),
+        "primera_fecha": grupos["inspection_date"].first(),
+        "ultima_fecha": grupos["inspection_date"].last(),
+        "ultimo_id": grupos["inspection_id"].last().astype("int64"),
+        "ultimo_resultado": grupos["results"].last().astype("string"),
+    })
+
+
+def test_plegado_incremental_igual_a_reconstruccion(inspecciones):
+    import historial
+
+    estado = historial.historial_vacio()
+    for lote in np.array_split(np.arange(len(inspecciones)), 20):
+        estado = historial.plegar(estado, inspecciones.iloc[lote], alfa=0.3)
+
+    esperado = reconstruir(inspecciones, 0.3)
+    estado = estado.sort_index()
+    assert estado.index.tolist() == esperado.index.astype(str).tolist()
+    for columna in ["inspecciones", "reprobadas", "primera_fecha", "ultima_fecha", "ultimo_id", "ultimo_resultado"]:
+        assert estado[columna].tolist() == esperado[columna].tolist(), columna
+    np.testing.assert_allclose(estado["tasa_reprobacion"], esperado["tasa_reprobacion"], rtol=1e-9)
+
+
+def test_plegar_un_lote_ya_plegado_no_cambia_el_estado(inspecciones):
+    import historial
+
+    lote = inspecciones.iloc[:5000]
+    estado = historial.plegar(historial.historial_vacio(), lote)
+
+    pd.testing.assert_frame_equal(historial.plegar(estado, lote).sort_index(), estado.sort_index())
+
+
+def test_compactacion_reconstruye_licencias_corregidas_y_tardias(bucket):
+    import almacenamiento
+    import limpieza
+    import compactacion
+    import historial
+    from generador import GeneradorInspecciones
+
+    pagina = almacenamiento.aplicar_tipos(GeneradorInspecciones(6000).rango(0, 6000).dropna(
+        subset=["latitude", "longitude"]))
+    pagina = pagina[pagina["results"].isin(["Pass", "Fail"]) & (pagina["inspection_date"].dt.year == 2015)]
+    pagina = pagina.sort_values(["inspection_date", "inspection_id"])
+    repetidas = pagina[pagina["license_"].duplicated(keep=False)]
+    primera, segunda, tercera = repetidas["license_"].drop_duplicates().iloc[:3]
+    for ruta, lote in [("ingesta/inicial", pagina.iloc[:-1]), ("ingesta/consecutiva", None)]:
+        if lote is None:
+            # Corrige el resultado de la última inspección de una licencia, mueve una inspección a otra
+            # licencia y entrega tarde (id nuevo, fecha antigua) una inspección de una tercera
+            ultima = pagina[pagina["license_"] == primera].iloc[[-1]]
+            corregida = ultima.assign(results=ultima["results"].map({"Pass": "Fail", "Fail": "Pass"}))
+            movida = pagina[pagina["license_"] == segunda].iloc[[0]].assign(license_=tercera)
+            tardia = pagina[pagina["license_"] == tercera].iloc[[0]].assign(
+                inspection_id=pagina["inspection_id"].max() + 1, results="Fail")
+            lote = pd.concat([corregida, movida, tardia, pagina.iloc[[-1]]])
+        almacenamiento.escribir_objeto(limpieza.s3, bucket, f"{ruta}/parte-00000.parquet", lote)
+        limpieza.procesar_archivos(bucket, [ruta])
+        puntero = compactacion.compactar(limpieza.s3, bucket)
+
+    estado = historial.cargar_historial(limpieza.s3, bucket, puntero).sort_index()
+    esperado = reconstruir(compactacion.leer_actual(limpieza.s3, bucket, historial.columnas_historial).assign(
+        license_=lambda df: df["license_"].astype("string")), historial.alfa_reprobacion)
+    assert estado.index.tolist() == esperado.index.astype(str).tolist()
+    for columna in ["inspecciones", "reprobadas", "ultima_fecha", "ultimo_id", "ultimo_resultado"]:
+        assert estado[columna].tolist() == esperado[columna].tolist(), columna
+    np.testing.assert_allclose(estado["tasa_reprobacion"], esperado["tasa_reprobacion"], rtol=1e-9)
@@ -0,0 +1,150 @@
+import os
+import sys
+import types
+import subprocess
+import numpy as np
+import pandas as pd
+import pytest
+
+
+# Concatena las páginas extraídas en un DataFrame con inspection_id numérico
+def concatenar_paginas(paginas):
+    df = pd.concat(list(paginas), ignore_index=True)
+    return df.assign(inspection_id=pd.to_numeric(df["inspection_id"]))
+
+
+def test_extraer_paginas_concurrentes_en_orden(ingesta, socrata):
+    socrata.socrata.latencia_ms = 30
+    client = ingesta.get_client()
+
+    df = concatenar_paginas(ingesta.extraer_paginas(client, "inspection_date < '2023-01-01T00:00:00'",
+                                                    page_size=1000, workers=4))
+
+    # Todas las filas, una vez y en el orden de las páginas, con varias páginas en vuelo a la vez
+    assert df["inspection_id"].tolist() == list(range(1, 12001))
+    assert socrata.socrata.max_en_curso > 1
+    offsets = sorted(int(p["$offset"]) for p in socrata.socrata.peticiones if "$offset" in p)
+    assert offsets[:12] == list(range(0, 12000, 1000))
+
+
+def test_extraer_paginas_respeta_el_filtro(ingesta, socrata):
+    client = ingesta.get_client()
+    query = "inspection_date < '2014-01-01T00:00:00'"
+
+    df = concatenar_paginas(ingesta.extraer_paginas(client, query, page_size=700, workers=3))
+
+    claves = socrata.socrata.generador.claves()
+    esperados = claves.loc[claves["inspection_date"] < "2014-01-01", "inspection_id"]
+    assert 0 < len(df) < 12000
+    assert df["inspection_id"].tolist() == esperados.tolist()
+
+
+def test_obtener_pagina_reintenta_con_espera_exponencial(ingesta, socrata, monkeypatch):
+    esperas = []
+    monkeypatch.setattr(ingesta, "time", types.SimpleNamespace(sleep=esperas.append))
+    monkeypatch.setattr(ingesta, "espera_base", 0.5)
+    socrata.socrata.fallos = 2
+
+    registros = ingesta.obtener_pagina(ingesta.get_client(), None, 0, 100)
+
+    assert [r["inspection_id"] for r in registros] == [str(i) for i in range(1, 101)]
+    assert esperas == [0.5, 1.0]
+    assert len(socrata.socrata.peticiones) == 3
+
+
+def test_obtener_pagina_desiste_tras_el_limite_de_reintentos(ingesta, socrata, monkeypatch):
+    esperas = []
+    monkeypatch.setattr(ingesta, "time", types.SimpleNamespace(sleep=esperas.append))
+    monkeypatch.setattr(ingesta, "max_reintentos", 3)
+    socrata.socrata.fallos = 100
+
+    with pytest.raises(Exception):
+        ingesta.obtener_pagina(ingesta.get_client(), None, 0, 100)
+
+    assert len(socrata.socrata.peticiones) == 3
+    assert len(esperas) == 2
+
+
+def test_extraer_paginas_se_recupera_de_errores_transitorios(ingesta, socrata):
+    # El conteo y las primeras páginas fallan; la extracción sigue completa y en orden
+    socrata.socrata.fallos = 3
+
+    df = concatenar_paginas(ingesta.extraer_paginas(ingesta.get_client(), None, page_size=1000, workers=4))
+
+    assert np.array_equal(df["inspection_id"], np.arange(1, 12001))
+    # Conteo, 12 páginas, la página vacía que confirma el final (la última estaba completa) y 3 fallos
+    assert len(socrata.socrata.peticiones) == 1 + 12 + 1 + 3
+
+
+# Claves (inspection_date, inspection_id) de la API local, en el orden del keyset
+def claves_ordenadas(socrata):
+    return socrata.socrata.generador.claves().sort_values(["inspection_date", "inspection_id"], ignore_index=True)
+
+
+def test_ingesta_inicial_paginada_por_offset(ingesta, socrata):
+    df = concatenar_paginas(ingesta.ingesta_inicial(ingesta.get_client(), page_size=1500, workers=3))
+
+    assert df["inspection_id"].tolist() == list(range(1, 12001))
+    paginas = [p for p in socrata.socrata.peticiones if "$offset" in p]
+    assert {p["$where"] for p in paginas} == {"inspection_date < '2023-01-01T00:00:00'"}
+    assert sorted(int(p["$offset"]) for p in paginas) == list(range(0, 13500, 1500))
+
+
+def test_ingesta_consecutiva_por_keyset_sin_duplicados(ingesta, socrata):
+    claves = claves_ordenadas(socrata)
+    # Marca a mitad de una fecha con varias inspecciones, para que la frontera parta un empate
+    repetidas = claves[claves.duplicated("inspection_date", keep=False)]
+    fila = repetidas.iloc[len(repetidas) // 2]
+    fecha = fila["inspection_date"].strftime("%Y-%m-%dT%H:%M:%S.000")
+    marca = {"inspection_date": fecha, "inspection_id": int(fila["inspection_id"])}
+
+    paginas, marcas = [], []
+    for pagina, nueva in ingesta.ingesta_consecutiva(ingesta.get_client(), marca, page_size=400):
+        paginas.append(pagina)
+        marcas.append(nueva)
+    df = concatenar_paginas(paginas)
+
+    posteriores = (claves["inspection_date"] > fila["inspection_date"]) | (
+        (claves["inspection_date"] == fila["inspection_date"]) & (claves["inspection_id"] > fila["inspection_id"]))
+    assert df["inspection_id"].tolist() == claves.loc[posteriores, "inspection_id"].tolist()
+    assert df["inspection_id"].is_unique
+    # Cada página avanza la marca hasta su última fila; todas las consultas piden la primera página del keyset
+    assert marcas[-1] == {"inspection_date": df["inspection_date"].iloc[-1], "inspection_id": int(df["inspection_id"].iloc[-1])}
+    assert [(m["inspection_date"], m["inspection_id"]) for m in marcas] == sorted(
+        (m["inspection_date"], m["inspection_id"]) for m in marcas)
+    consultas = [p for p in socrata.socrata.peticiones if "$order" in p]
+    assert {(p["$order"], p["$offset"]) for p in consultas} == {("inspection_date, inspection_id", "0")}
+
+
+def test_reanudar_desde_estado_heredado(ingesta, socrata, bucket, monkeypatch):
+    import pickle
+    monkeypatch.setattr(ingesta, "s3_bucket", bucket)
+    claves = claves_ordenadas(socrata)
+    fecha = claves["inspection_date"].iloc[int(len(claves) * 0.9)]
+    # Los estados antiguos solo guardaban la fecha máxima como texto
+    ingesta.get_s3_resource().Object(bucket, ingesta.estado_file_name).put(
+        Body=pickle.dumps(fecha.strftime("%Y-%m-%dT%H:%M:%S.000")))
+
+    estado = ingesta.cargar_estado_ingesta()
+    assert estado["inspection_id"] is None
+    client = ingesta.get_client()
+    paginas = list(ingesta.ingesta_consecutiva(client, estado, page_size=300))
+    df = concatenar_paginas(pagina for pagina, _ in paginas)
+
+    # Se releen las filas de la misma fecha, sin duplicados ni huecos
+    esperados = claves.loc[claves["inspection_date"] >= fecha, "inspection_id"]
+    assert df["inspection_id"].tolist() == esperados.tolist()
+
+    # Con el estado nuevo guardado, la siguiente ejecución no trae nada
+    ingesta.guardar_estado_ingesta(paginas[-1][1], len(df), estado)
+    estado = ingesta.cargar_estado_ingesta()
+    assert estado["inspection_id"] == int(esperados.iloc[-1])
+    assert estado["filas_ingeridas"] == len(df)
+    assert list(ingesta.ingesta_consecutiva(client, estado, page_size=300)) == []
+
+
+def test_importar_los_scripts_no_configura_el_logging(s3_local):
+    # El logging lo configura el punto de entrada (__main__), no el módulo al importarse
+    codigo = "import logging, ingesta, limpieza, run_model_training; assert not logging.getLogger().handlers"
+    scripts = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+    subprocess.run([sys.executable, "-c", codigo], cwd=scripts, check=True)
@@ -0,0 +1,149 @@
+import pandas as pd
+import pytest
+
+
+# Guarda en la ingesta del bucket una página sintética con el esquema de Socrata
+@pytest.fixture
+def pagina(bucket):
+    import almacenamiento
+    import limpieza
+    from generador import GeneradorInspecciones
+    pagina = GeneradorInspecciones(12000).rango(0, 12000)
+    # zip nunca falta en el conjunto sintético; se vacía una parte para imputarla
+    pagina.loc[::50, "zip"] = None
+    almacenamiento.escribir_objeto(limpieza.s3, bucket, "ingesta/inicial/parte-00000.parquet", pagina)
+    return pagina
+
+
+# Lee las salidas limpias registradas en el manifiesto, indexadas por inspection_id
+def leer_limpio(bucket):
+    import almacenamiento
+    import limpieza
+    manifiesto = limpieza.cargar_manifiesto(bucket)
+    claves = [clave for entrada in manifiesto["archivos"].values() for clave in entrada["claves"]]
+    limpio = almacenamiento.concatenar([almacenamiento.leer_objeto(limpieza.s3, bucket, clave) for clave in claves])
+    return limpio.set_index("inspection_id")
+
+
+def test_imputacion_rellena_faltantes(bucket, pagina):
+    import almacenamiento
+    import limpieza
+
+    filas = limpieza.procesar_archivos(bucket, ["ingesta/inicial"])
+    limpio = leer_limpio(bucket)
+
+    assert filas == len(limpio) > 0
+    assert limpio[limpieza.columnas_imputar].notna().all().all()
+    # Cada faltante toma la moda de su columna entre todas las filas, tengan o no coordenadas
+    original = almacenamiento.aplicar_tipos(pagina)
+    for columna in ["zip", "risk", "facility_type"]:
+        faltantes = original.loc[original[columna].isna() & original["inspection_id"].isin(limpio.index), "inspection_id"]
+        assert len(faltantes) > 0
+        moda = original[columna].mode()[0]
+        assert (limpio.loc[faltantes, columna].astype(str) == moda).all()
+
+
+def test_limpieza_descarta_filas_sin_coordenadas_irrecuperables(bucket, pagina):
+    import almacenamiento
+    import limpieza
+
+    limpieza.procesar_archivos(bucket, ["ingesta/inicial"])
+    limpio = leer_limpio(bucket)
+
+    assert limpio[limpieza.columnas_coordenadas].notna().all().all()
+    original = almacenamiento.aplicar_tipos(pagina)
+    sin_coordenadas = original["latitude"].isna() | original["longitude"].isna()
+    # Solo sobreviven las filas sin coordenadas cuya dirección aparece con coordenadas en otra fila
+    direcciones = set(original.loc[~sin_coordenadas, "address"])
+    recuperables = original.loc[sin_coordenadas & original["address"].isin(direcciones), "inspection_id"]
+    assert set(limpio.index) == set(original.loc[~sin_coordenadas, "inspection_id"]) | set(recuperables)
+
+
+def test_reejecucion_no_vuelve_a_limpiar(bucket, pagina, monkeypatch):
+    import limpieza
+
+    assert limpieza.procesar_archivos(bucket, ["ingesta/inicial"]) > 0
+    manifiesto = limpieza.cargar_manifiesto(bucket)
+
+    descargas = []
+    descargar = limpieza.descargar_archivo_s3
+    monkeypatch.setattr(limpieza, "descargar_archivo_s3", lambda *args: descargas.append(args) or descargar(*args))
+    assert limpieza.procesar_archivos(bucket, ["ingesta/inicial"]) == 0
+
+    assert descargas == []
+    assert limpieza.cargar_manifiesto(bucket)["archivos"] == manifiesto["archivos"]
+
+
+def test_descarga_fallida_no_deja_temporales(bucket, tmp_path):
+    import almacenamiento
+    import limpieza
+
+    with pytest.raises(Exception):
+        almacenamiento.descargar_a_temporal(limpieza.s3, bucket, "ingesta/no-existe.parquet", directorio=tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_limpieza_fallida_borra_su_directorio_temporal(monkeypatch, tmp_path):
+    import tempfile
+    import limpieza
+    from generador import GeneradorInspecciones
+
+    # El primer bloque se escribe en el directorio temporal; el segundo falla a mitad de la limpieza
+    def bloques():
+        yield GeneradorInspecciones(2000).rango(0, 2000)
+        raise RuntimeError("bloque corrupto")
+
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(limpieza, "limpiar_bloque", lambda bloque, *args: bloque)
+    with pytest.raises(RuntimeError):
+        limpieza.limpiar_bloques(bloques(), {}, {}, {})
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_limpieza_escribe_un_objeto_por_archivo(bucket, pagina):
+    import almacenamiento
+    import limpieza
+
+    filas = limpieza.procesar_archivos(bucket, ["ingesta/inicial"])
+
+    # Un solo objeto por archivo de ingesta, aunque sus filas abarquen muchos meses
+    objetos = list(almacenamiento.listar_objetos(limpieza.s3, bucket, "datos_limpios/datos_limpios/"))
+    entradas = list(limpieza.cargar_manifiesto(bucket)["archivos"].values())
+    assert [entrada["claves"] for entrada in entradas] == [[objetos[0]["Key"]]]
+    assert len(objetos) == 1
+    assert len(leer_limpio(bucket)) == filas
+
+
+def test_direcciones_de_archivos_fallidos_no_se_guardan(bucket, pagina, monkeypatch):
+    import limpieza
+    import zonas
+
+    # La subida falla: el archivo queda fuera del manifiesto y sus direcciones fuera de la tabla
+    guardar = limpieza.guardar_datos_s3
+    def fallar(*args):
+        raise RuntimeError("subida fallida")
+    monkeypatch.setattr(limpieza, "guardar_datos_s3", fallar)
+    assert limpieza.procesar_archivos(bucket, ["ingesta/inicial"]) == 0
+    assert zonas.cargar_direcciones(limpieza.s3, bucket).empty
+
+    # Al reintentarlo, cada fila con dirección y coordenadas se cuenta una sola vez
+    monkeypatch.setattr(limpieza, "guardar_datos_s3", guardar)
+    assert limpieza.procesar_archivos(bucket, ["ingesta/inicial"]) > 0
+    con_direccion = pagina.dropna(subset=["address", "latitude", "longitude"])
+    assert zonas.cargar_direcciones(limpieza.s3, bucket)["filas"].sum() == len(con_direccion)
+
+
+def test_escritor_admite_vocabularios_que_crecen(tmp_path):
+    import almacenamiento
+
+    # El primer bloque cabe en códigos int8; el segundo pasa de 127 categorías e int16
+    vocabularios = {}
+    primero = almacenamiento.aplicar_esquema(pd.DataFrame({"city": ["CHICAGO"]}), vocabularios)
+    segundo = almacenamiento.aplicar_esquema(pd.DataFrame({"city": [f"C{i}" for i in range(200)]}), vocabularios)
+    escritor = almacenamiento.EscritorLote(str(tmp_path))
+    escritor.escribir(primero)
+    escritor.escribir(segundo)
+    ruta = escritor.cerrar()
+
+    leido = almacenamiento.leer_local(ruta)
+    assert leido["city"].astype(str).tolist() == ["CHICAGO"] + [f"C{i}" for i in range(200)]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+
+# Conjunto sintético con los tipos del conjunto limpio
+@pytest.fixture(scope="module")
+def datos():
+    import almacenamiento
+    from generador import GeneradorInspecciones
+    df = almacenamiento.aplicar_tipos(GeneradorInspecciones(20000).rango(0, 20000))
+    return df.dropna(subset=["latitude", "longitude"]).reset_index(drop=True)
+
+
+def test_matriz_dispersa_igual_a_la_del_notebook(datos):
+    import caracteristicas
+
+    matriz, etiqueta, codificador, preparados = caracteristicas.construir_caracteristicas(datos)
+    notebook = codificador.matriz_notebook(preparados)
+
+    # La matriz del notebook añade 'results' al final; el resto debe coincidir columna a columna
+    esperada = notebook.drop(columns="remainder__results").to_numpy(dtype=np.float64)
+    assert matriz.shape == esperada.shape
+    np.testing.assert_allclose(matriz.toarray(), esperada, rtol=1e-6)
+    assert np.array_equal(etiqueta, (notebook["remainder__results"] == "fail").to_numpy(dtype=np.int8))
+
+
+def test_codificador_ignora_categorias_desconocidas(datos):
+    import caracteristicas
+
+    _, _, codificador, preparados = caracteristicas.construir_caracteristicas(datos)
+    codificador = caracteristicas.CodificadorCaracteristicas.desde_dict(codificador.a_dict())
+    desconocidos = preparados.head(5).assign(risk="Riesgo inventado")
+    matriz, _ = codificador.transformar(desconocidos)
+
+    nombres = codificador.nombres()
+    columnas_riesgo = [i for i, nombre in enumerate(nombres) if nombre.startswith("risk__")]
+    assert matriz[:, columnas_riesgo].nnz == 0
+
+
+def test_modelo_publicado_puntua_igual(datos, bucket):
+    import limpieza
+    import modelo
+    import caracteristicas
+
+    matriz, etiqueta, codificador, _ = caracteristicas.construir_caracteristicas(datos)
+    entrenado = modelo.crear_modelo().fit(matriz, etiqueta)
+    modelo.guardar_modelo(limpieza.s3, bucket, entrenado, codificador)
+    artefacto = modelo.cargar_modelo(limpieza.s3, bucket)
+
+    # Por bloques y tras el viaje por S3 se obtienen las mismas probabilidades que en memoria
+    esperadas = entrenado.predict_proba(matriz)[:, 1].astype(np.float32)
+    np.testing.assert_allclose(modelo.puntuar_matriz(artefacto["modelo"], matriz, tam_bloque=3000), esperadas, rtol=1e-6)
+    puntuadas = modelo.puntuar_datos(datos, artefacto, tam_bloque=3000)
+    preparados = caracteristicas.preparar(datos)
+    assert puntuadas["inspection_id"].tolist() == datos.loc[preparados.index, "inspection_id"].tolist()
+    np.testing.assert_allclose(puntuadas["probabilidad_fallo"], esperadas, rtol=1e-6)
@@ -4,10 +4,19 @@ import * as d3 from 'd3';
 import * as topojson from 'topojson-client';
 import '../styles/ChicagoMap.css';
 
-const ChicagoMap = ({ topoData, inspectionLocations }) => {
+const WIDTH = 800;
+const HEIGHT = 600;
+
+const projection = d3.geoMercator()
+    .center([-87.6298, 41.8781]) // Centra en Chicago
+    .scale(50000) // Ajusta el nivel de zoom
+    .translate([WIDTH / 2, HEIGHT / 2]);
+
+const ChicagoMap = ({ topoData, inspectionLocations, onAnimationEnd }) => {
     const mapRef = useRef(null);
     const [currentDate, setCurrentDate] = useState(null); // Estado para mostrar la fecha dinámica
 
+    // Dibujar los ZIP codes una sola vez; los puntos van en su propia capa
     useEffect(() => {
         // Validación de datos de entrada
         if (!topoData || !topoData.objects || !topoData.objects.zipcodes) {
@@ -15,26 +24,12 @@ const ChicagoMap = ({ topoData, inspectionLocations }) => {
             return;
         }
 
-        if (!Array.isArray(inspectionLocations) || inspectionLocations.length === 0) {
-            console.error("inspectionLocations no es un array válido o está vacío.");
-            return;
-        }
-
-        // Configuración del mapa
-        const width = 800;
-        const height = 600;
-
         const svg = d3.select(mapRef.current)
-            .attr('width', width)
-            .attr('height', height);
+            .attr('width', WIDTH)
+            .attr('height', HEIGHT);
 
         svg.selectAll("*").remove(); // Limpia cualquier render anterior
 
-        const projection = d3.geoMercator()
-            .center([-87.6298, 41.8781]) // Centra en Chicago
-            .scale(50000) // Ajusta el nivel de zoom
-            .translate([width / 2, height / 2]);
-
         const path = d3.geoPath().projection(projection);
 
         // Convertir TopoJSON a GeoJSON
@@ -59,19 +54,37 @@ const ChicagoMap = ({ topoData, inspectionLocations }) => {
             .append('title') // Tooltip para mostrar el ZIP
             .text(d => `ZIP: ${d.properties.ZIP || 'Desconocido'}`);
 
+        svg.append('g').attr('class', 'inspection-points');
+    }, [topoData]);
+
+    // Animar los puntos de la ventana de fechas actual, reemplazando los de la anterior
+    useEffect(() => {
+        // null mientras la ventana se carga
+        if (!Array.isArray(inspectionLocations)) return;
+
+        const layer = d3.select(mapRef.current).select('g.inspection-points');
+        if (layer.empty()) return;
+        layer.selectAll("*").interrupt().remove();
+
+        // Una ventana sin inspecciones pasa directamente a la siguiente
+        if (inspectionLocations.length === 0) {
+            if (onAnimationEnd) onAnimationEnd();
+            return;
+        }
+
         // Ordenar inspecciones por fecha (cronológicamente)
         const sortedLocations = [...inspectionLocations].sort(
             (a, b) => new Date(a.inspection_date) - new Date(b.inspection_date)
         );
 
         // Dibujar puntos de inspección con animación
-        const points = svg.append('g')
+        const points = layer
             .selectAll('circle')
             .data(sortedLocations)
             .enter()
             .append('circle')
-            .attr('cx', width / 2) // Comienza desde el centro del mapa
-            .attr('cy', height / 2) // Comienza desde el centro del mapa
+            .attr('cx', WIDTH / 2) // Comienza desde el centro del mapa
+            .attr('cy', HEIGHT / 2) // Comienza desde el centro del mapa
             .attr('r', 5) // Tamaño inicial del punto
             .attr('fill', 'blue') // Color inicial del marcador
             .attr('opacity', 0); // Invisible al inicio
@@ -91,12 +104,14 @@ const ChicagoMap = ({ topoData, inspectionLocations }) => {
                 const monthYear = date.toLocaleString('default', { month: 'long', year: 'numeric' });
                 setCurrentDate(monthYear); // Actualiza el estado con el mes y año
             })
-            .on('end', function () {
+            .on('end', function (d, i) {
                 d3.select(this)
                     .append('title') // Agregar tooltip al final de la animación
                     .text(d => `Fecha: ${d.inspection_date}`);
+                // El último punto de la ventana pide la siguiente
+                if (i === sortedLocations.length - 1 && onAnimationEnd) onAnimationEnd();
             });
-    }, [topoData, inspectionLocations]);
+    }, [topoData, inspectionLocations, onAnimationEnd]);
 
     return (
         <div style={{ position: 'relative', width: '800px', height: '600px' }}>
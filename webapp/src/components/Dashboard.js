@@ -1,16 +1,31 @@
 // src/components/Dashboard.js
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import axios from 'axios';
 import * as d3 from 'd3';
 import '../styles/Dashboard.css';
 import ChicagoMap from './ChicagoMap';
 
+const MAP_WEEKS = 12; // Semanas de historial que recorre la animación del mapa
+const WINDOW_WEEKS = 4; // Semanas que se piden al backend en cada ventana
+
+// Fecha en formato YYYY-MM-DD, como la esperan start y end
+const isoDate = date => date.toISOString().slice(0, 10);
+
+const addDays = (date, days) => new Date(date.getTime() + days * 24 * 60 * 60 * 1000);
+
+// Lunes (UTC) de la semana de una fecha, para que las ventanas no partan las semanas del backend
+const mondayOf = date => {
+    const day = new Date(Date.UTC(date.getUTCFullYear(), date.getUTCMonth(), date.getUTCDate()));
+    return addDays(day, -((day.getUTCDay() + 6) % 7));
+};
+
 const Dashboard = () => {
     const [kpis, setKpis] = useState(null); // KPIs principales
     const [loading, setLoading] = useState(true); // Indicador de carga
     const [error, setError] = useState(null); // Manejo de errores
     const [topoData, setTopoData] = useState(null); // TopoJSON de Chicago
-    const [inspectionLocations, setInspectionLocations] = useState([]); // Ubicaciones de inspecciones
+    const [inspectionLocations, setInspectionLocations] = useState(null); // Ubicaciones de la ventana actual (null mientras se cargan)
+    const [mapWindow, setMapWindow] = useState(() => mondayOf(addDays(new Date(), -7 * MAP_WEEKS))); // Inicio de la ventana actual
 
     // Cargar KPIs y TopoJSON al inicio
     useEffect(() => {
@@ -23,9 +38,6 @@ const Dashboard = () => {
                 // Cargar el archivo TopoJSON desde utils/chicago.json
                 const topoResponse = await d3.json('/utils/chicago.json');
                 setTopoData(topoResponse);
-
-                // Cargar todas las ubicaciones de inspecciones
-                setInspectionLocations(response.data.inspection_locations || []);
             } catch (err) {
                 setError('Error al obtener los datos del servidor o el mapa.');
             } finally {
@@ -36,6 +48,39 @@ const Dashboard = () => {
         fetchData();
     }, []);
 
+    // Cargar los fotogramas semanales de la ventana actual: una ubicación por celda y semana
+    useEffect(() => {
+        if (mapWindow === null) return;
+        const fetchWindow = async () => {
+            setInspectionLocations(null);
+            try {
+                const end = addDays(mapWindow, 7 * WINDOW_WEEKS - 1);
+                const response = await axios.get('/api/map/frames/', {
+                    params: { period: 'week', start: isoDate(mapWindow), end: isoDate(end) },
+                });
+                setInspectionLocations(response.data.frames.flatMap(frame =>
+                    frame.latitude.map((latitude, i) => ({
+                        latitude,
+                        longitude: frame.longitude[i],
+                        inspection_date: frame.date,
+                    }))
+                ));
+            } catch (err) {
+                console.error('Error al obtener los fotogramas del mapa:', err);
+            }
+        };
+
+        fetchWindow();
+    }, [mapWindow]);
+
+    // Pasar a la ventana siguiente cuando termina la animación de la actual, hasta llegar a hoy
+    const handleAnimationEnd = useCallback(() => {
+        setMapWindow(current => {
+            const next = addDays(current, 7 * WINDOW_WEEKS);
+            return next <= new Date() ? next : null;
+        });
+    }, []);
+
     if (loading) return <div className="dashboard">Cargando datos...</div>;
     if (error) return <div className="dashboard error">{error}</div>;
 
@@ -80,7 +125,7 @@ const Dashboard = () => {
                 </div>
                 <div className="chart">
                     <h3>Mapa de Inspecciones en Chicago</h3>
-                    <ChicagoMap topoData={topoData} inspectionLocations={inspectionLocations} />
+                    <ChicagoMap topoData={topoData} inspectionLocations={inspectionLocations} onAnimationEnd={handleAnimationEnd} />
                 </div>
             </div>
         </div>